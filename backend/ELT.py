@@ -1,6 +1,8 @@
 # This file handles the ETL process for the data and main functions
 # It also handles raw data preprocessing and loading into the database
 
+import argparse
+import json
 import os
 import time
 import requests
@@ -10,16 +12,23 @@ import joblib
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from logging import basicConfig, getLogger
 from database.database import engine
+from database.locks import gold_write_lock, training_lock
 from catboost import CatBoostRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import r2_score, mean_squared_error
 from crud.schemas import InputData
-from preprocessing import pipeline_dataset, pipeline_single
+from crud.stats import refresh_price_stats_view
+from crud.changes import BRONZE_DELTA_QUERY, prune_bronze_changes
+from data.gold_writer import GOLD_TABLE, write_gold_table
+from data.pool_cache import gold_pool, pool_labels
+from tuning import training_params
+from preprocessing import pipeline_dataset, pipeline_incremental, FittedPreprocessor, FeatureVectorBuilder
 from typing import List, Dict
 from fastapi import HTTPException
 from logging_config import setup_logging
@@ -29,9 +38,136 @@ from logging_config import setup_logging
 
 logger = setup_logging()
 
-def preprocess_data()-> pd.DataFrame:
+# model and preprocessing state used by the predictions, set by load_model
+model = None
+preprocessor = None
+feature_builder = None
+
+# rows per chunk of the chunked preprocessing, peak memory grows with it
+PREPROCESS_CHUNK_SIZE = int(os.getenv("PREPROCESS_CHUNK_SIZE", "50000"))
+
+# gold rows the current model was trained on, read by the warm start retraining
+MODEL_INFO_FILE = 'model_info.json'
+# trees added to the current model by a warm start, and their learning rate, lower than a
+# full training one so that the few new rows refine the model instead of overriding it
+WARM_START_ITERATIONS = int(os.getenv("WARM_START_ITERATIONS", "20"))
+WARM_START_LEARNING_RATE = float(os.getenv("WARM_START_LEARNING_RATE", "0.05"))
+# new gold rows needed for a warm start, with fewer the model is kept as it is
+WARM_START_MIN_ROWS = int(os.getenv("WARM_START_MIN_ROWS", "100"))
+# rows already trained on added to the holdout of the warm start guardrail
+WARM_START_HOLDOUT_ROWS = int(os.getenv("WARM_START_HOLDOUT_ROWS", "10000"))
+# relative increase of the holdout RMSE accepted from a warm start
+WARM_START_RMSE_TOLERANCE = float(os.getenv("WARM_START_RMSE_TOLERANCE", "0.01"))
+# size of the model above which a full retrain replaces the warm starts
+WARM_START_MAX_TREES = int(os.getenv("WARM_START_MAX_TREES", "2000"))
+
+
+## builds the query reading the bronze table, optionally limited to a crawl date window
+def bronze_query(start: datetime = None, end: datetime = None)-> str:
+    """Returns the SELECT over bronze_car_data with the date window conditions, parameters %(start)s and %(end)s
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+
+    Returns:
+        query: SQL query
+    """
+    query = 'SELECT * FROM bronze_car_data'
+    conditions = []
+    if start is not None:
+        conditions.append('datecrawled >= %(start)s')
+    if end is not None:
+        conditions.append('datecrawled < %(end)s')
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+        logger.info(f"Reading vehicles crawled from {start} to {end}")
+    return query
+
+
+## reads the oldest transaction still running, every change before it is visible
+def current_snapshot_xmin(cursor)-> int:
+    """Returns the oldest transaction id still running, all the older ones are committed or aborted
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+
+    Returns:
+        snapshot_xmin: 64 bit transaction id
+    """
+    cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot());")
+    return cursor.fetchone()[0]
+
+
+## records how far bronze has been loaded into gold
+def save_watermark(cursor, snapshot_xmin: int, max_id: int, rows_upserted: int, rows_deleted: int, mode: str):
+    """Saves the watermark of the gold table, the caller commits
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        snapshot_xmin (int): Snapshot xmin taken before bronze was read
+        max_id (int): Largest bronze id loaded so far
+        rows_upserted (int): Rows written into gold by the run
+        rows_deleted (int): Rows removed from gold by the run
+        mode (str): "full" or "incremental"
+    """
+    cursor.execute(
+        "INSERT INTO elt_watermark "
+        "(table_name, snapshot_xmin, max_id, rows_upserted, rows_deleted, mode, updated_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s, now()) "
+        "ON CONFLICT (table_name) DO UPDATE SET snapshot_xmin = EXCLUDED.snapshot_xmin, "
+        "max_id = GREATEST(elt_watermark.max_id, EXCLUDED.max_id), rows_upserted = EXCLUDED.rows_upserted, "
+        "rows_deleted = EXCLUDED.rows_deleted, mode = EXCLUDED.mode, updated_at = now();",
+        (GOLD_TABLE, snapshot_xmin, max_id, rows_upserted, rows_deleted, mode)
+    )
+    # the next incremental load only reads the changes from the watermark on
+    prune_bronze_changes(cursor, snapshot_xmin)
+
+## reads which gold table and rows a model is trained on
+def gold_snapshot()-> tuple[int, int]:
+    """Returns the file node of the gold table, which changes with every full load, and its largest id
+
+    Returns:
+        filenode, max_id: Identity of the gold table and largest id in it
+    """
+    with engine.connect() as conn:
+        return tuple(conn.exec_driver_sql(
+            f"SELECT pg_relation_filenode('{GOLD_TABLE}'), max(id) FROM {GOLD_TABLE}"
+        ).fetchone())
+
+
+## records the gold rows the saved model is trained on
+def save_model_info(model: CatBoostRegressor, filenode: int, max_id: int, rmse: float, mode: str):
+    """Saves next to model.pkl the gold table and rows it was trained on
+
+    Args:
+        model (CatBoostRegressor): Saved model
+        filenode (int): File node of the gold table it was trained on
+        max_id (int): Largest gold id it was trained on
+        rmse (float): Holdout RMSE of the model
+        mode (str): "full" or "warm_start"
+    """
+    with open(MODEL_INFO_FILE, "w") as file:
+        json.dump({
+            "gold_filenode": filenode,
+            "max_id": max_id,
+            "rmse": rmse,
+            "mode": mode,
+            "tree_count": model.tree_count_,
+            "trained_at": datetime.now().isoformat(),
+        }, file, indent=2)
+
+
+def preprocess_data(start: datetime = None, end: datetime = None)-> pd.DataFrame:
     """Preprocesses the raw data from bronze_car_data table using the pipeline_dataset
 
+    With a date window only the vehicles crawled in it are read, and on a
+    partitioned bronze table only the partitions of those months are scanned.
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+
     Raises:
         HTTPException: Raw data could not be preprocessed
 
@@ -40,9 +176,13 @@ def preprocess_data()-> pd.DataFrame:
     """
     try:
         logger.info("Preprocessing raw data")
-        query = 'SELECT * FROM bronze_car_data'
-        data_df = pd.read_sql(query,engine)
+        query = bronze_query(start, end)
+        with engine.connect() as conn:
+            snapshot_xmin = conn.exec_driver_sql("SELECT txid_snapshot_xmin(txid_current_snapshot())").scalar()
+        data_df = pd.read_sql(query,engine,params={"start": start, "end": end})
         processed_df = pipeline_dataset.fit_transform(data_df)
+        # changes from this snapshot on are left to the next incremental run
+        processed_df.attrs["snapshot_xmin"] = snapshot_xmin
         logger.info("Raw data preprocessed")
         return processed_df
     except Exception as e:
@@ -54,6 +194,10 @@ def preprocess_data()-> pd.DataFrame:
 def load_preprocessed_vehicle_dataset_into_database(df: pd.DataFrame)-> pd.DataFrame:
     """Loads the preprocessed data into the gold_car_data table in the database
 
+    The rows are copied into a staging table that replaces the gold table atomically,
+    with a unique index on id for the incremental upserts. The watermark is set to the
+    snapshot taken by preprocess_data in the same transaction.
+
     Args:
         df (pd.DataFrame): Preprocessed data to be loaded into the database
 
@@ -62,58 +206,328 @@ def load_preprocessed_vehicle_dataset_into_database(df: pd.DataFrame)-> pd.DataF
     """
     try:
         logger.info("Loading preprocessed data into gold_car_data table")
-        df.to_sql('gold_car_data', con=engine, if_exists='replace', index=False)
+        conn = engine.raw_connection()
+        try:
+            write_gold_table(conn, [df])
+            cursor = conn.cursor()
+            snapshot_xmin = df.attrs.get("snapshot_xmin")
+            if snapshot_xmin is None:
+                logger.warning("Preprocessed data has no snapshot, bronze changes made while it was loaded are skipped")
+                snapshot_xmin = current_snapshot_xmin(cursor)
+            save_watermark(cursor, snapshot_xmin, int(df["id"].max()), len(df), 0, "full")
+            conn.commit()
+        finally:
+            conn.close()
         logger.info("Preprocessed data loaded into gold_car_data table!")
-    except:
+    except Exception as e:
         logger.error("Preprocessed data could not be loaded, error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
         
 
+## preprocesses the raw data and loads it into gold chunk by chunk
+def preprocess_and_load_in_chunks(start: datetime = None, end: datetime = None,
+                                  chunksize: int = PREPROCESS_CHUNK_SIZE)-> int:
+    """Preprocesses the bronze table and loads it into gold_car_data without holding it in memory
+
+    Same result as preprocess_data followed by load_preprocessed_vehicle_dataset_into_database,
+    but bronze is streamed through a server side cursor: two passes fit the pipeline state
+    and a third one transforms each chunk and copies it into the staging table of gold.
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+        chunksize (int, optional): Rows per chunk. Defaults to PREPROCESS_CHUNK_SIZE.
+
+    Raises:
+        HTTPException: Raw data could not be preprocessed or loaded
+
+    Returns:
+        rows_loaded: Number of rows written into gold_car_data
+    """
+    try:
+        logger.info(f"Preprocessing raw data in chunks of {chunksize} rows")
+        query = bronze_query(start, end)
+
+        def read_chunks():
+            with engine.connect().execution_options(stream_results=True) as conn:
+                yield from pd.read_sql(query, conn, params={"start": start, "end": end}, chunksize=chunksize)
+
+        with engine.connect() as conn:
+            snapshot_xmin = conn.exec_driver_sql("SELECT txid_snapshot_xmin(txid_current_snapshot())").scalar()
+        transformer = pipeline_dataset.named_steps['custom_transformer'].fit_chunks(read_chunks)
+        logger.info("Pipeline fitted, transforming and loading the chunks")
+        conn = engine.raw_connection()
+        try:
+            rows_loaded = write_gold_table(conn, transformer.transform_chunks(read_chunks))
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT max(id) FROM {GOLD_TABLE};")
+            max_id = cursor.fetchone()[0]
+            save_watermark(cursor, snapshot_xmin, max_id, rows_loaded, 0, "full")
+            conn.commit()
+        finally:
+            conn.close()
+        logger.info(f"Raw data preprocessed and {rows_loaded} rows loaded into {GOLD_TABLE}")
+        return rows_loaded
+    except Exception as e:
+        logger.error(f"Raw data could not be preprocessed in chunks, error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+## runs the whole ELT from bronze to gold in one call
+def run_elt_pipeline(start: datetime = None, end: datetime = None,
+                     chunksize: int = PREPROCESS_CHUNK_SIZE)-> dict:
+    """Preprocesses the bronze table and loads it into gold_car_data in a single call
+
+    Nothing is kept in memory once the call returns. With a chunk size bronze is
+    streamed chunk by chunk (preprocess_and_load_in_chunks); without one it is read
+    and preprocessed at once, which reads bronze a single time but holds the dataset
+    in memory until it is loaded.
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+        chunksize (int, optional): Rows per chunk, None to preprocess in memory. Defaults to PREPROCESS_CHUNK_SIZE.
+
+    Raises:
+        HTTPException: Raw data could not be preprocessed or loaded
+
+    Returns:
+        summary: Number of rows loaded into gold_car_data, execution mode and duration in seconds
+    """
+    started = time.perf_counter()
+    if chunksize is None:
+        processed_df = preprocess_data(start=start, end=end)
+        rows_loaded = len(processed_df)
+        load_preprocessed_vehicle_dataset_into_database(processed_df)
+    else:
+        rows_loaded = preprocess_and_load_in_chunks(start=start, end=end, chunksize=chunksize)
+    return {
+        "rows_loaded": rows_loaded,
+        "mode": "in_memory" if chunksize is None else "chunked",
+        "seconds": time.perf_counter() - started
+    }
+
+
+## loads the bronze rows changed since the last run into gold
+def update_gold_incrementally()-> dict:
+    """Upserts into gold_car_data the bronze rows inserted or updated since the watermark
+
+    The ids of the changed rows are read from the indexed bronze change log by the
+    transaction that wrote them, the rows are looked up by id, transformed with the state
+    fitted by the last full preprocessing and upserted on id. Changed rows that are now outliers are removed from gold. Rows deleted from bronze are only removed by
+    the next full load. Gold and the watermark are committed together.
+
+    Raises:
+        HTTPException: Gold table could not be updated
+
+    Returns:
+        summary: Number of bronze rows read, gold rows upserted and deleted, and the new watermark
+    """
+    conn = None
+    try:
+        logger.info("Updating gold_car_data incrementally")
+        conn = engine.raw_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT snapshot_xmin FROM elt_watermark WHERE table_name = %s FOR UPDATE;", (GOLD_TABLE,))
+        entry = cursor.fetchone()
+        if entry is None:
+            raise ValueError(f"{GOLD_TABLE} has no watermark, preprocess and load the full dataset first")
+        snapshot_xmin = current_snapshot_xmin(cursor)
+        cursor.execute(BRONZE_DELTA_QUERY, {"txid": entry[0]})
+        delta_df = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+        logger.info(f"{len(delta_df)} bronze rows changed since the last run")
+        rows_upserted = rows_deleted = 0
+        max_id = int(delta_df["id"].max()) if len(delta_df) else 0
+        if len(delta_df):
+            processed_df = pipeline_incremental.fit_transform(delta_df.copy())
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{GOLD_TABLE}_id ON {GOLD_TABLE} (id);")
+            cursor.execute(f"SELECT * FROM {GOLD_TABLE} LIMIT 0;")
+            gold_columns = [column[0] for column in cursor.description]
+            processed_df = processed_df.reindex(columns=gold_columns, fill_value=0)
+            rows = processed_df.astype(object).where(processed_df.notna(), None).values.tolist()
+            columns = ", ".join(f'"{column}"' for column in gold_columns)
+            updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in gold_columns if column != "id")
+            execute_values(
+                cursor,
+                f"INSERT INTO {GOLD_TABLE} ({columns}) VALUES %s ON CONFLICT (id) DO UPDATE SET {updates}",
+                rows,
+                page_size=1000
+            )
+            rows_upserted = len(rows)
+            # changed rows that the outlier rules now filter out
+            dropped_ids = sorted(set(delta_df["id"].tolist()) - set(processed_df["id"].tolist()))
+            if dropped_ids:
+                cursor.execute(f"DELETE FROM {GOLD_TABLE} WHERE id = ANY(%s);", (dropped_ids,))
+                rows_deleted = cursor.rowcount
+        save_watermark(cursor, snapshot_xmin, max_id, rows_upserted, rows_deleted, "incremental")
+        conn.commit()
+        logger.info(f"{rows_upserted} rows upserted and {rows_deleted} rows deleted in {GOLD_TABLE}")
+        return {
+            "rows_read": len(delta_df),
+            "rows_upserted": rows_upserted,
+            "rows_deleted": rows_deleted,
+            "snapshot_xmin": snapshot_xmin
+        }
+    except Exception as e:
+        if conn is not None:
+            conn.rollback()
+        logger.error(f"Gold table could not be updated incrementally, error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 ## trains the model and creates a pkl file
 def train_model_and_create_file()-> pd.DataFrame:
     """Trains the model using the gold_car_data table and creates a model.pkl file
 
+    The parameters are those saved by the last tuning.tune_hyperparameters run, if any.
+    The gold table is read through the pool cache, so retraining on an unchanged
+    gold table only repeats the fit.
+
     Raises:
         HTTPException: Model could not be trained
     """
     try:
         logger.info("Training model and creating model.pkl file")
-        training_query = 'SELECT * FROM gold_car_data'
-        data = pd.read_sql(training_query,engine)
-        X = data.drop(columns=["price"])
-        y = data["price"]
-        X_train,  X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, random_state=42)
-        model = CatBoostRegressor(depth=7, iterations=50, l2_leaf_reg=0.1, learning_rate=0.5)
-        model.fit(X_train, y_train)
-        prediction = model.predict(X_test)
-        mse = np.sqrt(mean_squared_error(y_test, prediction))
+        # quantized gold snapshot, read from the database only when gold changed
+        pool, _, (filenode, max_id) = gold_pool(engine)
+        train_index, test_index = train_test_split(np.arange(pool.num_row()), test_size=0.25, random_state=42)
+        # parameters of the last hyperparameter search, or the defaults
+        model = CatBoostRegressor(**training_params())
+        model.fit(pool.slice(train_index))
+        test_pool = pool.slice(test_index)
+        prediction = model.predict(test_pool)
+        mse = np.sqrt(mean_squared_error(pool_labels(test_pool), prediction))
         print(f"model MSE: {mse}")
         feature_importance = model.get_feature_importance()
-        feature_names = X.columns
+        feature_names = pool.get_feature_names()
         importance_df = pd.DataFrame({
             "feature": feature_names,
             "importance": feature_importance
         }).sort_values(by="importance", ascending=False)
         joblib.dump(model, "model.pkl")
+        save_model_info(model, filenode, max_id, float(mse), "full")
         logger.info("Model trained and model.pkl file created!")
+        try:
+            refresh_price_stats_view()
+        except Exception as e:
+            logger.error(f"Price statistics could not be refreshed, error: {e}")
         return mse, importance_df
     except Exception as e:
         logger.error("Model could not be trained, error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
         
 
+## continues training the current model on the new gold rows
+def retrain_incrementally()-> dict:
+    """Adds trees to the model of model.pkl, trained on the gold rows added since it was trained
+
+    The previous and the continued model are compared on a holdout made of a quarter of
+    the new rows and of WARM_START_HOLDOUT_ROWS rows trained on before. When the holdout
+    RMSE increases by more than WARM_START_RMSE_TOLERANCE the model is fully retrained
+    instead, as it is when gold was fully reloaded since (the label encodings may have
+    changed), when there is no model info or when the model grew past WARM_START_MAX_TREES.
+    Otherwise the saved continuation is fitted on all the new rows, the holdout ones included.
+    Gold rows updated in place keep their id and are only learned by the next full retrain.
+
+    Raises:
+        HTTPException: Model could not be retrained
+
+    Returns:
+        summary: mode (warm_start, full or unchanged), new rows, holdout RMSEs and duration
+    """
+    started = time.perf_counter()
+    try:
+        logger.info("Retraining model incrementally")
+        filenode, max_id = gold_snapshot()
+        info = None
+        if os.path.exists(MODEL_INFO_FILE) and os.path.exists("model.pkl"):
+            with open(MODEL_INFO_FILE) as file:
+                info = json.load(file)
+        if info is None:
+            reason = "no trained model to start from"
+        elif info["gold_filenode"] != filenode:
+            reason = "gold was fully reloaded since the last training"
+        elif info["tree_count"] + WARM_START_ITERATIONS > WARM_START_MAX_TREES:
+            reason = f"the model reached {info['tree_count']} trees"
+        else:
+            reason = None
+            new_df = pd.read_sql(
+                f"SELECT * FROM {GOLD_TABLE} WHERE id > %(max_id)s ORDER BY id", engine, params={"max_id": info["max_id"]}
+            )
+            if len(new_df) < WARM_START_MIN_ROWS:
+                logger.info(f"{len(new_df)} new gold rows, model kept as it is")
+                return {"mode": "unchanged", "rows_new": len(new_df), "seconds": time.perf_counter() - started}
+            previous_model = joblib.load("model.pkl")
+            if list(new_df.columns.drop("price")) != list(previous_model.feature_names_):
+                reason = "the gold columns differ from the model features"
+
+        if reason is None:
+            fit_df, new_holdout_df = train_test_split(new_df, test_size=0.25, random_state=42)
+            # rows trained on before, to catch a model forgetting them
+            old_holdout_df = pd.read_sql(
+                f"SELECT * FROM {GOLD_TABLE} WHERE id <= %(max_id)s ORDER BY md5(id::text) LIMIT %(rows)s",
+                engine, params={"max_id": info["max_id"], "rows": WARM_START_HOLDOUT_ROWS}
+            )
+            holdout_df = pd.concat([new_holdout_df, old_holdout_df])
+            X_holdout = holdout_df.drop(columns=["price"])
+            params = training_params()
+            params["iterations"] = WARM_START_ITERATIONS
+            params["learning_rate"] = WARM_START_LEARNING_RATE
+            model = CatBoostRegressor(**params)
+            model.fit(fit_df.drop(columns=["price"]), fit_df["price"], init_model=previous_model)
+            previous_rmse = float(np.sqrt(mean_squared_error(holdout_df["price"], previous_model.predict(X_holdout))))
+            rmse = float(np.sqrt(mean_squared_error(holdout_df["price"], model.predict(X_holdout))))
+            logger.info(f"Holdout RMSE {previous_rmse:.2f} before and {rmse:.2f} after the warm start")
+            if rmse > previous_rmse * (1 + WARM_START_RMSE_TOLERANCE):
+                reason = f"the holdout RMSE increased from {previous_rmse:.2f} to {rmse:.2f}"
+
+        if reason is not None:
+            logger.info(f"Full retrain instead of a warm start: {reason}")
+            mse, _ = train_model_and_create_file()
+            return {"mode": "full", "reason": reason, "rmse": float(mse), "seconds": time.perf_counter() - started}
+
+        # the holdout only decided to continue, the continuation is refitted on all the new
+        # rows, as the next warm start starts after the largest id recorded here
+        model = CatBoostRegressor(**params)
+        model.fit(new_df.drop(columns=["price"]), new_df["price"], init_model=previous_model)
+        joblib.dump(model, "model.pkl")
+        save_model_info(model, filenode, int(new_df["id"].max()), rmse, "warm_start")
+        logger.info(f"Model retrained on {len(new_df)} new rows, {model.tree_count_} trees")
+        try:
+            refresh_price_stats_view()
+        except Exception as e:
+            logger.error(f"Price statistics could not be refreshed, error: {e}")
+        return {
+            "mode": "warm_start",
+            "rows_new": len(new_df),
+            "previous_rmse": previous_rmse,
+            "rmse": rmse,
+            "tree_count": model.tree_count_,
+            "seconds": time.perf_counter() - started
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Model could not be retrained incrementally, error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
 ## loads the model from the pkl file
 def load_model():
-    """Loads the model from the model.pkl file
+    """Loads the model from the model.pkl file, with the fitted preprocessing state used by the predictions
 
     Raises:
         HTTPException: Model could not be loaded
     """
     try:
         logger.info("Loading model from model.pkl file")
-        global model
+        global model, preprocessor, feature_builder
         model = joblib.load("model.pkl")
+        preprocessor = FittedPreprocessor.load()
+        feature_builder = FeatureVectorBuilder(preprocessor, model.feature_names_)
         logger.info("Model loaded from model.pkl file!")
     except Exception as e:
         logger.error("Model could not be loaded, error: {e}")
@@ -134,47 +548,51 @@ def predict_price(data:List[InputData])-> Dict[str, List]:
     Returns:
         Dict[str, List]: Prediction for the price of the vehicle
     """
-    if model is None:
+    if model is None or feature_builder is None:
         logger.error("Model is 'None', error: {e}")
         raise HTTPException(status_code=500, detail="Model not loaded")
-        
-    input_data = [[
-        d.datecrawled,
-        d.vehicletype,
-        d.gearbox,
-        d.power,
-        d.model,
-        d.mileage,
-        d.registrationmonth,
-        d.registrationyear,
-        d.fueltype,
-        d.brand,
-        d.notrepaired,
-        d.datecreated,
-        d.numberofpictures,
-        d.postalcode,
-        d.lastseen] for d in data]
-
-    columns = [
-        "datecrawled", "vehicletype", "gearbox", "power", "model", 
-        "mileage", "registrationmonth", "registrationyear", "fueltype", 
-        "brand", "notrepaired", "datecreated", "numberofpictures", 
-        "postalcode", "lastseen"
-    ]
+
     try:
         logger.info("Generating prediction for price")
-        df = pd.DataFrame(input_data, columns=columns)
-        processed_single_df = pipeline_single.fit_transform(df)
-        logger.info("Submitted data ran through preprocessing pipeline")
-        expected_feature_order = model.feature_names_
-        missing_columns = set(expected_feature_order) - set(processed_single_df.columns)
-        # Add missing columns and fill with 0
-        for col in missing_columns:
-            processed_single_df[col] = 0
-        processed_single_df = processed_single_df[expected_feature_order]
-        prediction = model.predict(processed_single_df)
+        # features in the order of the model, missing one-hot columns left at 0
+        features = feature_builder.transform(data)
+        logger.info("Submitted data ran through preprocessing")
+        prediction = model.predict(features)
         logger.info("Prediction has been generated!")
     except Exception as e:
         logger.error("Prediction could not be generated, error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
-    return {"Price prediction": prediction.tolist()}
\ No newline at end of file
+    return {"Price prediction": prediction.tolist()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess the bronze table and load it into the gold table")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="first crawl date included, ISO format")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="crawl dates from this one on are left out, ISO format")
+    parser.add_argument("--chunksize", type=int, default=PREPROCESS_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--in-memory", action="store_true", help="preprocess the whole window at once instead of in chunks")
+    parser.add_argument("--train", action="store_true", help="train the model on the new gold table afterwards")
+    parser.add_argument("--incremental", action="store_true",
+                        help="load only the bronze changes into gold, and with --train continue training the current model")
+    args = parser.parse_args()
+
+    # waits for the runs of the API workers and jobs writing gold or training at the same time
+    try:
+        if args.incremental:
+            with gold_write_lock():
+                summary = update_gold_incrementally()
+            print(f"{summary['rows_upserted']} rows upserted and {summary['rows_deleted']} deleted in {GOLD_TABLE}")
+            if args.train:
+                with training_lock():
+                    summary = retrain_incrementally()
+                print(f"model retrained ({summary['mode']}): {summary}")
+        else:
+            with gold_write_lock():
+                summary = run_elt_pipeline(args.start, args.end, None if args.in_memory else args.chunksize)
+            print(f"{summary['rows_loaded']} rows loaded into {GOLD_TABLE} in {summary['seconds']:.1f} s ({summary['mode']})")
+            if args.train:
+                with training_lock():
+                    mse, _ = train_model_and_create_file()
+                print(f"model trained, RMSE {mse:.2f}")
+    except HTTPException as e:
+        raise SystemExit(f"ELT failed: {e.detail}")
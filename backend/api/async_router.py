@@ -0,0 +1,211 @@
+# This file contains the async CRUD endpoints, included by main.py when DB_ASYNC is enabled
+# They replace the sync endpoints with the same path and method in api/router.py.
+# The vehicle id is matched as an integer, so the static /vehicles/... routes of
+# the sync router (bulk, export) are still reachable after these ones.
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.async_database import get_async_db
+from crud.schemas import (
+    VehicleResponse,
+    VehiclePage,
+    VehicleColumns,
+    VehicleColumnarPage,
+    VehicleUpdate,
+    VehicleCreate
+)
+from typing import List, Optional, Union
+from crud.async_controller import (
+    create_vehicle,
+    get_vehicle,
+    get_vehicles,
+    search_vehicles,
+    update_vehicle,
+    delete_vehicle
+)
+from api.router import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.serialization import ID_INDEX, LAYOUT_PATTERN, json_response, vehicle_collection, vehicle_records
+
+async_router = APIRouter()
+
+# CRUD operations for the vehicle table
+## Create a new vehicle
+@async_router.post("/vehicles/", response_model=VehicleResponse)
+async def create_vehicle_endpoint(vehicle: VehicleCreate, db: AsyncSession = Depends(get_async_db))-> dict:
+    """Creates a new vehicle
+
+    Args:
+        vehicle (VehicleCreate): The vehicle to be created
+        db (AsyncSession, optional): Async database connection session. Defaults to Depends(get_async_db).
+
+    Raises:
+        HTTPException: If the vehicle could not be created
+
+    Returns:
+        new_vehicle_data: A dictionary with key-value pairs with information for the created vehicle
+    """
+    db_vehicle = await create_vehicle(db, vehicle)
+    if db_vehicle is None:
+        raise HTTPException(status_code=500, detail="Vehicle could not be created")
+    return db_vehicle
+
+## Retrieve a page of vehicles
+@async_router.get("/vehicles/", response_model=Union[VehiclePage, VehicleColumnarPage])
+async def read_vehicles_endpoint(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    layout: str = Query("records", pattern=LAYOUT_PATTERN),
+    db: AsyncSession = Depends(get_async_db)
+)->Response:
+    """Retrieves a page of vehicles ordered by id
+
+    Args:
+        after_id (int, optional): Cursor, only vehicles with a greater id are returned. Defaults to 0.
+        limit (int, optional): Number of vehicles per page, at most MAX_PAGE_SIZE. Defaults to DEFAULT_PAGE_SIZE.
+        layout (str, optional): "records" for a list of objects, "columnar" for column names and value arrays. Defaults to "records".
+        db (AsyncSession, optional): Async database connection session. Defaults to Depends(get_async_db).
+
+    Raises:
+        HTTPException: If the vehicles could not be read
+
+    Returns:
+        vehicles_page: JSON response with the vehicles of the page and the cursor for the next page
+    """
+    # one extra row tells whether there is a next page
+    vehicles = await get_vehicles(db, after_id=after_id, limit=limit + 1)
+    if vehicles is None:
+        raise HTTPException(status_code=500, detail="Vehicles could not be read")
+    next_after_id = None
+    if len(vehicles) > limit:
+        vehicles = vehicles[:limit]
+        next_after_id = vehicles[-1][ID_INDEX]
+    return json_response({**vehicle_collection(vehicles, layout), "next_after_id": next_after_id})
+
+## Search vehicles
+@async_router.get("/vehicles/search", response_model=Union[List[VehicleResponse], VehicleColumns])
+async def search_vehicles_endpoint(
+    brand: Optional[str] = None,
+    model: Optional[str] = None,
+    vehicletype: Optional[str] = None,
+    fueltype: Optional[str] = None,
+    gearbox: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    min_registrationyear: Optional[int] = None,
+    max_registrationyear: Optional[int] = None,
+    min_mileage: Optional[int] = None,
+    max_mileage: Optional[int] = None,
+    sort_by: str = Query("id", pattern="^(id|price|registrationyear|mileage|power|datecrawled)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    layout: str = Query("records", pattern=LAYOUT_PATTERN),
+    db: AsyncSession = Depends(get_async_db)
+)->Response:
+    """Retrieves the vehicles matching the filters, filtered and sorted on the database
+
+    Args:
+        brand, model, vehicletype, fueltype, gearbox (str, optional): Exact match filters. Default to None.
+        min_price, max_price (int, optional): Price range. Default to None.
+        min_registrationyear, max_registrationyear (int, optional): Registration year range. Default to None.
+        min_mileage, max_mileage (int, optional): Mileage range. Default to None.
+        sort_by (str, optional): Column used for sorting. Defaults to "id".
+        order (str, optional): "asc" or "desc". Defaults to "asc".
+        limit (int, optional): Number of vehicles returned, at most MAX_PAGE_SIZE. Defaults to DEFAULT_PAGE_SIZE.
+        offset (int, optional): Number of matching vehicles skipped. Defaults to 0.
+        layout (str, optional): "records" for a list of objects, "columnar" for column names and value arrays. Defaults to "records".
+        db (AsyncSession, optional): Async database connection session. Defaults to Depends(get_async_db).
+
+    Raises:
+        HTTPException: If the search could not be run
+
+    Returns:
+        vehicles_data: JSON response with a list of the matching vehicles, or their columns and rows
+    """
+    vehicles = await search_vehicles(
+        db,
+        brand=brand,
+        model=model,
+        vehicletype=vehicletype,
+        fueltype=fueltype,
+        gearbox=gearbox,
+        min_price=min_price,
+        max_price=max_price,
+        min_registrationyear=min_registrationyear,
+        max_registrationyear=max_registrationyear,
+        min_mileage=min_mileage,
+        max_mileage=max_mileage,
+        sort_by=sort_by,
+        descending=order == "desc",
+        limit=limit,
+        offset=offset
+    )
+    if vehicles is None:
+        raise HTTPException(status_code=500, detail="Vehicles could not be searched")
+    if layout == "columnar":
+        return json_response(vehicle_collection(vehicles, layout))
+    return json_response(vehicle_records(vehicles))
+
+## Retrieve a specific vehicle
+@async_router.get("/vehicles/{vehicle_id:int}", response_model=VehicleResponse)
+async def read_vehicle_endpoint(vehicle_id: int, db: AsyncSession = Depends(get_async_db))->dict:
+    """Retrieves a specific vehicle
+
+    Args:
+        vehicle_id (int): The id of the vehicle to be retrieved
+        db (AsyncSession, optional): Async database connection session. Defaults to Depends(get_async_db).
+
+    Raises:
+        HTTPException: If the vehicle is not found
+
+    Returns:
+        vehicle_data: A dictionary with key-value pairs with information for the selected vehicle
+    """
+    db_vehicle = await get_vehicle(db, vehicle_id=vehicle_id)
+    if db_vehicle is None:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return db_vehicle
+
+## Update a vehicle
+@async_router.put("/vehicles/{vehicle_id:int}", response_model=VehicleResponse)
+async def update_vehicle_endpoint(
+    vehicle_id: int, vehicle: VehicleUpdate, db: AsyncSession = Depends(get_async_db)
+)->dict:
+    """Updates a vehicle
+
+    Args:
+        vehicle_id (int): The id of the vehicle to be updated
+        vehicle (VehicleUpdate): The new data for the vehicle according to the VehicleUpdate schema
+        db (AsyncSession, optional): Async database connection session. Defaults to Depends(get_async_db).
+
+    Raises:
+        HTTPException: If the vehicle is not found
+
+    Returns:
+        updated_vehicle_data: A dictionary with key-value pairs with information on the updated vehicle
+    """
+    db_vehicle = await update_vehicle(db, vehicle_id=vehicle_id, vehicle=vehicle)
+    if db_vehicle is None:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return db_vehicle
+
+## Delete a vehicle
+@async_router.delete("/vehicles/{vehicle_id:int}", response_model=VehicleResponse)
+async def delete_vehicle_endpoint(vehicle_id: int, db: AsyncSession = Depends(get_async_db))->dict:
+    """Deletes a vehicle
+
+    Args:
+        vehicle_id (int): The id of the vehicle to be deleted
+        db (AsyncSession, optional): Async database connection session. Defaults to Depends(get_async_db).
+
+    Raises:
+        HTTPException: If the vehicle is not found
+
+    Returns:
+        deleted_vehicle_data: A dictionary with key-value pairs with information on the deleted vehicle
+    """
+    db_vehicle = await delete_vehicle(db, vehicle_id=vehicle_id)
+    if db_vehicle is None:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return db_vehicle
@@ -1,26 +1,70 @@
+import json
 import joblib
 import pandas as pd
-from fastapi import APIRouter, Depends, HTTPException
+from contextlib import contextmanager
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from database.database import SessionLocal, get_db
-from crud.schemas import VehicleResponse, VehicleUpdate, VehicleCreate, InputData
-from typing import List, Any
+from database.database import SessionLocal, get_db, engine, DB_ASYNC
+from database.pool import pool_stats
+from database.locks import LockNotAvailable, gold_write_lock, training_lock
+from crud.schemas import (
+    VehicleResponse,
+    VehiclePage,
+    VehicleColumns,
+    VehicleColumnarPage,
+    VehicleUpdate,
+    VehicleCreate,
+    BulkCreateResponse,
+    VehicleBulkUpdate,
+    BulkUpdateResponse,
+    BulkDeleteRequest,
+    BulkDeleteResponse,
+    InputData,
+    JobRequest,
+    JobResponse
+)
+from typing import List, Optional, Union
+from crud.cache import vehicle_cache
+from crud.stats import PRICE_STATS_DIMENSIONS, get_price_stats, refresh_price_stats_view
+from crud.trigram import typeahead
+from api.serialization import ID_INDEX, LAYOUT_PATTERN, json_response, vehicle_collection, vehicle_records
 from crud.controller import (
     create_vehicle,
+    create_vehicles_bulk,
     get_vehicle,
     get_vehicles,
+    search_vehicles,
+    export_vehicles,
     update_vehicle,
-    delete_vehicle
+    update_vehicles_bulk,
+    delete_vehicle,
+    delete_vehicles_bulk
 )
 from ELT import (
     load_model,
     train_model_and_create_file,
-    preprocess_data,
-    load_preprocessed_vehicle_dataset_into_database,
+    preprocess_and_load_in_chunks,
+    run_elt_pipeline,
+    PREPROCESS_CHUNK_SIZE,
+    update_gold_incrementally,
     predict_price
 )
+from jobs import job_runner
 
 router = APIRouter()
+# CRUD endpoints with an async twin in api.async_router, included only when DB_ASYNC is off
+crud_router = APIRouter()
+
+# page size limits for the vehicle listing
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# rows per transaction for the bulk endpoints
+DEFAULT_BULK_BATCH_SIZE = 1000
+MAX_BULK_BATCH_SIZE = 10000
 
 # root endpoint
 @router.get("/")
@@ -34,7 +78,7 @@ def read_root()-> dict:
 
 # CRUD operations for the vehicle table
 ## Create a new vehicle
-@router.post("/vehicles/", response_model=VehicleResponse)
+@crud_router.post("/vehicles/", response_model=VehicleResponse)
 def create_vehicle_endpoint(vehicle: VehicleCreate, db: Session = Depends(get_db))-> dict:
     """Creates a new vehicle
 
@@ -48,22 +92,232 @@ def create_vehicle_endpoint(vehicle: VehicleCreate, db: Session = Depends(get_db
     return create_vehicle(db, vehicle)
 
 
-## Retrieve all vehicles
-@router.get("/vehicles/", response_model=List[VehicleResponse])
-def read_vehicles_endpoint(db: Session = Depends(get_db))->list[dict[str, Any]]:
-    """Retrieves all vehicles
+## Create many vehicles at once
+@router.post("/vehicles/bulk", response_model=BulkCreateResponse)
+async def create_vehicles_bulk_endpoint(
+    request: Request,
+    batch_size: int = Query(DEFAULT_BULK_BATCH_SIZE, ge=1, le=MAX_BULK_BATCH_SIZE),
+    db: Session = Depends(get_db)
+)->dict:
+    """Creates many vehicles in batched transactions
+
+    The body is either a JSON list of vehicles matching the VehicleCreate schema or,
+    with the 'application/x-ndjson' content type, one vehicle per line.
+
+    Args:
+        request (Request): Incoming request with the vehicles on the body
+        batch_size (int, optional): Number of rows per transaction. Defaults to DEFAULT_BULK_BATCH_SIZE.
+        db (Session, optional): Database connection session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the body is not a JSON list or NDJSON
+
+    Returns:
+        bulk_result: Created ids and per item errors, referenced by the position of the item in the body
+    """
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", ""):
+        vehicles = [line for line in body.splitlines() if line.strip()]
+    else:
+        try:
+            vehicles = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")
+        if not isinstance(vehicles, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")
+    return await run_in_threadpool(create_vehicles_bulk, db, vehicles, batch_size)
+
+## Update many vehicles at once
+@router.patch("/vehicles/bulk", response_model=BulkUpdateResponse)
+def update_vehicles_bulk_endpoint(
+    vehicles: List[VehicleBulkUpdate], db: Session = Depends(get_db)
+)->dict:
+    """Updates many vehicles with a single statement
 
     Args:
+        vehicles (List[VehicleBulkUpdate]): Ids and new data for the vehicles according to the VehicleBulkUpdate schema
         db (Session, optional): Database connection session. Defaults to Depends(get_db).
 
+    Raises:
+        HTTPException: If the vehicles could not be updated
+
     Returns:
-        vehicles_data: A list of dictionaries with key-value pairs with information for all vehicles
+        bulk_result: Updated ids and ids that were not found
     """
-    vehicles = get_vehicles(db, limit=None)
-    return vehicles
+    result = update_vehicles_bulk(db, vehicles)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Vehicles could not be updated")
+    return result
+
+## Delete many vehicles at once
+@router.delete("/vehicles/bulk", response_model=BulkDeleteResponse)
+def delete_vehicles_bulk_endpoint(request: BulkDeleteRequest, db: Session = Depends(get_db))->dict:
+    """Deletes many vehicles with a single statement
+
+    Args:
+        request (BulkDeleteRequest): The ids of the vehicles to be deleted
+        db (Session, optional): Database connection session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the vehicles could not be deleted
+
+    Returns:
+        bulk_result: Deleted ids and ids that were not found
+    """
+    result = delete_vehicles_bulk(db, request.ids)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Vehicles could not be deleted")
+    return result
+
+## Retrieve a page of vehicles
+@crud_router.get("/vehicles/", response_model=Union[VehiclePage, VehicleColumnarPage])
+def read_vehicles_endpoint(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    layout: str = Query("records", pattern=LAYOUT_PATTERN),
+    db: Session = Depends(get_db)
+)->Response:
+    """Retrieves a page of vehicles ordered by id
+
+    Args:
+        after_id (int, optional): Cursor, only vehicles with a greater id are returned. Defaults to 0.
+        limit (int, optional): Number of vehicles per page, at most MAX_PAGE_SIZE. Defaults to DEFAULT_PAGE_SIZE.
+        layout (str, optional): "records" for a list of objects, "columnar" for column names and value arrays. Defaults to "records".
+        db (Session, optional): Database connection session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the vehicles could not be read
+
+    Returns:
+        vehicles_page: JSON response with the vehicles of the page and the cursor for the next page
+    """
+    # one extra row tells whether there is a next page
+    vehicles = get_vehicles(db, after_id=after_id, limit=limit + 1)
+    if vehicles is None:
+        raise HTTPException(status_code=500, detail="Vehicles could not be read")
+    next_after_id = None
+    if len(vehicles) > limit:
+        vehicles = vehicles[:limit]
+        next_after_id = vehicles[-1][ID_INDEX]
+    return json_response({**vehicle_collection(vehicles, layout), "next_after_id": next_after_id})
+
+## Search vehicles
+@crud_router.get("/vehicles/search", response_model=Union[List[VehicleResponse], VehicleColumns])
+def search_vehicles_endpoint(
+    brand: Optional[str] = None,
+    model: Optional[str] = None,
+    vehicletype: Optional[str] = None,
+    fueltype: Optional[str] = None,
+    gearbox: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    min_registrationyear: Optional[int] = None,
+    max_registrationyear: Optional[int] = None,
+    min_mileage: Optional[int] = None,
+    max_mileage: Optional[int] = None,
+    sort_by: str = Query("id", pattern="^(id|price|registrationyear|mileage|power|datecrawled)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    layout: str = Query("records", pattern=LAYOUT_PATTERN),
+    db: Session = Depends(get_db)
+)->Response:
+    """Retrieves the vehicles matching the filters, filtered and sorted on the database
+
+    Args:
+        brand, model, vehicletype, fueltype, gearbox (str, optional): Exact match filters. Default to None.
+        min_price, max_price (int, optional): Price range. Default to None.
+        min_registrationyear, max_registrationyear (int, optional): Registration year range. Default to None.
+        min_mileage, max_mileage (int, optional): Mileage range. Default to None.
+        sort_by (str, optional): Column used for sorting. Defaults to "id".
+        order (str, optional): "asc" or "desc". Defaults to "asc".
+        limit (int, optional): Number of vehicles returned, at most MAX_PAGE_SIZE. Defaults to DEFAULT_PAGE_SIZE.
+        offset (int, optional): Number of matching vehicles skipped. Defaults to 0.
+        layout (str, optional): "records" for a list of objects, "columnar" for column names and value arrays. Defaults to "records".
+        db (Session, optional): Database connection session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the search could not be run
+
+    Returns:
+        vehicles_data: JSON response with a list of the matching vehicles, or their columns and rows
+    """
+    vehicles = search_vehicles(
+        db,
+        brand=brand,
+        model=model,
+        vehicletype=vehicletype,
+        fueltype=fueltype,
+        gearbox=gearbox,
+        min_price=min_price,
+        max_price=max_price,
+        min_registrationyear=min_registrationyear,
+        max_registrationyear=max_registrationyear,
+        min_mileage=min_mileage,
+        max_mileage=max_mileage,
+        sort_by=sort_by,
+        descending=order == "desc",
+        limit=limit,
+        offset=offset
+    )
+    if vehicles is None:
+        raise HTTPException(status_code=500, detail="Vehicles could not be searched")
+    if layout == "columnar":
+        return json_response(vehicle_collection(vehicles, layout))
+    return json_response(vehicle_records(vehicles))
+
+## Fuzzy typeahead on brand and model
+@router.get("/vehicles/typeahead")
+def typeahead_endpoint(
+    q: str = Query(..., min_length=1, max_length=100),
+    field: str = Query("model", pattern="^(brand|model)$"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+)->Response:
+    """Retrieves the brands or models closest to a typed text, ranked by trigram similarity
+
+    Args:
+        q (str): Text typed by the user
+        field (str, optional): "brand" or "model". Defaults to "model".
+        limit (int, optional): Maximum number of matches, at most 100. Defaults to 10.
+        db (Session, optional): Database connection session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the typeahead could not be run
+
+    Returns:
+        matches: JSON response with the matching values, their score and number of vehicles, best first
+    """
+    matches = typeahead(db, field, q, limit)
+    if matches is None:
+        raise HTTPException(status_code=500, detail="Typeahead could not be run")
+    return json_response(matches)
+
+## Export all vehicles
+@router.get("/vehicles/export")
+def export_vehicles_endpoint(
+    file_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+)->StreamingResponse:
+    """Streams every vehicle as NDJSON or CSV
+
+    Args:
+        file_format (str, optional): "ndjson" or "csv", passed as the 'format' query parameter. Defaults to "ndjson".
+
+    Returns:
+        vehicles_data: Streaming response with one vehicle per line
+    """
+    if file_format == "csv":
+        media_type = "text/csv"
+    else:
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        export_vehicles(file_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=vehicles.{file_format}"}
+    )
 
 ## Retrieve a specific vehicle
-@router.get("/vehicles/{vehicle_id}", response_model=VehicleResponse)
+@crud_router.get("/vehicles/{vehicle_id}", response_model=VehicleResponse)
 def read_vehicle_endpoint(vehicle_id: int, db: Session = Depends(get_db))->dict:
     """Retrieves a specific vehicle
 
@@ -83,7 +337,7 @@ def read_vehicle_endpoint(vehicle_id: int, db: Session = Depends(get_db))->dict:
     return db_vehicle
 
 ## Update a vehicle
-@router.put("/vehicles/{vehicle_id}", response_model=VehicleResponse)
+@crud_router.put("/vehicles/{vehicle_id}", response_model=VehicleResponse)
 def update_vehicle_endpoint(
     vehicle_id: int, vehicle: VehicleUpdate, db: Session = Depends(get_db)
 )->dict:
@@ -106,7 +360,7 @@ def update_vehicle_endpoint(
     return db_vehicle
 
 ## Delete a vehicle
-@router.delete("/vehicles/{vehicle_id}", response_model=VehicleResponse)
+@crud_router.delete("/vehicles/{vehicle_id}", response_model=VehicleResponse)
 def delete_vehicle_endpoint(vehicle_id: int, db: Session = Depends(get_db))->dict:
     """Deletes a vehicle
 
@@ -126,53 +380,287 @@ def delete_vehicle_endpoint(vehicle_id: int, db: Session = Depends(get_db))->dic
     return db_vehicle
 
 
+## Vehicle cache statistics
+@router.get("/cache/stats")
+def cache_stats_endpoint()->dict:
+    """Returns the counters of the single vehicle cache
+
+    Returns:
+        cache_stats: Hits, misses, evictions and size of the cache
+    """
+    return vehicle_cache.stats()
+
+
+## Database connection pool statistics
+@router.get("/db/pool")
+def db_pool_stats_endpoint()->dict:
+    """Returns the usage counters of the database connection pools of this worker
+
+    Returns:
+        pool_stats: Size, connections in use, overflow and checkout wait times of each engine pool
+    """
+    stats = {"sync": pool_stats(engine)}
+    if DB_ASYNC:
+        from database.async_database import async_engine
+
+        stats["async"] = pool_stats(async_engine.sync_engine)
+    return stats
+
+
+## Price statistics
+@router.get("/stats/prices")
+def price_stats_endpoint(
+    group_by: List[str] = Query([]),
+    brand: Optional[str] = None,
+    model: Optional[str] = None,
+    registrationyear: Optional[int] = None,
+    vehicletype: Optional[str] = None,
+    min_vehicles: int = Query(1, ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+)->Response:
+    """Retrieves pre-aggregated price statistics of the vehicles
+
+    Args:
+        group_by (List[str], optional): Dimensions to group by, any of brand, model, registrationyear
+            and vehicletype. Filtered dimensions are always grouped. Defaults to [].
+        brand, model, vehicletype (str, optional): Exact match filters. Default to None.
+        registrationyear (int, optional): Exact match filter. Defaults to None.
+        min_vehicles (int, optional): Groups with fewer vehicles are left out. Defaults to 1.
+        limit (int, optional): Maximum number of groups, largest first. Defaults to DEFAULT_PAGE_SIZE.
+        db (Session, optional): Database connection session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If a group_by dimension is invalid
+        HTTPException: If the statistics could not be read
+
+    Returns:
+        price_stats: JSON response with the count, average, median, quartiles, min and max price of each group
+    """
+    invalid = set(group_by) - set(PRICE_STATS_DIMENSIONS)
+    if invalid:
+        raise HTTPException(status_code=422, detail=f"Invalid group_by dimensions: {sorted(invalid)}")
+    stats = get_price_stats(
+        db,
+        group_by=group_by,
+        brand=brand,
+        model=model,
+        registrationyear=registrationyear,
+        vehicletype=vehicletype,
+        min_vehicles=min_vehicles,
+        limit=limit
+    )
+    if stats is None:
+        raise HTTPException(status_code=500, detail="Price statistics could not be read")
+    return json_response(stats)
+
+## Refresh the price statistics
+@router.post("/stats/refresh")
+def refresh_price_stats_endpoint()->dict:
+    """Recomputes the price statistics from the bronze table
+
+    Raises:
+        HTTPException: If the statistics could not be refreshed
+
+    Returns:
+        message: statistics refreshed success/fail
+    """
+    try:
+        if not refresh_price_stats_view():
+            raise HTTPException(status_code=404, detail="Price statistics view does not exist")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"Message": "Price statistics refreshed"}
+
 
 # ML endpoints
 
-# setting up a global variable to store the processed dataframe
-global_processed_dataframe = None
+@contextmanager
+def run_unless_locked(lock):
+    """Runs the request under a gold or training lock, answering 409 while another run holds it
+
+    Args:
+        lock: gold_write_lock or training_lock
+
+    Raises:
+        HTTPException: If another request, job or process holds the lock
+    """
+    try:
+        with lock(wait=False):
+            yield
+    except LockNotAvailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+## Preprocess the raw data and load it into the gold table
+@router.get("/run_elt_pipeline")
+def run_elt_pipeline_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunksize: Optional[int] = Query(PREPROCESS_CHUNK_SIZE, ge=1000),
+    in_memory: bool = False
+)->dict:
+    """Preprocesses the raw data from bronze table and loads it into the gold table in one request
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+        chunksize (int, optional): Rows read and transformed at a time. Defaults to PREPROCESS_CHUNK_SIZE.
+        in_memory (bool, optional): Preprocess the whole window at once instead of in chunks. Defaults to False.
+
+    Raises:
+        HTTPException: 409 while another request, job or process writes the gold table
+
+    Returns:
+        summary: message with the number of rows loaded, execution mode and duration
+    """
+    with run_unless_locked(gold_write_lock):
+        summary = run_elt_pipeline(start=start, end=end, chunksize=None if in_memory else chunksize)
+    return {'Message': 'Data preprocessed and loaded into database', **summary}
 
 ## Preprocess raw data
-@router.get("/preprocessdata/")
-def preprocess_data_endpoint():
-    """Preprocess the raw data from bronze table
+@router.get("/preprocessdata/", deprecated=True)
+def preprocess_data_endpoint(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Preprocess the raw data from bronze table and loads it into the gold table
+
+    Kept for existing clients, the preprocessed data is loaded right away instead of
+    waiting in memory for /load_preprocessed_dataset. Use /run_elt_pipeline instead.
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+
+    Raises:
+        HTTPException: 409 while another request, job or process writes the gold table
 
     Returns:
         message: preprocessed data success/fail
     """
-    global global_processed_dataframe
-    global_processed_dataframe = preprocess_data()
+    with run_unless_locked(gold_write_lock):
+        run_elt_pipeline(start=start, end=end, chunksize=None)
     return {'Message': 'Data preprocessed'}
 
-@router.get("/load_preprocessed_dataset")
+@router.get("/load_preprocessed_dataset", deprecated=True)
 def load_preprocessed_data_endpoint():
-    """Loads the preprocessed data into the gold table
-    
+    """Kept for existing clients, /preprocessdata/ already loads the gold table
+
     Returns:
         message: data loaded success/fail
     """
-    global global_processed_dataframe
-    load_preprocessed_vehicle_dataset_into_database(global_processed_dataframe)
     return {'Message': 'Preprocessed data loaded into database'}
 
+## Preprocess the raw data and load it into the gold table in chunks
+@router.get("/preprocess_and_load_chunked")
+def preprocess_and_load_chunked_endpoint(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunksize: int = Query(PREPROCESS_CHUNK_SIZE, ge=1000)
+):
+    """Preprocesses the raw data and loads it into the gold table with bounded memory
+
+    Args:
+        start (datetime, optional): First crawl date included. Defaults to None (no lower bound).
+        end (datetime, optional): Crawl dates from this one on are left out. Defaults to None (no upper bound).
+        chunksize (int, optional): Rows read and transformed at a time. Defaults to PREPROCESS_CHUNK_SIZE.
+
+    Raises:
+        HTTPException: 409 while another request, job or process writes the gold table
+
+    Returns:
+        message: data loaded success/fail with the number of rows loaded
+    """
+    with run_unless_locked(gold_write_lock):
+        rows_loaded = preprocess_and_load_in_chunks(start=start, end=end, chunksize=chunksize)
+    return {'Message': 'Data preprocessed and loaded into database', 'rows_loaded': rows_loaded}
+
+## Load the bronze changes into the gold table
+@router.get("/update_gold_incremental")
+def update_gold_incremental_endpoint():
+    """Upserts the bronze rows inserted or updated since the last load into the gold table
+
+    Raises:
+        HTTPException: 409 while another request, job or process writes the gold table
+
+    Returns:
+        summary: message with the number of rows read, upserted and deleted
+    """
+    with run_unless_locked(gold_write_lock):
+        summary = update_gold_incrementally()
+    return {'Message': 'Gold table updated incrementally', **summary}
+
 ## Train the model
 @router.get("/train_model/")
 def train_model_endpoint()->dict:
     """Trains the model and creates a pkl file
 
+    Raises:
+        HTTPException: 409 while another request, job or process trains a model or writes the gold table
+
     Returns:
         JSON: Contains MSE, feature importance, and a success message
     """
-    try:
-        mse, importance_df = train_model_and_create_file()
-        importance_dict = importance_df.to_dict(orient='records')
-        return {
-            "mse": mse,
-            "feature_importance": importance_dict,
-            "message": "Model trained successfully"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    with run_unless_locked(training_lock):
+        try:
+            mse, importance_df = train_model_and_create_file()
+            importance_dict = importance_df.to_dict(orient='records')
+            return {
+                "mse": mse,
+                "feature_importance": importance_dict,
+                "message": "Model trained successfully"
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+## Submit a background job
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+def submit_job_endpoint(request: JobRequest, response: Response)->dict:
+    """Queues a preprocessing, loading or training job and returns at once
+
+    Args:
+        request (JobRequest): Kind of job, with the start, end and chunksize of the preprocessing
+        response (Response): Response, its status code is 200 when no job was queued
+
+    Returns:
+        job: State of the queued job (202), or of the same job already queued or running (200)
+    """
+    params = request.model_dump(exclude={"kind"})
+    job, created = job_runner.submit(request.kind.value, params)
+    if not created:
+        response.status_code = 200
+    return job
+
+## List the background jobs
+@router.get("/jobs", response_model=List[JobResponse])
+def list_jobs_endpoint(status: Optional[str] = None)->list:
+    """Lists the jobs of this worker, newest first
+
+    Args:
+        status (str, optional): Only the jobs with this status (queued, running, succeeded, failed). Defaults to None.
+
+    Returns:
+        jobs: State of each job
+    """
+    return job_runner.list(status)
+
+## Poll a background job
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def read_job_endpoint(job_id: str)->dict:
+    """Returns the status, progress, stage timings and result of a job
+
+    Args:
+        job_id (str): Id returned when the job was submitted
+
+    Raises:
+        HTTPException: If the job is unknown
+
+    Returns:
+        job: State of the job
+    """
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 ## Load the model
 @router.get("/load_model/")
@@ -0,0 +1,54 @@
+# This file contains the fast path used to serialize collections of vehicles
+# Rows come from the controllers as plain column tuples and are encoded with
+# orjson, without building a pydantic model for every row. The column order is
+# the one of the bronze table, which is also the order of select(table).
+
+import orjson
+from fastapi.responses import Response
+from crud.models import VehicleModel
+
+VEHICLE_COLUMNS = tuple(column.name for column in VehicleModel.__table__.columns)
+ID_INDEX = VEHICLE_COLUMNS.index("id")
+
+# response layouts accepted by the collection endpoints
+LAYOUT_PATTERN = "^(records|columnar)$"
+
+
+def vehicle_records(rows: list)-> list[dict]:
+    """Turns vehicle tuples into one dictionary per vehicle
+
+    Args:
+        rows (list): Vehicle tuples in VEHICLE_COLUMNS order
+
+    Returns:
+        records: A list of dictionaries keyed by column name
+    """
+    return [dict(zip(VEHICLE_COLUMNS, row)) for row in rows]
+
+
+def vehicle_collection(rows: list, layout: str = "records")-> dict:
+    """Builds the body of a collection of vehicles in the requested layout
+
+    Args:
+        rows (list): Vehicle tuples in VEHICLE_COLUMNS order
+        layout (str, optional): "records" for a list of objects, "columnar" for the column
+            names once and a list of value arrays. Defaults to "records".
+
+    Returns:
+        collection: {"items": [...]} or {"columns": [...], "rows": [[...], ...]}
+    """
+    if layout == "columnar":
+        return {"columns": VEHICLE_COLUMNS, "rows": rows}
+    return {"items": vehicle_records(rows)}
+
+
+def json_response(content)-> Response:
+    """Encodes the content with orjson, skipping the response_model validation
+
+    Args:
+        content: Dictionaries, lists, tuples, numbers, strings and datetimes
+
+    Returns:
+        response: JSON response with the encoded content
+    """
+    return Response(orjson.dumps(content), media_type="application/json")
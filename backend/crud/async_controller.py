@@ -0,0 +1,189 @@
+# this file is the async version of the controller for the CRUD operations
+# It is used by api/async_router.py when DB_ASYNC is enabled. The queries are the
+# same as in crud/controller.py, awaited on an AsyncSession instead of blocking a
+# threadpool thread while postgres answers.
+
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud.schemas import VehicleCreate, VehicleUpdate
+from crud.models import VehicleModel
+from crud.cache import vehicle_cache
+from crud.controller import vehicle_search_query
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+vehicle_table = VehicleModel.__table__
+
+# Create function
+## Create a record for a new vehicle
+async def create_vehicle(db: AsyncSession, vehicle: VehicleCreate)->dict:
+    """Creates a new vehicle on the database
+
+    Args:
+        db (AsyncSession): Async database connection session
+        vehicle (VehicleCreate): Vehicle data matching the VehicleCreate schema
+
+    Returns:
+        new_vehicle_data: Created Vehicle information
+    """
+    try:
+        logger.info(f"Creating entry: {vehicle}")
+        query = insert(vehicle_table).values(**vehicle.model_dump()).returning(vehicle_table)
+        db_vehicle = (await db.execute(query)).mappings().first()
+        await db.commit()
+        logger.info("Entry created successfully")
+        return dict(db_vehicle)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error creating entry: {e}")
+        return None
+
+
+# Read functions
+## retrieves a specific vehicle from the database
+async def get_vehicle(db: AsyncSession, vehicle_id: int)->dict:
+    """Reads a vehicle through the vehicle cache, going to the database on a miss
+
+    Args:
+        db (AsyncSession): Async database connection session
+        vehicle_id (int): The id of the vehicle to be retrieved
+
+    Returns:
+        vehicle_data: Information for selected vehicle with the given id
+    """
+    try:
+        logger.info(f"Reading entry with ID: {vehicle_id}")
+        vehicle = await vehicle_cache.get_or_load_async(vehicle_id, lambda: _load_vehicle(db, vehicle_id))
+        logger.info("Entry read successfully")
+        return dict(vehicle) if vehicle is not None else None
+    except Exception as e:
+        logger.error(f"Error reading entry: {e}")
+        return None
+
+
+async def _load_vehicle(db: AsyncSession, vehicle_id: int)->dict:
+    """Reads a vehicle from the database as a dictionary of its columns"""
+    query = select(vehicle_table).where(vehicle_table.c.id == vehicle_id)
+    vehicle = (await db.execute(query)).mappings().first()
+    return dict(vehicle) if vehicle is not None else None
+
+
+## retrieves a page of vehicles from the database
+async def get_vehicles(db: AsyncSession, after_id: int = 0, limit: int = 100)->list[tuple]:
+    """Reads a page of vehicles on the database using keyset pagination
+
+    Args:
+        db (AsyncSession): Async database connection session
+        after_id (int, optional): Cursor, only vehicles with a greater id are returned. Defaults to 0.
+        limit (int, optional): limits number of vehicles per page. Defaults to 100.
+
+    Returns:
+        vehicles_data: list of column tuples, in table column order, with up to 'limit' vehicles ordered by id
+    """
+    try:
+        logger.info(f"Reading {limit} entries after ID: {after_id}")
+        query = (
+            select(vehicle_table)
+            .where(vehicle_table.c.id > after_id)
+            .order_by(vehicle_table.c.id)
+            .limit(limit)
+        )
+        vehicles = [tuple(row) for row in await db.execute(query)]
+        logger.info("Entries read successfully")
+        return vehicles
+    except Exception as e:
+        logger.error(f"Error reading entries: {e}")
+        return None
+
+
+## retrieves the vehicles matching the search filters
+async def search_vehicles(db: AsyncSession, **search)->list[tuple]:
+    """Reads the vehicles matching the search filters
+
+    Args:
+        db (AsyncSession): Async database connection session
+        **search: Filters, sorting and limits accepted by vehicle_search_query
+
+    Returns:
+        vehicles_data: list of column tuples, in table column order, with the matching vehicles
+    """
+    try:
+        logger.info(f"Searching entries: {search}")
+        vehicles = [tuple(row) for row in await db.execute(vehicle_search_query(**search))]
+        logger.info(f"{len(vehicles)} entries found")
+        return vehicles
+    except Exception as e:
+        logger.error(f"Error searching entries: {e}")
+        return None
+
+
+# Update function
+## Update a vehicle in the database
+async def update_vehicle(db: AsyncSession, vehicle_id: int, vehicle: VehicleUpdate)->dict:
+    """Updates information of a vehicle in the database
+
+    Fields left as None keep their current value, like in the sync controller.
+
+    Args:
+        db (AsyncSession): Async database connection session
+        vehicle_id (int): The id of the vehicle to be updated
+        vehicle (VehicleUpdate): Vehicle data matching the VehicleUpdate schema
+
+    Returns:
+        updated_vehicle_data: Updated vehicle information
+    """
+    try:
+        logger.info(f"Updating entry with ID: {vehicle_id}")
+        values = {
+            name: value for name, value in vehicle.model_dump().items()
+            if value is not None and name in vehicle_table.c
+        }
+        if values:
+            query = (
+                update(vehicle_table)
+                .where(vehicle_table.c.id == vehicle_id)
+                .values(**values)
+                .returning(vehicle_table)
+            )
+        else:
+            query = select(vehicle_table).where(vehicle_table.c.id == vehicle_id)
+        db_vehicle = (await db.execute(query)).mappings().first()
+        await db.commit()
+        if db_vehicle is None:
+            return None
+        await vehicle_cache.invalidate_async(vehicle_id)
+        logger.info("Entry updated successfully")
+        return dict(db_vehicle)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error updating entry: {e}")
+        return None
+
+
+# Delete function
+## Delete a vehicle from the database
+async def delete_vehicle(db: AsyncSession, vehicle_id: int)->dict:
+    """Removes a vehicle from the database
+
+    Args:
+        db (AsyncSession): Async database connection session
+        vehicle_id (int): The id of the vehicle to be deleted
+
+    Returns:
+        delete_vehicle_data: Information for the Deleted vehicle
+    """
+    try:
+        logger.info(f"Deleting entry with ID: {vehicle_id}")
+        query = delete(vehicle_table).where(vehicle_table.c.id == vehicle_id).returning(vehicle_table)
+        db_vehicle = (await db.execute(query)).mappings().first()
+        await db.commit()
+        if db_vehicle is None:
+            return None
+        await vehicle_cache.invalidate_async(vehicle_id)
+        logger.info("Entry deleted successfully")
+        return dict(db_vehicle)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error deleting entry: {e}")
+        return None
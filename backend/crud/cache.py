@@ -0,0 +1,253 @@
+# This file contains the read-through cache used for single vehicle lookups
+# The default backend is an in-process LRU with a TTL per entry. Setting
+# VEHICLE_CACHE_URL to a redis url shares the cache between workers instead.
+# The cache never fails a request: backend errors are logged and counted, and the
+# lookup falls back to the database.
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from logging_config import setup_logging
+
+load_dotenv()
+
+logger = setup_logging()
+
+VEHICLE_CACHE_SIZE = int(os.getenv("VEHICLE_CACHE_SIZE", "10000"))
+VEHICLE_CACHE_TTL = float(os.getenv("VEHICLE_CACHE_TTL", "300"))
+VEHICLE_CACHE_URL = os.getenv("VEHICLE_CACHE_URL")
+# seconds a redis call may take before the lookup goes to the database instead
+VEHICLE_CACHE_TIMEOUT = float(os.getenv("VEHICLE_CACHE_TIMEOUT", "0.5"))
+
+
+class InMemoryCacheBackend:
+    """Bounded LRU store where every entry expires after a TTL
+
+    Args:
+        maxsize (int): Maximum number of entries, the least recently used one is evicted beyond it
+        ttl (float): Seconds an entry stays valid
+    """
+    # calls only take a lock, they can run on the event loop
+    blocking = False
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any)-> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: Any, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Any):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self)-> dict:
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisCacheBackend:
+    """Shared store on redis, entries expire after a TTL and redis handles eviction
+
+    Args:
+        url (str): Redis connection url
+        ttl (float): Seconds an entry stays valid
+        prefix (str, optional): Prefix of the redis keys. Defaults to "vehicle:".
+        timeout (float, optional): Seconds of the connection and of each call. Defaults to VEHICLE_CACHE_TIMEOUT.
+    """
+    # calls wait for the network, the async lookups run them in the thread pool
+    blocking = True
+
+    def __init__(self, url: str, ttl: float, prefix: str = "vehicle:", timeout: float = VEHICLE_CACHE_TIMEOUT):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: Any)-> tuple[bool, Any]:
+        raw = self.client.get(f"{self.prefix}{key}")
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    def set(self, key: Any, value: Any):
+        self.client.set(f"{self.prefix}{key}", pickle.dumps(value), ex=max(1, int(self.ttl)))
+
+    def delete(self, key: Any):
+        self.client.delete(f"{self.prefix}{key}")
+
+    def stats(self)-> dict:
+        # counters of the whole redis server, other keys than the vehicles included
+        info = self.client.info("stats")
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "evictions": info.get("evicted_keys"),
+            "expirations": info.get("expired_keys"),
+        }
+
+
+class ReadThroughCache:
+    """Read-through cache counting hits and misses over a pluggable backend
+
+    A backend error (redis down or timing out) is logged and counted, the lookup then
+    goes to the loader as on a miss.
+
+    Args:
+        backend: Store with get, set, delete and stats methods, and a blocking flag for network calls
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, found: bool):
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _call(self, operation: str, *args)-> tuple[bool, Any]:
+        """Calls a backend method, returning ok False instead of raising its error"""
+        try:
+            return True, getattr(self.backend, operation)(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"Vehicle cache {operation} failed, error: {e}")
+            return False, None
+
+    async def _call_async(self, operation: str, *args)-> tuple[bool, Any]:
+        """Same as _call for the async endpoints, off the event loop for a blocking backend"""
+        if self.backend.blocking:
+            return await run_in_threadpool(self._call, operation, *args)
+        return self._call(operation, *args)
+
+    def _lookup(self, key: Any, call: tuple[bool, Any] = None)-> tuple[bool, bool, Any]:
+        """Reads the key from the backend, counting the hit or the miss
+
+        Args:
+            key (Any): Cache key
+            call (tuple[bool, Any], optional): Result of the get already called. Defaults to None.
+
+        Returns:
+            ok, found, value: ok is False when the backend failed
+        """
+        ok, result = call or self._call("get", key)
+        if not ok:
+            return False, False, None
+        found, value = result
+        self._count(found)
+        return True, found, value
+
+    def get_or_load(self, key: Any, loader: Callable[[], Any])-> Any:
+        """Returns the cached value for the key, calling the loader on a miss
+
+        Args:
+            key (Any): Cache key
+            loader (Callable[[], Any]): Loads the value, None results are not cached
+
+        Returns:
+            value: Cached or loaded value
+        """
+        ok, found, value = self._lookup(key)
+        if found:
+            return value
+        value = loader()
+        # the backend is not written to while it is failing
+        if ok and value is not None:
+            self._call("set", key, value)
+        return value
+
+    async def get_or_load_async(self, key: Any, loader: Callable[[], Awaitable[Any]])-> Any:
+        """Same as get_or_load for a loader that is a coroutine function
+
+        Args:
+            key (Any): Cache key
+            loader (Callable[[], Awaitable[Any]]): Loads the value, None results are not cached
+
+        Returns:
+            value: Cached or loaded value
+        """
+        ok, found, value = self._lookup(key, await self._call_async("get", key))
+        if found:
+            return value
+        value = await loader()
+        if ok and value is not None:
+            await self._call_async("set", key, value)
+        return value
+
+    def invalidate(self, *keys: Any):
+        """Removes the keys from the cache, a key the backend failed to remove expires with its TTL"""
+        for key in keys:
+            self._call("delete", key)
+
+    async def invalidate_async(self, *keys: Any):
+        """Same as invalidate for the async endpoints"""
+        for key in keys:
+            await self._call_async("delete", key)
+
+    def stats(self)-> dict:
+        """Returns the hit, miss, error and eviction counters of the cache"""
+        ok, backend_stats = self._call("stats")
+        with self._lock:
+            hits, misses, errors = self.hits, self.misses, self.errors
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "errors": errors,
+            **(backend_stats if ok else {"evictions": None, "expirations": None}),
+        }
+
+
+def build_vehicle_cache()-> ReadThroughCache:
+    """Builds the vehicle cache from the environment configuration
+
+    Returns:
+        vehicle_cache: Read-through cache on redis if VEHICLE_CACHE_URL is set, in memory otherwise
+    """
+    if VEHICLE_CACHE_URL:
+        return ReadThroughCache(RedisCacheBackend(VEHICLE_CACHE_URL, VEHICLE_CACHE_TTL))
+    return ReadThroughCache(InMemoryCacheBackend(VEHICLE_CACHE_SIZE, VEHICLE_CACHE_TTL))
+
+
+vehicle_cache = build_vehicle_cache()
@@ -0,0 +1,58 @@
+# This file contains the change log of the bronze table read by the incremental gold load
+# Statement triggers record the id of every bronze row inserted or updated, COPY included,
+# with the 64 bit id of the transaction writing it. The log is indexed on the transaction
+# id, so the incremental load reads the ids changed since its watermark and looks them up
+# by id instead of scanning the whole bronze table. Each load prunes the entries it covered.
+
+from database.database import engine
+from crud.models import VehicleModel
+
+BRONZE_TABLE = VehicleModel.__tablename__
+BRONZE_CHANGES_TABLE = f"{BRONZE_TABLE}_changes"
+
+CREATE_BRONZE_CHANGES_SQL = [
+    f"CREATE TABLE IF NOT EXISTS {BRONZE_CHANGES_TABLE} (txid bigint NOT NULL, id integer NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{BRONZE_CHANGES_TABLE}_txid ON {BRONZE_CHANGES_TABLE} (txid)",
+    f"""
+    CREATE OR REPLACE FUNCTION {BRONZE_CHANGES_TABLE}_log() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO {BRONZE_CHANGES_TABLE} (txid, id) SELECT txid_current(), id FROM changed_rows;
+        RETURN NULL;
+    END $$
+    """,
+    # a trigger with a transition table has a single event, inserts and updates get one each
+    *(
+        f"CREATE OR REPLACE TRIGGER {BRONZE_CHANGES_TABLE}_{event.lower()} AFTER {event} ON {BRONZE_TABLE} "
+        f"REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION {BRONZE_CHANGES_TABLE}_log()"
+        for event in ("INSERT", "UPDATE")
+    ),
+]
+
+# bronze rows written by transactions from the watermark on, parameter %(txid)s
+BRONZE_DELTA_QUERY = (
+    f"SELECT * FROM {BRONZE_TABLE} WHERE id IN "
+    f"(SELECT id FROM {BRONZE_CHANGES_TABLE} WHERE txid >= %(txid)s)"
+)
+
+
+def create_bronze_change_log(bind=engine):
+    """Creates the change log of the bronze table and the triggers filling it
+
+    The changes made before it exists are not logged, a full load covers them.
+
+    Args:
+        bind (Engine, optional): Engine of the database. Defaults to engine.
+    """
+    with bind.begin() as conn:
+        for statement in CREATE_BRONZE_CHANGES_SQL:
+            conn.exec_driver_sql(statement)
+
+
+def prune_bronze_changes(cursor, snapshot_xmin: int):
+    """Removes the changes of the transactions older than a watermark, the caller commits
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        snapshot_xmin (int): Watermark just saved, its changes and the newer ones are kept
+    """
+    cursor.execute(f"DELETE FROM {BRONZE_CHANGES_TABLE} WHERE txid < %s;", (snapshot_xmin,))
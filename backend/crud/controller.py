@@ -1,9 +1,18 @@
 # this file is a controller for the CRUD operations of the database
 
+import csv
+import io
+import json
+from datetime import datetime
+from pydantic import ValidationError
+from sqlalchemy import select, insert, update, delete, func, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Session
-from crud.schemas import VehicleCreate, VehicleUpdate
+from database.database import SessionLocal
+from crud.schemas import VehicleCreate, VehicleUpdate, VehicleBulkUpdate
 from crud.models import VehicleModel
-from typing import Any
+from crud.cache import vehicle_cache
+from typing import Any, Iterator
 from logging_config import setup_logging
 
 logger = setup_logging()
@@ -34,10 +43,53 @@ def create_vehicle(db: Session, vehicle: VehicleCreate)->dict:
         return None
 
 
+## Create records for many vehicles at once
+def create_vehicles_bulk(db: Session, vehicles: list, batch_size: int = 1000)->dict:
+    """Creates many vehicles on the database with multi-row INSERT ... RETURNING id
+
+    Every item is validated on its own, invalid items are reported and skipped.
+    Valid items are inserted in transactions of at most 'batch_size' rows; if a
+    transaction fails, all of its items are reported as errors.
+
+    Args:
+        db (Session): Database connection session
+        vehicles (list): Vehicle data as dictionaries or as JSON strings (one NDJSON line each)
+        batch_size (int, optional): Number of rows per transaction. Defaults to 1000.
+
+    Returns:
+        bulk_result: Dictionary with the created ids and the errors, both with the index of the item
+    """
+    created, errors, valid = [], [], []
+    for index, item in enumerate(vehicles):
+        try:
+            if isinstance(item, (str, bytes)):
+                vehicle = VehicleCreate.model_validate_json(item)
+            else:
+                vehicle = VehicleCreate.model_validate(item)
+            valid.append((index, vehicle.model_dump()))
+        except ValidationError as e:
+            errors.append({"index": index, "detail": "; ".join(error["msg"] for error in e.errors())})
+
+    logger.info(f"Creating {len(valid)} entries in batches of {batch_size}, {len(errors)} invalid")
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        try:
+            query = insert(VehicleModel).values([values for _, values in batch]).returning(VehicleModel.id)
+            ids = db.execute(query).scalars().all()
+            db.commit()
+            created.extend({"index": index, "id": id_} for (index, _), id_ in zip(batch, ids))
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error creating entries: {e}")
+            errors.extend({"index": index, "detail": str(e)} for index, _ in batch)
+    logger.info(f"{len(created)} entries created successfully")
+    return {"created": created, "errors": sorted(errors, key=lambda error: error["index"])}
+
+
 # Read functions
 ## retrieves a specific vehicle from the database
 def get_vehicle(db: Session, vehicle_id: int)->dict:
-    """Reads a vehicle from the database
+    """Reads a vehicle through the vehicle cache, going to the database on a miss
 
     Args:
         db (Session): Database connection session
@@ -48,39 +100,185 @@ def get_vehicle(db: Session, vehicle_id: int)->dict:
     """
     try:
         logger.info(f"Reading entry with ID: {vehicle_id}")
-        query = db.query(VehicleModel).filter(VehicleModel.id == vehicle_id).first()
+        vehicle = vehicle_cache.get_or_load(vehicle_id, lambda: _load_vehicle(db, vehicle_id))
         logger.info("Entry read successfully")
-        print(query)
-        return query
+        return dict(vehicle) if vehicle is not None else None
     except Exception as e:
         logger.error(f"Error reading entry: {e}")
         return None
     
 
-## retrieves all vehicles from the database
-def get_vehicles(db: Session, skip: int = 0, limit: int = None)->list[dict[str,Any]]:
-    """Reads all vehicles on the database
+def _load_vehicle(db: Session, vehicle_id: int)->dict:
+    """Reads a vehicle from the database as a dictionary of its columns"""
+    query = select(VehicleModel.__table__).where(VehicleModel.id == vehicle_id)
+    vehicle = db.execute(query).mappings().first()
+    return dict(vehicle) if vehicle is not None else None
+
+
+## retrieves a page of vehicles from the database
+def get_vehicles(db: Session, after_id: int = 0, limit: int = 100)->list[tuple]:
+    """Reads a page of vehicles on the database using keyset pagination
 
     Args:
         db (Session): Database connection session
-        skip (int, optional): Pagination setup parameter. Defaults to 0.
-        limit (int, optional): limits number of vehicles per page. Defaults to None.
+        after_id (int, optional): Cursor, only vehicles with a greater id are returned. Defaults to 0.
+        limit (int, optional): limits number of vehicles per page. Defaults to 100.
 
     Returns:
-        vehicles_data: the full list of dictionaries with vehicles from the database
+        vehicles_data: list of column tuples, in table column order, with up to 'limit' vehicles ordered by id
     """
     try:
-        logger.info("Reading all entries")
-        query = db.query(VehicleModel).offset(skip)
-        if limit is not None:
-            query = query.limit(limit)
+        logger.info(f"Reading {limit} entries after ID: {after_id}")
+        table = VehicleModel.__table__
+        query = (
+            select(table)
+            .where(table.c.id > after_id)
+            .order_by(table.c.id)
+            .limit(limit)
+        )
+        vehicles = [tuple(row) for row in db.execute(query)]
         logger.info("Entries read successfully")
-        return query.all()
+        return vehicles
     except Exception as e:
         logger.error(f"Error reading entries: {e}")
         return None
 
 
+## builds the query for a filtered search of vehicles
+SEARCH_SORT_COLUMNS = ("id", "price", "registrationyear", "mileage", "power", "datecrawled")
+
+def vehicle_search_query(
+    table=VehicleModel.__table__,
+    brand: str = None,
+    model: str = None,
+    vehicletype: str = None,
+    fueltype: str = None,
+    gearbox: str = None,
+    min_price: int = None,
+    max_price: int = None,
+    min_registrationyear: int = None,
+    max_registrationyear: int = None,
+    min_mileage: int = None,
+    max_mileage: int = None,
+    sort_by: str = "id",
+    descending: bool = False,
+    limit: int = 100,
+    offset: int = 0
+):
+    """Builds the SELECT statement for a filtered and sorted search of vehicles
+
+    Filters left as None are not applied. Ties on the sort column are broken by id.
+
+    Args:
+        table (Table, optional): Table to be searched. Defaults to the bronze table.
+        brand, model, vehicletype, fueltype, gearbox (str, optional): Exact match filters. Default to None.
+        min_price, max_price (int, optional): Price range. Default to None.
+        min_registrationyear, max_registrationyear (int, optional): Registration year range. Default to None.
+        min_mileage, max_mileage (int, optional): Mileage range. Default to None.
+        sort_by (str, optional): One of SEARCH_SORT_COLUMNS. Defaults to "id".
+        descending (bool, optional): Sort in descending order. Defaults to False.
+        limit (int, optional): Maximum number of vehicles returned. Defaults to 100.
+        offset (int, optional): Number of matching vehicles skipped. Defaults to 0.
+
+    Returns:
+        query: SELECT statement over all the columns of the table
+    """
+    query = select(table)
+    for name, value in (
+        ("brand", brand), ("model", model), ("vehicletype", vehicletype),
+        ("fueltype", fueltype), ("gearbox", gearbox)
+    ):
+        if value is not None:
+            query = query.where(table.c[name] == value)
+    for name, low, high in (
+        ("price", min_price, max_price),
+        ("registrationyear", min_registrationyear, max_registrationyear),
+        ("mileage", min_mileage, max_mileage)
+    ):
+        if low is not None:
+            query = query.where(table.c[name] >= low)
+        if high is not None:
+            query = query.where(table.c[name] <= high)
+    if sort_by not in SEARCH_SORT_COLUMNS:
+        raise ValueError(f"Invalid sort column: {sort_by}")
+    sort_columns = [table.c[sort_by], table.c.id] if sort_by != "id" else [table.c.id]
+    if descending:
+        sort_columns = [sort_column.desc() for sort_column in sort_columns]
+    return query.order_by(*sort_columns).limit(limit).offset(offset)
+
+
+## retrieves the vehicles matching the search filters
+def search_vehicles(db: Session, **search)->list[tuple]:
+    """Reads the vehicles matching the search filters
+
+    Args:
+        db (Session): Database connection session
+        **search: Filters, sorting and limits accepted by vehicle_search_query
+
+    Returns:
+        vehicles_data: list of column tuples, in table column order, with the matching vehicles
+    """
+    try:
+        logger.info(f"Searching entries: {search}")
+        vehicles = [tuple(row) for row in db.execute(vehicle_search_query(**search))]
+        logger.info(f"{len(vehicles)} entries found")
+        return vehicles
+    except Exception as e:
+        logger.error(f"Error searching entries: {e}")
+        return None
+
+
+## streams all vehicles from the database as ndjson or csv
+def export_vehicles(file_format: str = "ndjson", chunk_size: int = 5000)->Iterator[str]:
+    """Streams every vehicle on the database through a server-side cursor
+
+    Rows are fetched as plain tuples in chunks of 'chunk_size' and serialized
+    right away, so memory does not grow with the size of the table. The
+    generator opens its own session because it keeps running after the
+    request handler has returned.
+
+    Args:
+        file_format (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+        chunk_size (int, optional): Number of rows fetched from the cursor at a time. Defaults to 5000.
+
+    Yields:
+        vehicles_data: serialized chunk of vehicles ordered by id
+    """
+    db = SessionLocal()
+    try:
+        logger.info(f"Exporting all entries as {file_format}")
+        query = select(VehicleModel.__table__).order_by(VehicleModel.id)
+        result = db.execute(query, execution_options={"stream_results": True})
+        columns = list(result.keys())
+        if file_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for rows in result.partitions(chunk_size):
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        else:
+            for rows in result.partitions(chunk_size):
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows
+                )
+        logger.info("Entries exported successfully")
+    except Exception as e:
+        logger.error(f"Error exporting entries: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def _json_default(value: Any)->str:
+    """Serializes the datetime columns as ISO 8601 strings"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
 # Update function
 ## Update a vehicle in the database
 def update_vehicle(db: Session, vehicle_id: int, vehicle: VehicleUpdate)->dict:
@@ -133,6 +331,7 @@ def update_vehicle(db: Session, vehicle_id: int, vehicle: VehicleUpdate)->dict:
         if vehicle.lastseen is not None:
             db_vehicle.lastseen = vehicle.lastseen   
         db.commit()
+        vehicle_cache.invalidate(vehicle_id)
         logger.info("Entry updated successfully")
         return db_vehicle
     except Exception as e:
@@ -140,6 +339,54 @@ def update_vehicle(db: Session, vehicle_id: int, vehicle: VehicleUpdate)->dict:
         return None
 
 
+## Update many vehicles with one statement
+def update_vehicles_bulk(db: Session, vehicles: list[VehicleBulkUpdate])->dict:
+    """Updates many vehicles with a single UPDATE ... FROM unnest(...) statement
+
+    The new values are sent as one array per column and joined to the table by
+    id, so the statement stays small whatever the number of vehicles. Like
+    update_vehicle, fields left as None keep their current value. If an id
+    appears more than once, the last item wins.
+
+    Args:
+        db (Session): Database connection session
+        vehicles (list[VehicleBulkUpdate]): Vehicle ids and data matching the VehicleBulkUpdate schema
+
+    Returns:
+        bulk_result: Dictionary with the updated ids and the ids that were not found
+    """
+    try:
+        table = VehicleModel.__table__
+        fields = [name for name in VehicleUpdate.model_fields if name in table.c]
+        items = {vehicle.id: vehicle for vehicle in vehicles}
+        if not items:
+            return {"updated_ids": [], "missing_ids": []}
+        logger.info(f"Updating {len(items)} entries")
+        arrays = [bindparam("id", list(items), type_=ARRAY(Integer))] + [
+            bindparam(name, [getattr(vehicle, name) for vehicle in items.values()], type_=ARRAY(table.c[name].type))
+            for name in fields
+        ]
+        data = func.unnest(*arrays).table_valued("id", *fields).render_derived(name="data")
+        query = (
+            update(table)
+            .where(table.c.id == data.c.id)
+            .values({name: func.coalesce(data.c[name], table.c[name]) for name in fields})
+            .returning(table.c.id)
+        )
+        updated_ids = sorted(db.execute(query).scalars().all())
+        db.commit()
+        vehicle_cache.invalidate(*updated_ids)
+        logger.info(f"{len(updated_ids)} entries updated successfully")
+        return {
+            "updated_ids": updated_ids,
+            "missing_ids": sorted(set(items) - set(updated_ids))
+        }
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating entries: {e}")
+        return None
+
+
 # Delete function
 ## Delete a vehicle from the database
 def delete_vehicle(db: Session, vehicle_id: int)->dict:
@@ -157,8 +404,39 @@ def delete_vehicle(db: Session, vehicle_id: int)->dict:
         db_vehicle = db.query(VehicleModel).filter(VehicleModel.id == vehicle_id).first()
         db.delete(db_vehicle)
         db.commit()
+        vehicle_cache.invalidate(vehicle_id)
         logger.info("Entry deleted successfully")
         return db_vehicle
     except Exception as e:
         logger.error(f"Error deleting entry: {e}")
         return None
+
+
+## Delete many vehicles with one statement
+def delete_vehicles_bulk(db: Session, vehicle_ids: list[int])->dict:
+    """Removes many vehicles with a single DELETE ... WHERE id = ANY(...) statement
+
+    Args:
+        db (Session): Database connection session
+        vehicle_ids (list[int]): The ids of the vehicles to be deleted
+
+    Returns:
+        bulk_result: Dictionary with the deleted ids and the ids that were not found
+    """
+    try:
+        logger.info(f"Deleting {len(vehicle_ids)} entries")
+        table = VehicleModel.__table__
+        ids = bindparam("ids", list(set(vehicle_ids)), type_=ARRAY(Integer))
+        query = delete(table).where(table.c.id == any_(ids)).returning(table.c.id)
+        deleted_ids = sorted(db.execute(query).scalars().all())
+        db.commit()
+        vehicle_cache.invalidate(*deleted_ids)
+        logger.info(f"{len(deleted_ids)} entries deleted successfully")
+        return {
+            "deleted_ids": deleted_ids,
+            "missing_ids": sorted(set(vehicle_ids) - set(deleted_ids))
+        }
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting entries: {e}")
+        return None
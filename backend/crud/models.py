@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Index
 from database.database import Base
 
 # This file contains the table models for the database
@@ -10,6 +10,15 @@ class VehicleModel(Base):
         Base (class): Inherits declarative base class parameter from database.py
     """
     __tablename__ = "bronze_car_data"
+    # composite indexes backing the filters and sorting of the search endpoint
+    __table_args__ = (
+        Index("ix_bronze_car_data_brand_model_year", "brand", "model", "registrationyear"),
+        Index("ix_bronze_car_data_vehicletype_price", "vehicletype", "price"),
+        Index("ix_bronze_car_data_fueltype_gearbox_price", "fueltype", "gearbox", "price"),
+        Index("ix_bronze_car_data_registrationyear_price", "registrationyear", "price"),
+        Index("ix_bronze_car_data_price", "price"),
+        Index("ix_bronze_car_data_mileage_price", "mileage", "price"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     datecrawled = (Column(DateTime))
     price = Column(Integer)
@@ -26,4 +35,39 @@ class VehicleModel(Base):
     datecreated = Column(DateTime)
     numberofpictures = Column(Integer)
     postalcode = Column(Integer)
-    lastseen = Column(DateTime)
\ No newline at end of file
+    lastseen = Column(DateTime)
+
+class IngestManifestModel(Base):
+    """Creates a table on the database to keep track of the raw files loaded by the seeder
+
+    Args:
+        Base (class): Inherits declarative base class parameter from database.py
+    """
+    __tablename__ = "ingest_manifest"
+    id = Column(Integer, primary_key=True, index=True)
+    file_name = Column(String)
+    file_hash = Column(String, unique=True)
+    batch_id = Column(String)
+    rows_loaded = Column(BigInteger, default=0)
+    byte_offset = Column(BigInteger, default=0)
+    status = Column(String)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class EltWatermarkModel(Base):
+    """Creates a table on the database to keep track of the bronze changes already loaded into gold
+
+    Args:
+        Base (class): Inherits declarative base class parameter from database.py
+    """
+    __tablename__ = "elt_watermark"
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String, unique=True)
+    # oldest transaction still running when bronze was last read, rows written
+    # by this transaction or later ones are read again on the next run
+    snapshot_xmin = Column(BigInteger)
+    max_id = Column(BigInteger)
+    rows_upserted = Column(BigInteger, default=0)
+    rows_deleted = Column(BigInteger, default=0)
+    mode = Column(String)
+    updated_at = Column(DateTime)
@@ -0,0 +1,201 @@
+# This file contains the monthly range partitioning of the bronze table on datecrawled
+# With BRONZE_PARTITIONED enabled the bronze table is created as a partitioned table,
+# the ingestion creates the partitions of the months it loads, the ELT reads can be
+# limited to a date window (pruning the other partitions) and old months are removed
+# by detaching or dropping their partition instead of deleting rows.
+#
+# The partitioned table has no primary key: postgres requires the partition key in
+# every unique constraint and datecrawled may be NULL. The ids still come from the
+# serial sequence and the ORM keeps treating id as the primary key.
+
+import argparse
+import os
+import re
+from datetime import date, datetime
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+from crud.models import VehicleModel
+from logging_config import setup_logging
+
+load_dotenv()
+
+logger = setup_logging()
+
+BRONZE_PARTITIONED = os.getenv("BRONZE_PARTITIONED", "false").lower() in ("1", "true", "yes")
+
+BRONZE_TABLE = VehicleModel.__tablename__
+PARTITION_COLUMN = "datecrawled"
+# rows with a missing crawl date, or a month without partition, land here
+DEFAULT_PARTITION = f"{BRONZE_TABLE}_default"
+MONTHLY_PARTITION = re.compile(rf"^{BRONZE_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def partition_name(month: date)-> str:
+    """Returns the name of the partition of a month, like bronze_car_data_y2016m03"""
+    return f"{BRONZE_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def month_bounds(month: date)-> tuple[date, date]:
+    """Returns the first day of the month and the first day of the next month"""
+    start = date(month.year, month.month, 1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def create_partitioned_bronze_table(bind)-> bool:
+    """Creates the bronze table partitioned by month of datecrawled, with its default partition
+
+    Has to run before Base.metadata.create_all, which then leaves the table alone.
+
+    Args:
+        bind (Engine): Engine of the database
+
+    Returns:
+        created: False if the bronze table already exists
+    """
+    if inspect(bind).has_table(BRONZE_TABLE):
+        conn = bind.raw_connection()
+        try:
+            partitioned = is_partitioned(conn.cursor())
+        finally:
+            conn.close()
+        if not partitioned:
+            logger.error(f"{BRONZE_TABLE} already exists and is not partitioned, leaving it as it is")
+        return False
+    columns = []
+    for column in VehicleModel.__table__.columns:
+        if column.name == "id":
+            columns.append("id serial NOT NULL")
+        else:
+            columns.append(f"{column.name} {column.type.compile(dialect=bind.dialect)}")
+    with bind.begin() as conn:
+        conn.exec_driver_sql(
+            f"CREATE TABLE {BRONZE_TABLE} ({', '.join(columns)}) PARTITION BY RANGE ({PARTITION_COLUMN})"
+        )
+        conn.exec_driver_sql(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {BRONZE_TABLE} DEFAULT")
+    logger.info(f"{BRONZE_TABLE} created as a partitioned table")
+    return True
+
+
+def is_partitioned(cursor)-> bool:
+    """Tells whether the bronze table is partitioned, through a DBAPI cursor"""
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s);", (BRONZE_TABLE,))
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor)-> list[tuple[str, date]]:
+    """Returns the monthly partitions attached to the bronze table
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+
+    Returns:
+        partitions: (name, first day of the month) of each partition, oldest first
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s);",
+        (BRONZE_TABLE,)
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = MONTHLY_PARTITION.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_monthly_partitions(cursor, months)-> list[str]:
+    """Creates the partitions of the given months that do not exist yet
+
+    Rows of those months already sitting in the default partition (inserted through
+    the API before the partition existed) are moved into the new partition, which
+    postgres requires before attaching it. The caller commits.
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        months (iterable): Any date or datetime within each month
+
+    Returns:
+        created: Names of the partitions created
+    """
+    existing = {name for name, _ in list_partitions(cursor)}
+    created = []
+    for month in sorted({date(m.year, m.month, 1) for m in months}):
+        name = partition_name(month)
+        if name in existing:
+            continue
+        start, end = month_bounds(month)
+        cursor.execute(f"CREATE TABLE {name} (LIKE {BRONZE_TABLE} INCLUDING DEFAULTS);")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE {PARTITION_COLUMN} >= %s AND {PARTITION_COLUMN} < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved;",
+            (start, end)
+        )
+        cursor.execute(
+            f"ALTER TABLE {BRONZE_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);",
+            (start, end)
+        )
+        created.append(name)
+        logger.info(f"Partition {name} created")
+    return created
+
+
+def detach_partitions_before(cursor, month: date, drop: bool = False)-> list[str]:
+    """Detaches, and optionally drops, the monthly partitions older than a month
+
+    Detaching or dropping a partition only changes the catalog, whatever the number
+    of rows in it. Detached partitions stay in the database as regular tables.
+    The caller commits.
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        month (date): Partitions of months before this one are removed
+        drop (bool, optional): Drop the partitions instead of keeping them as tables. Defaults to False.
+
+    Returns:
+        removed: Names of the detached or dropped partitions
+    """
+    cutoff = date(month.year, month.month, 1)
+    removed = []
+    for name, partition_month in list_partitions(cursor):
+        if partition_month >= cutoff:
+            break
+        cursor.execute(f"ALTER TABLE {BRONZE_TABLE} DETACH PARTITION {name};")
+        if drop:
+            cursor.execute(f"DROP TABLE {name};")
+        removed.append(name)
+        logger.info(f"Partition {name} {'dropped' if drop else 'detached'}")
+    return removed
+
+
+def crawl_months(rows: list, date_index: int)-> set:
+    """Returns the months of the crawl dates of a chunk of csv rows
+
+    Args:
+        rows (list): csv rows with the dates already in the '%Y-%m-%d %H:%M:%S' format
+        date_index (int): Position of the datecrawled column
+
+    Returns:
+        months: First day of every month found, missing dates are skipped
+    """
+    return {date(int(row[date_index][:4]), int(row[date_index][5:7]), 1) for row in rows if row[date_index]}
+
+
+if __name__ == "__main__":
+    from database.database import engine
+
+    parser = argparse.ArgumentParser(description="Remove old monthly partitions of the bronze table")
+    parser.add_argument("before", help="first month to keep, as YYYY-MM")
+    parser.add_argument("--drop", action="store_true", help="drop the partitions instead of detaching them")
+    args = parser.parse_args()
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        removed = detach_partitions_before(cursor, datetime.strptime(args.before, "%Y-%m").date(), args.drop)
+        conn.commit()
+        print(f"{len(removed)} partitions {'dropped' if args.drop else 'detached'}: {', '.join(removed)}")
+    finally:
+        conn.close()
@@ -2,8 +2,8 @@
 
 from pydantic import BaseModel, PositiveFloat, EmailStr, validator, Field
 from enum import Enum
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Any, Optional, List
 
 # Categorical classes as Enum
 class GearboxBase(Enum):
@@ -50,6 +50,19 @@ class VehicleTypeBase(Enum):
     vehicletype8 = "wagon"
 
 
+def to_naive_utc(v: Optional[datetime])-> Optional[datetime]:
+    """Converts a datetime with a time zone to naive UTC, the timestamp columns have no time zone
+
+    Args:
+        v (datetime): Datetime, naive ones are taken as UTC already
+
+    Returns:
+        datetime: Naive UTC datetime
+    """
+    if v is not None and v.tzinfo is not None:
+        return v.astimezone(timezone.utc).replace(tzinfo=None)
+    return v
+
 # VehicleBase
 class VehicleBase(BaseModel):
     """Base schema for the vehicle data
@@ -82,6 +95,9 @@ class VehicleBase(BaseModel):
     postalcode: Optional[int]
     lastseen: Optional[datetime]
 
+    # asyncpg refuses aware datetimes for timestamp columns, psycopg2 would convert them
+    _naive_utc_dates = validator("datecrawled", "datecreated", "lastseen")(to_naive_utc)
+
     @validator("gearbox")
     def check_gearbox(cls, v):
         """Validates the gearbox selection
@@ -155,6 +171,63 @@ class VehicleResponse(VehicleBase):
         """ORM Mode configuration for the schema"""
         orm_mode = True
 
+# VehiclePage
+class VehiclePage(BaseModel):
+    """Schema for a page of vehicles returned by keyset pagination
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    items: List[VehicleResponse]
+    next_after_id: Optional[int] = None
+
+# VehicleColumns
+class VehicleColumns(BaseModel):
+    """Schema for vehicles in the columnar layout, the column names once and one value array per vehicle
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    columns: List[str]
+    rows: List[List[Any]]
+
+# VehicleColumnarPage
+class VehicleColumnarPage(VehicleColumns):
+    """Schema for a page of vehicles in the columnar layout returned by keyset pagination
+
+    Args:
+        VehicleColumns (class): Inherits the VehicleColumns class
+    """
+    next_after_id: Optional[int] = None
+
+# Bulk operation schemas
+class BulkItemError(BaseModel):
+    """Schema for an item of a bulk request that could not be processed
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    index: int
+    detail: str
+
+class BulkCreatedItem(BaseModel):
+    """Schema for an item of a bulk request that was created
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    index: int
+    id: int
+
+class BulkCreateResponse(BaseModel):
+    """Schema for the response of a bulk create request
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    created: List[BulkCreatedItem]
+    errors: List[BulkItemError]
+
 # VehicleUpdate
 class VehicleUpdate(BaseModel):
     """Schema for updating the vehicle data
@@ -187,6 +260,8 @@ class VehicleUpdate(BaseModel):
     postalcode: Optional[int] = None
     lastseen: Optional[datetime] = None
 
+    _naive_utc_dates = validator("datecrawled", "datecreated", "lastseen")(to_naive_utc)
+
     @validator("gearbox", pre=True, always=True)
     def check_gearbox(cls, v):
         """Validates the gearbox selection
@@ -264,4 +339,93 @@ class InputData(BaseModel):
     datecreated: Optional[datetime] = None
     numberofpictures: Optional[int] = None
     postalcode: Optional[int] = None
-    lastseen: Optional[datetime] = None
\ No newline at end of file
+    lastseen: Optional[datetime] = None
+
+# Bulk update and delete schemas
+class VehicleBulkUpdate(VehicleUpdate):
+    """Schema for an item of a bulk update request
+
+    Args:
+        VehicleUpdate (class): Inherits the VehicleUpdate class
+    """
+    id: int
+
+class BulkUpdateResponse(BaseModel):
+    """Schema for the response of a bulk update request
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    updated_ids: List[int]
+    missing_ids: List[int]
+
+class BulkDeleteRequest(BaseModel):
+    """Schema for a bulk delete request
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    ids: List[int]
+
+class BulkDeleteResponse(BaseModel):
+    """Schema for the response of a bulk delete request
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    deleted_ids: List[int]
+    missing_ids: List[int]
+
+# Background job schemas
+class JobKind(str, Enum):
+    """List of the jobs run in the background
+
+    Args:
+        kind (Enum): Job kinds
+    """
+    preprocess_load = "preprocess_load"
+    preprocess_load_chunked = "preprocess_load_chunked"
+    update_gold_incremental = "update_gold_incremental"
+    train = "train"
+    retrain = "retrain"
+    retrain_incremental = "retrain_incremental"
+    tune = "tune"
+
+class JobRequest(BaseModel):
+    """Schema for submitting a background job
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    kind: JobKind
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    chunksize: Optional[int] = Field(None, ge=1000)
+
+class JobStage(BaseModel):
+    """Schema for the status and duration of a stage of a job
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    name: str
+    status: str
+    seconds: Optional[float] = None
+
+class JobResponse(BaseModel):
+    """Schema for the state of a background job
+
+    Args:
+        BaseModel (class): Inherits the Pydantic BaseModel class
+    """
+    id: str
+    kind: JobKind
+    params: dict
+    status: str
+    progress: float
+    stages: List[JobStage]
+    result: dict
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
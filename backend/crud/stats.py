@@ -0,0 +1,205 @@
+# This file contains the pre-aggregated price statistics of the bronze table
+# The statistics live in a materialized view computed with GROUP BY CUBE over
+# brand, model, registrationyear and vehicletype, so every combination of those
+# dimensions (including "all") is a single indexed lookup. The view is refreshed
+# concurrently after ingestion and training, readers are never blocked.
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, select
+from sqlalchemy.orm import Session
+from database.database import engine
+from typing import Any
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+PRICE_STATS_VIEW = "mv_price_stats"
+
+# Dimensions of the statistics, in the order given to GROUPING()
+PRICE_STATS_DIMENSIONS = ("brand", "model", "registrationyear", "vehicletype")
+
+# Missing values are grouped as 'unknown' (0 for the year), like in preprocessing.
+# Rolled up dimensions are stored as '' (0 for the year) and told apart from real
+# values by grouping_id, so the unique index has no NULLs and REFRESH CONCURRENTLY
+# only rewrites the rows that changed.
+CREATE_PRICE_STATS_VIEW_SQL = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS {PRICE_STATS_VIEW} AS
+SELECT
+    GROUPING(brand, model, registrationyear, vehicletype) AS grouping_id,
+    COALESCE(brand, '') AS brand,
+    COALESCE(model, '') AS model,
+    COALESCE(registrationyear, 0) AS registrationyear,
+    COALESCE(vehicletype, '') AS vehicletype,
+    count(*) AS vehicles,
+    avg(price)::float AS avg_price,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY price) AS median_price,
+    percentile_cont(0.25) WITHIN GROUP (ORDER BY price) AS p25_price,
+    percentile_cont(0.75) WITHIN GROUP (ORDER BY price) AS p75_price,
+    min(price) AS min_price,
+    max(price) AS max_price
+FROM (
+    SELECT
+        COALESCE(brand, 'unknown') AS brand,
+        COALESCE(model, 'unknown') AS model,
+        COALESCE(registrationyear, 0) AS registrationyear,
+        COALESCE(vehicletype, 'unknown') AS vehicletype,
+        price
+    FROM bronze_car_data
+    WHERE price IS NOT NULL
+) AS vehicles
+GROUP BY CUBE (brand, model, registrationyear, vehicletype)
+"""
+
+CREATE_PRICE_STATS_INDEX_SQL = f"""
+CREATE UNIQUE INDEX IF NOT EXISTS ix_{PRICE_STATS_VIEW}_dimensions
+ON {PRICE_STATS_VIEW} (grouping_id, brand, model, registrationyear, vehicletype)
+"""
+
+# Read only description of the view for the queries, kept out of Base.metadata
+# so create_all does not create it as a table
+price_stats_view = Table(
+    PRICE_STATS_VIEW,
+    MetaData(),
+    Column("grouping_id", Integer),
+    Column("brand", String),
+    Column("model", String),
+    Column("registrationyear", Integer),
+    Column("vehicletype", String),
+    Column("vehicles", Integer),
+    Column("avg_price", Float),
+    Column("median_price", Float),
+    Column("p25_price", Float),
+    Column("p75_price", Float),
+    Column("min_price", Integer),
+    Column("max_price", Integer),
+)
+
+
+def create_price_stats_view(bind=engine):
+    """Creates the price statistics view and its unique index if they do not exist
+
+    Args:
+        bind (Engine, optional): Engine of the database. Defaults to engine.
+    """
+    with bind.begin() as conn:
+        conn.exec_driver_sql(CREATE_PRICE_STATS_VIEW_SQL)
+        conn.exec_driver_sql(CREATE_PRICE_STATS_INDEX_SQL)
+
+
+def refresh_price_stats(cursor)-> bool:
+    """Refreshes the price statistics view through a DBAPI cursor
+
+    The refresh is concurrent once the view holds data, so the statistics stay
+    readable while they are recomputed. The caller commits.
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+
+    Returns:
+        refreshed: False if the view does not exist yet
+    """
+    cursor.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = %s;", (PRICE_STATS_VIEW,))
+    view = cursor.fetchone()
+    if view is None:
+        return False
+    concurrently = "CONCURRENTLY " if view[0] else ""
+    cursor.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{PRICE_STATS_VIEW};")
+    return True
+
+
+def refresh_price_stats_view(bind=engine)-> bool:
+    """Refreshes the price statistics view on its own connection
+
+    Args:
+        bind (Engine, optional): Engine of the database. Defaults to engine.
+
+    Returns:
+        refreshed: False if the view does not exist yet
+    """
+    conn = bind.raw_connection()
+    try:
+        cursor = conn.cursor()
+        refreshed = refresh_price_stats(cursor)
+        cursor.close()
+        conn.commit()
+        logger.info(f"{PRICE_STATS_VIEW} refreshed" if refreshed else f"{PRICE_STATS_VIEW} does not exist")
+        return refreshed
+    finally:
+        conn.close()
+
+
+def price_stats_grouping_id(grouped: set)-> int:
+    """Returns the GROUPING() value of the rows grouped by the given dimensions
+
+    Args:
+        grouped (set): Dimensions kept in the grouping, the others are rolled up
+
+    Returns:
+        grouping_id: Bit mask with a bit set for each rolled up dimension
+    """
+    last = len(PRICE_STATS_DIMENSIONS) - 1
+    return sum(
+        1 << (last - position)
+        for position, dimension in enumerate(PRICE_STATS_DIMENSIONS)
+        if dimension not in grouped
+    )
+
+
+def get_price_stats(
+    db: Session,
+    group_by: list = None,
+    brand: str = None,
+    model: str = None,
+    registrationyear: int = None,
+    vehicletype: str = None,
+    min_vehicles: int = 1,
+    limit: int = 100
+)->list[dict[str, Any]]:
+    """Reads price statistics from the materialized view
+
+    The statistics are grouped by the dimensions in 'group_by' and by every
+    filtered dimension, the other dimensions are aggregated over all values.
+
+    Args:
+        db (Session): Database connection session
+        group_by (list, optional): Dimensions to group by. Defaults to None (no grouping).
+        brand, model, vehicletype (str, optional): Exact match filters, 'unknown' for missing values. Default to None.
+        registrationyear (int, optional): Exact match filter. Defaults to None.
+        min_vehicles (int, optional): Groups with fewer vehicles are left out. Defaults to 1.
+        limit (int, optional): Maximum number of groups, largest first. Defaults to 100.
+
+    Returns:
+        price_stats: list of dictionaries with the dimensions of each group (None when
+        aggregated over all values) and its count, average, median, quartiles, min and max price
+    """
+    try:
+        filters = {"brand": brand, "model": model, "registrationyear": registrationyear, "vehicletype": vehicletype}
+        grouped = set(group_by or []) | {name for name, value in filters.items() if value is not None}
+        invalid = grouped - set(PRICE_STATS_DIMENSIONS)
+        if invalid:
+            raise ValueError(f"Invalid dimensions: {sorted(invalid)}")
+        logger.info(f"Reading price stats grouped by {sorted(grouped)}")
+        view = price_stats_view
+        query = (
+            select(view)
+            .where(view.c.grouping_id == price_stats_grouping_id(grouped))
+            .where(view.c.vehicles >= min_vehicles)
+        )
+        for name, value in filters.items():
+            if value is not None:
+                query = query.where(view.c[name] == value)
+        query = query.order_by(view.c.vehicles.desc(), *(view.c[name] for name in PRICE_STATS_DIMENSIONS)).limit(limit)
+        # plain str keys, the column names of a Table are quoted_name objects
+        columns = [str(name) for name in query.selected_columns.keys()]
+        stats = []
+        for row in db.execute(query):
+            group = dict(zip(columns, row))
+            del group["grouping_id"]
+            for name in PRICE_STATS_DIMENSIONS:
+                if name not in grouped:
+                    group[name] = None
+            stats.append(group)
+        logger.info(f"{len(stats)} price stats read")
+        return stats
+    except Exception as e:
+        logger.error(f"Error reading price stats: {e}")
+        return None
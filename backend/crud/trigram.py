@@ -0,0 +1,233 @@
+# This file contains the fuzzy typeahead on the brand and model of the vehicles
+# On postgres with the pg_trgm extension the matching runs on the database, backed
+# by trigram GIN indexes on the bronze table. Without pg_trgm (or on other databases)
+# a pure-Python trigram index over the distinct values is used, ranking the same way.
+
+import re
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import Float, Numeric, func, literal, or_, select
+from sqlalchemy.orm import Session
+from crud.models import VehicleModel
+from typing import Any
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+# Columns offered by the typeahead
+TRIGRAM_FIELDS = ("brand", "model")
+
+# Same defaults as pg_trgm.similarity_threshold and pg_trgm.word_similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+# Seconds the python index is kept before it is rebuilt from the database
+FALLBACK_INDEX_TTL = 300
+
+# Shortest query sent to the trigram indexes, a shorter one has too few trigrams to be
+# selective and is answered by the python index instead
+TRIGRAM_MIN_QUERY_LENGTH = 3
+
+CREATE_TRIGRAM_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS ix_bronze_car_data_{field}_trgm "
+    "ON bronze_car_data USING gin ({field} gin_trgm_ops)"
+)
+
+
+def trigrams(text: str)-> set:
+    """Splits a text into trigrams like pg_trgm
+
+    The text is lowercased and split into words of letters and digits, each word
+    is padded with two spaces in front and one behind.
+
+    Args:
+        text (str): Text to be split
+
+    Returns:
+        trigrams: Set of the trigrams of every word
+    """
+    result = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """In memory trigram index over distinct values, used when pg_trgm is not available
+
+    Args:
+        counts (dict): Number of vehicles for each distinct value
+    """
+    def __init__(self, counts: dict):
+        self.counts = counts
+        self.values = list(counts)
+        self.value_trigrams = [trigrams(value) for value in self.values]
+        self.postings = defaultdict(set)
+        for position, value_trigrams in enumerate(self.value_trigrams):
+            for trigram in value_trigrams:
+                self.postings[trigram].add(position)
+
+    def search(self, query: str, limit: int = 10)-> list[dict[str, Any]]:
+        """Returns the values similar to the query, best matches first
+
+        The score is the larger of the trigram similarity between query and value and
+        the share of the query trigrams found in the value, which lets prefixes match.
+
+        Args:
+            query (str): Text typed by the user
+            limit (int, optional): Maximum number of values. Defaults to 10.
+
+        Returns:
+            matches: list of dictionaries with the value, its score and its number of vehicles
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for position in self.postings.get(trigram, ()):
+                shared[position] += 1
+        matches = []
+        for position, common in shared.items():
+            similarity = common / len(query_trigrams | self.value_trigrams[position])
+            word_similarity = common / len(query_trigrams)
+            if similarity >= SIMILARITY_THRESHOLD or word_similarity >= WORD_SIMILARITY_THRESHOLD:
+                value = self.values[position]
+                matches.append({
+                    "value": value,
+                    "score": round(max(similarity, word_similarity), 4),
+                    "vehicles": self.counts[value]
+                })
+        matches.sort(key=lambda match: (-match["score"], -match["vehicles"], match["value"]))
+        return matches[:limit]
+
+
+def create_trigram_indexes(bind)-> bool:
+    """Enables pg_trgm and creates the trigram GIN indexes on brand and model
+
+    Args:
+        bind (Engine): Engine of the database
+
+    Returns:
+        created: False if the database is not postgres or pg_trgm could not be enabled
+    """
+    if bind.dialect.name != "postgresql":
+        return False
+    try:
+        with bind.begin() as conn:
+            conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for field in TRIGRAM_FIELDS:
+                conn.exec_driver_sql(CREATE_TRIGRAM_INDEX_SQL.format(field=field))
+        return True
+    except Exception as e:
+        logger.error(f"Trigram indexes not created, using the python index instead: {e}")
+        return False
+
+
+_pg_trgm_available = {}
+_fallback_indexes = {}
+_fallback_lock = threading.Lock()
+
+
+def pg_trgm_available(db: Session)-> bool:
+    """Tells whether the database of the session has the pg_trgm extension, checked once per engine
+
+    Args:
+        db (Session): Database connection session
+
+    Returns:
+        available: True if the typeahead can run on the database
+    """
+    bind = db.get_bind()
+    if bind not in _pg_trgm_available:
+        available = False
+        if bind.dialect.name == "postgresql":
+            query = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            available = db.connection().exec_driver_sql(query).first() is not None
+        _pg_trgm_available[bind] = available
+    return _pg_trgm_available[bind]
+
+
+def get_fallback_index(db: Session, field: str)-> TrigramIndex:
+    """Returns the python trigram index of a field, rebuilding it when it is older than FALLBACK_INDEX_TTL
+
+    Args:
+        db (Session): Database connection session
+        field (str): One of TRIGRAM_FIELDS
+
+    Returns:
+        trigram_index: Index over the distinct values of the field
+    """
+    with _fallback_lock:
+        built_at, index = _fallback_indexes.get(field, (None, None))
+        if index is None or time.monotonic() - built_at > FALLBACK_INDEX_TTL:
+            column = VehicleModel.__table__.c[field]
+            query = select(column, func.count()).where(column.isnot(None)).group_by(column)
+            index = TrigramIndex({value: count for value, count in db.execute(query)})
+            _fallback_indexes[field] = (time.monotonic(), index)
+        return index
+
+
+def typeahead_query(field: str, query: str, limit: int = 10):
+    """Builds the pg_trgm SELECT statement ranking the distinct values of a field
+
+    The matching rows are grouped by value in a subquery first, so the similarity is
+    computed once per distinct value and every matching vehicle is counted, then the
+    values are ranked and limited.
+
+    Args:
+        field (str): One of TRIGRAM_FIELDS
+        query (str): Text typed by the user
+        limit (int, optional): Maximum number of values. Defaults to 10.
+
+    Returns:
+        query: SELECT statement returning value, score and vehicles
+    """
+    column = VehicleModel.__table__.c[field]
+    text = literal(query)
+    matched = (
+        select(column.label("value"), func.count().label("vehicles"))
+        # both operators are served by the gin_trgm_ops indexes
+        .where(or_(column.op("%")(text), text.op("<%")(column)))
+        .group_by(column)
+        .subquery()
+    )
+    score = func.greatest(func.similarity(matched.c.value, text), func.word_similarity(text, matched.c.value))
+    return (
+        select(
+            matched.c.value,
+            func.round(score.cast(Numeric), 4).cast(Float).label("score"),
+            matched.c.vehicles
+        )
+        .order_by(score.desc(), matched.c.vehicles.desc(), matched.c.value)
+        .limit(limit)
+    )
+
+
+def typeahead(db: Session, field: str, query: str, limit: int = 10)->list[dict[str, Any]]:
+    """Finds the brands or models closest to a typed text, ignoring case and typos
+
+    Args:
+        db (Session): Database connection session
+        field (str): One of TRIGRAM_FIELDS
+        query (str): Text typed by the user
+        limit (int, optional): Maximum number of values. Defaults to 10.
+
+    Returns:
+        matches: list of dictionaries with the value, its score and its number of vehicles, best first
+    """
+    try:
+        logger.info(f"Typeahead on {field}: {query}")
+        if field not in TRIGRAM_FIELDS:
+            raise ValueError(f"Invalid typeahead field: {field}")
+        if len(query.strip()) >= TRIGRAM_MIN_QUERY_LENGTH and pg_trgm_available(db):
+            matches = [dict(zip(("value", "score", "vehicles"), row)) for row in db.execute(typeahead_query(field, query, limit))]
+        else:
+            matches = get_fallback_index(db, field).search(query, limit)
+        logger.info(f"{len(matches)} matches found")
+        return matches
+    except Exception as e:
+        logger.error(f"Error running typeahead: {e}")
+        return None
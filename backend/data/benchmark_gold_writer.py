@@ -0,0 +1,101 @@
+# This script benchmarks the writers of the gold table on a synthetic preprocessed dataset
+# It times DataFrame.to_sql (the previous writer) against data.gold_writer.write_gold_table
+# (COPY into a staging table and swap), both writing to a separate benchmark table,
+# and checks that both tables end up with the same rows. gold_car_data is not touched.
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from database.database import engine
+from data.gold_writer import write_gold_table
+
+BENCHMARK_TABLE = "gold_car_data_writer_benchmark"
+
+# One-hot columns of the preprocessed dataset
+DUMMY_COLUMNS = (
+    [f"gearbox_{value}" for value in ("auto", "manual", "unknown")]
+    + [f"fueltype_{value}" for value in ("cng", "diesel", "electric", "gasoline", "hybrid", "lpg", "other", "petrol", "unknown")]
+    + [f"notrepaired_{value}" for value in ("no", "unknown", "yes")]
+    + [f"vehicletype_{value}" for value in ("bus", "convertible", "coupe", "other", "sedan", "small", "suv", "unknown", "wagon")]
+)
+
+
+def synthetic_gold(rows: int)-> pd.DataFrame:
+    """Builds a DataFrame with the columns and dtypes of the preprocessed dataset
+
+    Args:
+        rows (int): Number of rows to be generated
+
+    Returns:
+        gold_df: Synthetic preprocessed rows
+    """
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "price": rng.integers(0, 20000, rows),
+        "registrationyear": rng.integers(1980, 2019, rows) / 2019,
+        "power": rng.integers(0, 300, rows) / 300,
+        "registrationmonth": rng.integers(0, 13, rows) / 12,
+        "numberofpictures": np.zeros(rows),
+        "postalcode": rng.integers(1000, 99999, rows) / 99999,
+        "mileage_censored": rng.choice([5000, 20000, 90000, 125000, 150000], rows) / 150000,
+    })
+    for column in DUMMY_COLUMNS:
+        df[column] = rng.integers(0, 2, rows)
+    df["brand_encoded"] = rng.integers(0, 40, rows)
+    df["model_encoded"] = rng.integers(0, 250, rows)
+    return df
+
+
+def run_benchmark(df: pd.DataFrame, chunksize: int = None)-> dict:
+    """Writes the DataFrame with both writers and returns their durations in seconds
+
+    Args:
+        df (pd.DataFrame): Rows to be written
+        chunksize (int, optional): to_sql rows per batch. Defaults to None (pandas default).
+
+    Returns:
+        durations: Seconds taken by each writer
+    """
+    durations = {}
+    start = time.perf_counter()
+    df.to_sql(BENCHMARK_TABLE, con=engine, if_exists='replace', index=False, chunksize=chunksize)
+    durations["to_sql"] = time.perf_counter() - start
+    to_sql_checksum = table_checksum()
+
+    start = time.perf_counter()
+    conn = engine.raw_connection()
+    try:
+        write_gold_table(conn, [df], table=BENCHMARK_TABLE)
+        conn.commit()
+    finally:
+        conn.close()
+    durations["copy"] = time.perf_counter() - start
+    if table_checksum() != to_sql_checksum:
+        raise AssertionError("The COPY writer and to_sql wrote different rows")
+    return durations
+
+
+def table_checksum()-> str:
+    """Returns the row count and an md5 of the ordered rows of the benchmark table"""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            f"SELECT count(*) || ':' || md5(string_agg(t::text, ',' ORDER BY id)) FROM {BENCHMARK_TABLE} t"
+        ).scalar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gold table writers")
+    parser.add_argument("--rows", type=int, default=300_000, help="number of synthetic rows")
+    parser.add_argument("--chunksize", type=int, default=None, help="to_sql rows per batch")
+    args = parser.parse_args()
+
+    try:
+        durations = run_benchmark(synthetic_gold(args.rows), args.chunksize)
+    finally:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}")
+    for writer, seconds in durations.items():
+        print(f"{writer:7s} {seconds:8.2f} s  {args.rows / seconds:10.0f} rows/s")
+    print(f"speedup {durations['to_sql'] / durations['copy']:.1f}x")
@@ -0,0 +1,121 @@
+# This script benchmarks the vehicle search queries on a large synthetic table
+# It copies the bronze table definition (with its indexes), fills it with
+# synthetic rows, and runs EXPLAIN ANALYZE on typical searches built by
+# crud.controller.vehicle_search_query. The bronze table itself is not touched.
+
+import argparse
+import json
+from sqlalchemy import MetaData, Table, text
+from database.database import engine
+from crud.controller import vehicle_search_query
+
+BENCHMARK_TABLE = "bronze_car_data_search_benchmark"
+
+# Typical searches from the frontend
+SEARCHES = {
+    "brand": dict(brand="volkswagen", limit=100),
+    "brand_model_year": dict(brand="volkswagen", model="golf", min_registrationyear=2005, max_registrationyear=2010),
+    "vehicletype_price_sorted": dict(vehicletype="suv", min_price=5000, max_price=10000, sort_by="price"),
+    "fuel_gearbox_cheapest": dict(fueltype="diesel", gearbox="auto", sort_by="price"),
+    "year_range_price_desc": dict(min_registrationyear=2012, max_registrationyear=2014, sort_by="price", descending=True),
+    "mileage_range": dict(min_mileage=5000, max_mileage=20000, sort_by="price"),
+    "price_range": dict(min_price=1000, max_price=1100),
+}
+
+
+def create_benchmark_table(rows: int):
+    """Creates the benchmark table with the bronze table indexes and fills it with synthetic rows
+
+    Args:
+        rows (int): Number of rows to be generated
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {BENCHMARK_TABLE} (LIKE bronze_car_data INCLUDING ALL)"))
+        conn.execute(text(f"""
+            INSERT INTO {BENCHMARK_TABLE}
+            SELECT
+                g,
+                timestamp '2016-03-01' + random() * interval '60 days',
+                (random() * 20000)::int,
+                (ARRAY['sedan','small','wagon','suv','bus','coupe','convertible','other'])[1 + (g % 8)],
+                (ARRAY['manual','auto'])[1 + (g % 7 % 2)],
+                (random() * 300)::int,
+                'model_' || (g % 250),
+                (ARRAY[5000,20000,90000,125000,150000])[1 + (g % 5)],
+                (random() * 12)::int,
+                1980 + (g % 39),
+                (ARRAY['petrol','gasoline','diesel','lpg','hybrid'])[1 + (g % 11 % 5)],
+                (ARRAY['volkswagen','bmw','opel','audi','ford','renault','peugeot','fiat'])[1 + (g % 13 % 8)],
+                (ARRAY['yes','no'])[1 + (g % 3 % 2)],
+                timestamp '2016-03-01' + random() * interval '60 days',
+                0,
+                10000 + (random() * 89999)::int,
+                timestamp '2016-03-01' + random() * interval '60 days'
+            FROM generate_series(1, :rows) AS g
+        """), {"rows": rows})
+        conn.execute(text(f"UPDATE {BENCHMARK_TABLE} SET model = 'golf' WHERE brand = 'volkswagen' AND model IN ('model_1', 'model_2')"))
+        conn.execute(text(f"ANALYZE {BENCHMARK_TABLE}"))
+
+
+def explain_search(conn, table, search: dict)-> tuple[float, list[str]]:
+    """Runs EXPLAIN ANALYZE for a search built by vehicle_search_query
+
+    Args:
+        conn (Connection): Database connection
+        table (Table): Table to be searched
+        search (dict): Arguments of vehicle_search_query
+
+    Returns:
+        execution_ms: Execution time of the search, in milliseconds
+        nodes: Node types of the plan, with the index name of the index scans
+    """
+    query = vehicle_search_query(table=table, **search)
+    compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = []
+    stack = [plan[0]["Plan"]]
+    while stack:
+        node = stack.pop()
+        nodes.append(node["Node Type"] + (f" on {node['Index Name']}" if "Index Name" in node else ""))
+        stack.extend(node.get("Plans", []))
+    return plan[0]["Execution Time"], nodes
+
+
+def run_benchmark(max_ms: float)-> bool:
+    """Runs EXPLAIN ANALYZE for every search and prints the plan and execution time
+
+    Args:
+        max_ms (float): Execution time budget for each search, in milliseconds
+
+    Returns:
+        passed: True if every search ran within the budget
+    """
+    table = Table(BENCHMARK_TABLE, MetaData(), autoload_with=engine)
+    passed = True
+    with engine.connect() as conn:
+        for name, search in SEARCHES.items():
+            execution_ms, nodes = explain_search(conn, table, search)
+            ok = execution_ms <= max_ms
+            passed = passed and ok
+            print(f"{'OK  ' if ok else 'SLOW'} {name}: {execution_ms:.2f} ms | {' > '.join(nodes)}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vehicle search queries")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="number of synthetic rows")
+    parser.add_argument("--max-ms", type=float, default=10.0, help="execution time budget per search")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark table")
+    args = parser.parse_args()
+
+    create_benchmark_table(args.rows)
+    try:
+        passed = run_benchmark(args.max_ms)
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}"))
+    raise SystemExit(0 if passed else 1)
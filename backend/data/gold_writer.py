@@ -0,0 +1,119 @@
+# This file contains the writer of the gold table
+# The preprocessed rows are streamed with COPY into a staging table, which then
+# replaces gold_car_data by a rename inside the same transaction. Readers keep
+# seeing the previous gold table until the commit, never an empty or partial one.
+
+import io
+import numpy as np
+import pandas as pd
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+GOLD_TABLE = 'gold_car_data'
+
+
+def postgres_type(dtype)-> str:
+    """Returns the postgres column type for a pandas dtype, like DataFrame.to_sql
+
+    Args:
+        dtype (dtype): pandas column dtype
+
+    Returns:
+        type: postgres type name
+    """
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'integer' if dtype.itemsize <= 4 else 'bigint'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'double precision'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'timestamp'
+    return 'text'
+
+
+def align_chunk(cursor, table: str, column_types: dict, chunk: pd.DataFrame)-> pd.DataFrame:
+    """Adapts a chunk to the column types of the staging table, created from the first chunk
+
+    A float column going into an integer column (a chunk with a missing value) is written
+    as nullable integers when its values are whole, otherwise the column becomes double precision.
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        table (str): Staging table name
+        column_types (dict): Postgres type of each staging column, updated in place
+        chunk (pd.DataFrame): Chunk to be copied
+
+    Returns:
+        chunk: The chunk with the columns in table order
+    """
+    chunk = chunk[list(column_types)]
+    for column, pg_type in column_types.items():
+        if pg_type in ('integer', 'bigint') and pd.api.types.is_float_dtype(chunk[column].dtype):
+            values = chunk[column].to_numpy()
+            finite = values[~np.isnan(values)]
+            if np.array_equal(finite, np.round(finite)):
+                chunk = chunk.assign(**{column: chunk[column].astype('Int64')})
+            else:
+                cursor.execute(f'ALTER TABLE {table} ALTER COLUMN "{column}" TYPE double precision;')
+                column_types[column] = 'double precision'
+    return chunk
+
+
+def copy_dataframe(cursor, table: str, df: pd.DataFrame):
+    """Streams a DataFrame into a table with COPY FROM STDIN in csv format
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        table (str): Target table, with the DataFrame columns
+        df (pd.DataFrame): Rows to be copied, missing values become NULL
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ', '.join(f'"{column}"' for column in df.columns)
+    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def write_gold_table(conn, chunks, table: str = GOLD_TABLE)-> int:
+    """Replaces the gold table with the given rows, loaded through a staging table
+
+    The staging table is created from the columns of the first chunk, filled with COPY,
+    given the unique index on id and renamed over the gold table. Everything runs in the
+    transaction of the connection and becomes visible when the caller commits.
+
+    Args:
+        conn (connection): Open psycopg2 connection
+        chunks (iterable): DataFrames with the same columns, a list with one DataFrame works too
+        table (str, optional): Table to be replaced. Defaults to GOLD_TABLE.
+
+    Raises:
+        ValueError: If there are no chunks to write
+
+    Returns:
+        rows_written: Number of rows in the new table
+    """
+    staging = f"{table}_staging"
+    cursor = conn.cursor()
+    column_types = None
+    rows_written = 0
+    for chunk in chunks:
+        if column_types is None:
+            column_types = {column: postgres_type(dtype) for column, dtype in chunk.dtypes.items()}
+            definition = ', '.join(f'"{column}" {pg_type}' for column, pg_type in column_types.items())
+            cursor.execute(f"DROP TABLE IF EXISTS {staging};")
+            cursor.execute(f"CREATE TABLE {staging} ({definition});")
+        copy_dataframe(cursor, staging, align_chunk(cursor, staging, column_types, chunk))
+        rows_written += len(chunk)
+    if column_types is None:
+        raise ValueError(f"No rows to write into {table}")
+    cursor.execute(f"CREATE UNIQUE INDEX ix_{staging}_id ON {staging} (id);")
+    cursor.execute(f"ANALYZE {staging};")
+    # the old table is only locked for the drop and the renames
+    cursor.execute(f"DROP TABLE IF EXISTS {table};")
+    cursor.execute(f"ALTER TABLE {staging} RENAME TO {table};")
+    cursor.execute(f"ALTER INDEX ix_{staging}_id RENAME TO ix_{table}_id;")
+    cursor.close()
+    logger.info(f"{rows_written} rows written into {table}")
+    return rows_written
@@ -0,0 +1,108 @@
+# This file contains the cache of the training data of the model
+# The gold table is read once per version into a CatBoost Pool, quantized and saved
+# on disk. The next trainings and tuning trials on the same version load the saved
+# pool instead of reading gold and quantizing every feature again. The version
+# changes whenever gold is replaced (new table file) or incrementally updated
+# (new watermark), and the pools of older versions are removed.
+
+import glob
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from catboost import Pool
+from dotenv import load_dotenv
+from data.gold_writer import GOLD_TABLE
+from logging_config import setup_logging
+
+load_dotenv()
+
+logger = setup_logging()
+
+POOL_CACHE_DIR = os.getenv("POOL_CACHE_DIR", "pool_cache")
+# pools of the most recent versions kept on disk
+POOL_CACHE_KEEP = int(os.getenv("POOL_CACHE_KEEP", "2"))
+LABEL_COLUMN = "price"
+
+
+def gold_version(conn)-> tuple[str, int, int]:
+    """Returns a hash identifying the current content of the gold table
+
+    Args:
+        conn (Connection): Connection of the transaction gold is read in
+
+    Returns:
+        version, filenode, max_id: Hash of the table file of gold and of its watermark, the table file and its largest id
+    """
+    filenode, max_id = conn.exec_driver_sql(f"SELECT pg_relation_filenode('{GOLD_TABLE}'), max(id) FROM {GOLD_TABLE}").fetchone()
+    watermark = conn.exec_driver_sql(
+        "SELECT snapshot_xmin, max_id, rows_upserted, rows_deleted, mode, updated_at "
+        "FROM elt_watermark WHERE table_name = %(table)s", {"table": GOLD_TABLE}
+    ).fetchone()
+    return hashlib.sha1(repr((filenode, tuple(watermark or ()))).encode()).hexdigest()[:16], filenode, max_id
+
+
+def pool_path(version: str)-> str:
+    """Returns the file of the quantized pool of a gold version"""
+    return os.path.join(POOL_CACHE_DIR, f"{GOLD_TABLE}_{version}.bin")
+
+
+def load_pool(path: str)-> Pool:
+    """Loads a quantized pool saved by gold_pool"""
+    return Pool(f"quantized://{path}")
+
+
+def gold_pool(engine)-> tuple[Pool, str, tuple[int, int]]:
+    """Returns the quantized training pool of the current gold table, built once per version
+
+    The features are the gold columns except price, which is the label, in the order of
+    the ids. Quantization borders are computed on the whole table. The version, the rows
+    and the snapshot returned are read in the same transaction, so the snapshot names
+    the rows of the pool even when gold is written meanwhile.
+
+    Args:
+        engine (Engine): Engine of the database
+
+    Raises:
+        ValueError: If the gold table is empty
+
+    Returns:
+        pool, path, snapshot: Quantized pool, the file it was loaded from or saved to, and the file node and largest id of its gold table
+    """
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn, conn.begin():
+        # taken before the snapshot: a full load cannot swap gold until the rows are read,
+        # and a swap committed while waiting is seen by the snapshot
+        conn.exec_driver_sql(f"LOCK TABLE {GOLD_TABLE} IN ACCESS SHARE MODE")
+        version, filenode, max_id = gold_version(conn)
+        path = pool_path(version)
+        if os.path.exists(path):
+            logger.info(f"Training pool of gold version {version} loaded from {path}")
+            return load_pool(path), path, (filenode, max_id)
+        data = pd.read_sql(f"SELECT * FROM {GOLD_TABLE} ORDER BY id", conn)
+    if data.empty:
+        raise ValueError(f"No rows in {GOLD_TABLE} to train the model on")
+    pool = Pool(data.drop(columns=[LABEL_COLUMN]), data[LABEL_COLUMN])
+    pool.quantize()
+    os.makedirs(POOL_CACHE_DIR, exist_ok=True)
+    # written aside and renamed, a concurrent training never loads a partial file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    pool.save(temporary_path)
+    os.replace(temporary_path, path)
+    remove_old_pools(keep=path)
+    logger.info(f"Training pool of gold version {version} with {len(data)} rows saved to {path}")
+    # the saved pool is returned, the first fit on a version then matches the later ones
+    return load_pool(path), path, (filenode, max_id)
+
+
+def remove_old_pools(keep: str):
+    """Removes the saved pools beyond the POOL_CACHE_KEEP most recent ones, never the one given"""
+    paths = sorted(glob.glob(pool_path("*")), key=os.path.getmtime, reverse=True)
+    for path in paths[POOL_CACHE_KEEP:]:
+        if path != keep:
+            os.remove(path)
+            logger.info(f"Training pool {path} removed")
+
+
+def pool_labels(pool: Pool)-> np.ndarray:
+    """Returns the labels of a pool as floats, a loaded quantized pool gives them as strings"""
+    return np.asarray(pool.get_label(), dtype=float)
@@ -1,47 +1,318 @@
 import csv
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import numpy as np
+from crud.partitions import crawl_months, ensure_monthly_partitions, is_partitioned
+from logging_config import setup_logging
 
-# Define your CSV file and the output SQL file
-csv_file = 'data/car_data.csv' 
-sql_file = 'raw_car_data.sql'
+logger = setup_logging()
+
+# Define your CSV file and the target table
+csv_file = 'data/car_data.csv'
 table_name = 'bronze_car_data'
 
+# Number of csv rows sent to postgres on each COPY
+chunk_size = 50000
+
+# Size of the byte ranges parsed by each worker in parallel mode
+chunk_bytes = 8 * 1024 * 1024
+
 # Define the columns that need datetime formatting
 datetime_columns = ['DateCrawled', 'DateCreated', 'LastSeen']
-string_columns = ['VehicleType', 'Gearbox', 'Model', 'FuelType', 'Brand', 'NotRepaired']
-
-# Open the CSV file and the SQL file
-with open(csv_file, 'r', newline='', encoding='utf-8') as csvfile, open(sql_file, 'w', encoding='utf-8') as sqlfile:
-    reader = csv.DictReader(csvfile)
-    headers = reader.fieldnames  # Get the header row
-
-    # Write the INSERT statements
-    for row in reader:
-        values = []
-        for col in headers:
-            value = row[col]
-            if value == '':
-                values.append('NULL')  # Handle empty values as NULL
-            elif col in datetime_columns:
-                # Parse and reformat datetime columns
-                try:
-                    parsed_date = datetime.strptime(value, '%d/%m/%Y %H:%M')  
-                    formatted_date = parsed_date.strftime('%Y-%m-%d %H:%M:%S')  # Format for PostgreSQL
-                    values.append(f"'{formatted_date}'")
-                except ValueError:
-                    # Handle invalid datetime formats gracefully
-                    values.append('NULL')
-            elif col in string_columns:
-                try:
-                    values.append(f"'{value}'")
-                except ValueError:
-                    values.append('NULL')
-            else:
-                # Keep non-empty values as they are
-                values.append(value)
-
-        # Join the values into a single string
-        values_str = ','.join(values)
-        sqlfile.write(f"INSERT INTO {table_name} ({','.join(headers)}) VALUES ({values_str});\n")
-
-print(f"SQL file '{sql_file}' has been created.")
+
+# Column the partitioned bronze table is split on, by month
+partition_column = 'DateCrawled'
+
+
+def format_date(value: str):
+    """Converts a date from the csv layout into the postgres timestamp layout
+
+    Args:
+        value (str): Date in the '%d/%m/%Y %H:%M' format
+
+    Returns:
+        formatted_date: Date in the '%Y-%m-%d %H:%M:%S' format or None if invalid
+    """
+    try:
+        parsed_date = datetime.strptime(value, '%d/%m/%Y %H:%M')
+        return parsed_date.strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        # Handle invalid datetime formats gracefully
+        return None
+
+
+def format_dates_vectorized(values: list)-> list:
+    """Converts a column of dates from the csv layout into the postgres timestamp layout
+
+    Dates in the fixed 'dd/mm/YYYY HH:MM' layout are rearranged as a character
+    matrix and parsed at once as numpy datetime64. Anything else falls back to format_date.
+
+    Args:
+        values (list): Dates as read from the csv, empty strings for missing values
+
+    Returns:
+        formatted_dates: Dates in the '%Y-%m-%d %H:%M:%S' format, None if invalid, '' if missing
+    """
+    arr = np.asarray(values, dtype=str)
+    result = np.array(values, dtype=object)
+    fixed = np.char.str_len(arr) == 16
+    chars = arr[fixed].astype('U16').view('U1').reshape(-1, 16)
+    layout_ok = (
+        (chars[:, 2] == '/') & (chars[:, 5] == '/') & (chars[:, 10] == ' ') & (chars[:, 13] == ':')
+    )
+    fixed[fixed] = layout_ok
+    chars = chars[layout_ok]
+    # dd/mm/YYYY HH:MM -> YYYY-mm-ddTHH:MM
+    iso = chars[:, [6, 7, 8, 9, 2, 3, 4, 5, 0, 1, 10, 11, 12, 13, 14, 15]].copy()
+    iso[:, [4, 7]] = '-'
+    iso[:, 10] = 'T'
+    iso = iso.view('U16').ravel()
+    try:
+        parsed = np.array(iso, dtype='datetime64[m]')
+        formatted = np.char.replace(np.datetime_as_string(parsed, unit='s'), 'T', ' ')
+        result[fixed] = formatted.tolist()
+    except ValueError:
+        # at least one impossible date in the chunk, parse it value by value
+        fixed[:] = False
+    for i in np.flatnonzero(~fixed):
+        if values[i] != '':
+            result[i] = format_date(values[i])
+    return result.tolist()
+
+
+def read_csv_chunks(csv_path: str = csv_file, size: int = chunk_size, start_offset: int = 0):
+    """Reads the csv file in chunks with the dates already converted
+
+    Args:
+        csv_path (str, optional): Path to the raw csv file. Defaults to csv_file.
+        size (int, optional): Number of rows per chunk. Defaults to chunk_size.
+        start_offset (int, optional): Byte offset to resume reading from. Defaults to 0 (start of the file).
+
+    Yields:
+        headers, rows, end_offset: csv header, a list with at most 'size' converted rows
+        and the byte offset right after the last row of the chunk
+    """
+    with open(csv_path, 'rb') as csvfile:
+        headers = next(csv.reader([csvfile.readline().decode('utf-8-sig')]))
+        if start_offset:
+            csvfile.seek(start_offset)
+        offset = csvfile.tell()
+
+        # the reader only pulls the lines it needs, so after each row
+        # the offset points exactly at the start of the next row
+        def lines():
+            nonlocal offset
+            for line in csvfile:
+                offset += len(line)
+                yield line.decode('utf-8')
+
+        reader = csv.reader(lines())
+        date_indexes = [i for i, col in enumerate(headers) if col in datetime_columns]
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == size:
+                yield headers, convert_dates(rows, date_indexes), offset
+                rows = []
+        if rows:
+            yield headers, convert_dates(rows, date_indexes), offset
+
+
+def convert_dates(rows: list, date_indexes: list)-> list:
+    """Converts the date columns of a chunk of csv rows in place
+
+    Args:
+        rows (list): csv rows
+        date_indexes (list): Positions of the date columns
+
+    Returns:
+        rows: The same rows with the dates in the postgres timestamp layout
+    """
+    for i in date_indexes:
+        dates = format_dates_vectorized([row[i] for row in rows])
+        for row, value in zip(rows, dates):
+            row[i] = value
+    return rows
+
+
+def copy_rows(cursor, headers: list, rows: list):
+    """Sends a chunk of rows to the bronze table using COPY FROM STDIN
+
+    Args:
+        cursor (cursor): psycopg2 cursor of an open connection
+        headers (list): csv column names, matching the bronze table columns
+        rows (list): rows to be copied
+    """
+    buffer = io.StringIO()
+    # empty and None values are written unquoted and become NULL on COPY
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table_name} ({','.join(headers)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def stream_csv_into_bronze(conn, csv_path: str = csv_file, size: int = chunk_size,
+                           start_offset: int = 0, checkpoint=None)-> int:
+    """Streams the raw csv file into the bronze table in bounded chunks
+
+    Each chunk is committed on its own, so an interrupted load can be resumed
+    from the byte offset of the last committed chunk. When the bronze table is
+    partitioned, the monthly partitions of each chunk are created before its COPY.
+
+    Args:
+        conn (connection): Open psycopg2 connection
+        csv_path (str, optional): Path to the raw csv file. Defaults to csv_file.
+        size (int, optional): Number of rows per COPY. Defaults to chunk_size.
+        start_offset (int, optional): Byte offset to resume from. Defaults to 0.
+        checkpoint (callable, optional): Called as checkpoint(cursor, rows, end_offset)
+            after each COPY, inside the same transaction. Defaults to None.
+
+    Returns:
+        rows_loaded: Number of rows copied into the bronze table
+    """
+    start = time.perf_counter()
+    rows_loaded = 0
+    with conn.cursor() as cursor:
+        partitioned = is_partitioned(cursor)
+        for headers, rows, end_offset in read_csv_chunks(csv_path, size, start_offset):
+            if partitioned:
+                ensure_monthly_partitions(cursor, crawl_months(rows, headers.index(partition_column)))
+            copy_rows(cursor, headers, rows)
+            if checkpoint is not None:
+                checkpoint(cursor, len(rows), end_offset)
+            conn.commit()
+            rows_loaded += len(rows)
+            elapsed = time.perf_counter() - start
+            logger.info(f"{rows_loaded} rows copied ({rows_loaded / elapsed:.0f} rows/s)")
+    elapsed = time.perf_counter() - start
+    logger.info(f"{rows_loaded} rows loaded into {table_name} in {elapsed:.1f}s "
+                f"({rows_loaded / max(elapsed, 1e-9):.0f} rows/s)")
+    print(f"{rows_loaded} rows loaded into {table_name} in {elapsed:.1f}s "
+          f"({rows_loaded / max(elapsed, 1e-9):.0f} rows/s)")
+    return rows_loaded
+
+
+def read_csv_header(csv_path: str = csv_file):
+    """Reads the csv header and the byte offset where the data rows start
+
+    Args:
+        csv_path (str, optional): Path to the raw csv file. Defaults to csv_file.
+
+    Returns:
+        headers, data_offset: csv column names and the offset of the first data row
+    """
+    with open(csv_path, 'rb') as csvfile:
+        headers = next(csv.reader([csvfile.readline().decode('utf-8-sig')]))
+        return headers, csvfile.tell()
+
+
+def split_byte_ranges(csv_path: str, start_offset: int, size: int = chunk_bytes):
+    """Splits the csv data into byte ranges aligned to line boundaries
+
+    Fields with embedded line breaks are not supported, every line must be a full row.
+
+    Args:
+        csv_path (str): Path to the raw csv file
+        start_offset (int): Byte offset of the first row to be read
+        size (int, optional): Approximate size of each range. Defaults to chunk_bytes.
+
+    Yields:
+        start, end: Byte offsets of each range
+    """
+    file_size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as csvfile:
+        start = start_offset
+        while start < file_size:
+            csvfile.seek(min(start + size, file_size))
+            csvfile.readline()
+            end = min(csvfile.tell(), file_size)
+            yield start, end
+            start = end
+
+
+def parse_byte_range(task: tuple)-> tuple:
+    """Parses one byte range of the csv file into COPY ready csv text
+
+    Runs inside the worker processes of stream_csv_into_bronze_parallel.
+
+    Args:
+        task (tuple): csv path, csv headers, start and end byte offsets
+
+    Returns:
+        copy_text, rows, end, months: csv text with converted dates, number of rows,
+        end offset and the months of the crawl dates
+    """
+    csv_path, headers, start, end = task
+    with open(csv_path, 'rb') as csvfile:
+        csvfile.seek(start)
+        text = csvfile.read(end - start).decode('utf-8')
+    rows = list(csv.reader(io.StringIO(text)))
+    date_indexes = [i for i, col in enumerate(headers) if col in datetime_columns]
+    convert_dates(rows, date_indexes)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue(), len(rows), end, crawl_months(rows, headers.index(partition_column))
+
+
+def stream_csv_into_bronze_parallel(conn, csv_path: str = csv_file, workers: int = None,
+                                    start_offset: int = 0, checkpoint=None)-> int:
+    """Streams the raw csv file into the bronze table parsing chunks on a process pool
+
+    The file is split into byte ranges aligned to line boundaries. Workers parse the ranges
+    and convert the dates, and the chunks are copied into the bronze table in file order,
+    each one committed on its own (with its monthly partitions) like in stream_csv_into_bronze.
+
+    Args:
+        conn (connection): Open psycopg2 connection
+        csv_path (str, optional): Path to the raw csv file. Defaults to csv_file.
+        workers (int, optional): Number of worker processes. Defaults to the number of cores.
+        start_offset (int, optional): Byte offset to resume from. Defaults to 0.
+        checkpoint (callable, optional): Called as checkpoint(cursor, rows, end_offset)
+            after each COPY, inside the same transaction. Defaults to None.
+
+    Returns:
+        rows_loaded: Number of rows copied into the bronze table
+    """
+    workers = workers or os.cpu_count()
+    headers, data_offset = read_csv_header(csv_path)
+    ranges = split_byte_ranges(csv_path, max(start_offset, data_offset))
+    copy_sql = f"COPY {table_name} ({','.join(headers)}) FROM STDIN WITH (FORMAT csv)"
+    start = time.perf_counter()
+    rows_loaded = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, conn.cursor() as cursor:
+        partitioned = is_partitioned(cursor)
+        # keep a bounded number of parsed chunks in flight so memory stays flat
+        pending = deque()
+        for byte_range in ranges:
+            pending.append(pool.submit(parse_byte_range, (csv_path, headers, *byte_range)))
+            if len(pending) < workers * 2:
+                continue
+            rows_loaded += _copy_parsed_chunk(conn, cursor, copy_sql, pending.popleft().result(), checkpoint, partitioned)
+            elapsed = time.perf_counter() - start
+            logger.info(f"{rows_loaded} rows copied ({rows_loaded / elapsed:.0f} rows/s)")
+        while pending:
+            rows_loaded += _copy_parsed_chunk(conn, cursor, copy_sql, pending.popleft().result(), checkpoint, partitioned)
+    elapsed = time.perf_counter() - start
+    logger.info(f"{rows_loaded} rows loaded into {table_name} in {elapsed:.1f}s "
+                f"({rows_loaded / max(elapsed, 1e-9):.0f} rows/s) using {workers} workers")
+    print(f"{rows_loaded} rows loaded into {table_name} in {elapsed:.1f}s "
+          f"({rows_loaded / max(elapsed, 1e-9):.0f} rows/s) using {workers} workers")
+    return rows_loaded
+
+
+def _copy_parsed_chunk(conn, cursor, copy_sql: str, parsed: tuple, checkpoint, partitioned: bool)-> int:
+    """Copies one parsed chunk into the bronze table and commits it with its checkpoint"""
+    copy_text, rows, end_offset, months = parsed
+    if partitioned:
+        ensure_monthly_partitions(cursor, months)
+    cursor.copy_expert(copy_sql, io.StringIO(copy_text))
+    if checkpoint is not None:
+        checkpoint(cursor, rows, end_offset)
+    conn.commit()
+    return rows
@@ -1,86 +1,183 @@
-import subprocess
+import os
+import hashlib
 import psycopg2
+import psycopg2.pool
 import time
+import uuid
 from logging_config import setup_logging
+from data.raw_data_loader import stream_csv_into_bronze, stream_csv_into_bronze_parallel
+from crud.stats import PRICE_STATS_VIEW, refresh_price_stats
 
 
 logger = setup_logging()
 
 # Database connection details
-DB_HOST = "host.docker.internal"
-DB_PORT = "55432"
-DB_NAME = "rusty_bargain"
-DB_USER = "user"
-DB_PASSWORD = "password"
-SQL_FILE_PATH = "raw_car_data.sql"
-
-def run_generate_sql_script():
-    """Run the script to generate the .sql file.
+DB_HOST = os.getenv("SEED_DB_HOST", "host.docker.internal")
+DB_PORT = os.getenv("SEED_DB_PORT", "55432")
+DB_NAME = os.getenv("SEED_DB_NAME", "rusty_bargain")
+DB_USER = os.getenv("SEED_DB_USER", "user")
+DB_PASSWORD = os.getenv("SEED_DB_PASSWORD", "password")
+CSV_FILE_PATH = "data/car_data.csv"
+
+# Connections kept by the seeder pool, shared by the table polling and the load
+SEED_POOL_SIZE = int(os.getenv("SEED_POOL_SIZE", "2"))
+
+# Worker processes used to parse the csv, 1 keeps the single process loader
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", "1"))
+
+# pool created on first use, the database may not accept connections yet at import time
+_connection_pool = None
+
+def get_connection_pool()-> psycopg2.pool.ThreadedConnectionPool:
+    """Returns the connection pool of the seeder, creating it on the first call
+
+    Returns:
+        connection_pool: psycopg2 pool with at most SEED_POOL_SIZE connections
     """
-    try:
-        logger.info("Running raw_data_loader.py to create the .sql file...")
-        print("Running raw_data_loader.py to create the .sql file...")
-        subprocess.run(["python", "data/raw_data_loader.py"], check=True, capture_output=True, text=True)
-        logger.info(".sql file generated successfully")
-        print(".sql file generated successfully")
-    except subprocess.CalledProcessError as e:
-        logger.error("Failed to run raw_data_loader.py: {e.stderr}")
-        print(f"Failed to run raw_data_loader.py: {e.stderr}")
-        raise
-
-def execute_sql_file():
-    """Run the .sql file to populate the database."""
-    try:
-        logger.info("Seeding the database...")
-        conn = psycopg2.connect(
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = psycopg2.pool.ThreadedConnectionPool(
+            1,
+            SEED_POOL_SIZE,
             host=DB_HOST,
             port=DB_PORT,
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD
         )
+    return _connection_pool
+
+def release_connection(conn, failed: bool = False):
+    """Returns a connection to the seeder pool
+
+    Args:
+        conn (connection): Connection taken from the pool
+        failed (bool, optional): Discard the connection instead of reusing it. Defaults to False.
+    """
+    if not failed and not conn.closed:
+        conn.rollback()
+    get_connection_pool().putconn(conn, close=failed or bool(conn.closed))
+
+def compute_file_hash(path: str)-> str:
+    """Computes the sha256 hash of a file reading it in blocks
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        file_hash: Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def seed_bronze_table():
+    """Stream the raw csv file into the bronze table using COPY.
+
+    Progress is recorded in the ingest_manifest table after every chunk, so a
+    file that was already loaded is skipped and an interrupted load continues
+    from the last committed chunk.
+    """
+    conn = None
+    failed = False
+    try:
+        logger.info("Seeding the database...")
+        print("Seeding the database...")
+        conn = get_connection_pool().getconn()
+        file_hash = compute_file_hash(CSV_FILE_PATH)
         cursor = conn.cursor()
-        with open(SQL_FILE_PATH, "r") as f:
-            cursor.execute(f.read())
+        # only one seeder at a time may load files
+        cursor.execute("SELECT pg_advisory_lock(hashtext('ingest_manifest'));")
+        cursor.execute(
+            "SELECT batch_id, rows_loaded, byte_offset, status FROM ingest_manifest WHERE file_hash = %s;",
+            (file_hash,)
+        )
+        entry = cursor.fetchone()
+        if entry is not None and entry[3] == "complete":
+            logger.info(f"{CSV_FILE_PATH} already loaded in batch {entry[0]}, skipping.")
+            print(f"{CSV_FILE_PATH} already loaded in batch {entry[0]}, skipping.")
+            return
+        if entry is None:
+            batch_id = uuid.uuid4().hex
+            start_offset = 0
+            cursor.execute(
+                "INSERT INTO ingest_manifest "
+                "(file_name, file_hash, batch_id, rows_loaded, byte_offset, status, started_at, updated_at) "
+                "VALUES (%s, %s, %s, 0, 0, 'loading', now(), now());",
+                (CSV_FILE_PATH, file_hash, batch_id)
+            )
+            conn.commit()
+        else:
+            batch_id, rows_loaded, start_offset, _ = entry
+            logger.info(f"Resuming batch {batch_id} after {rows_loaded} rows.")
+            print(f"Resuming batch {batch_id} after {rows_loaded} rows.")
+
+        def checkpoint(chunk_cursor, rows: int, end_offset: int):
+            chunk_cursor.execute(
+                "UPDATE ingest_manifest SET rows_loaded = rows_loaded + %s, byte_offset = %s, "
+                "updated_at = now() WHERE file_hash = %s;",
+                (rows, end_offset, file_hash)
+            )
+
+        if SEED_WORKERS > 1:
+            stream_csv_into_bronze_parallel(
+                conn, CSV_FILE_PATH, workers=SEED_WORKERS, start_offset=start_offset, checkpoint=checkpoint
+            )
+        else:
+            stream_csv_into_bronze(conn, CSV_FILE_PATH, start_offset=start_offset, checkpoint=checkpoint)
+        cursor.execute(
+            "UPDATE ingest_manifest SET status = 'complete', updated_at = now() WHERE file_hash = %s;",
+            (file_hash,)
+        )
+        conn.commit()
+        refresh_price_stats(cursor)
         conn.commit()
-        print("Database seeded successfully.")
         cursor.close()
-        conn.close()
-        logger.info("Database seeded successfully.")
+        logger.info(f"Database seeded successfully (batch {batch_id}).")
+        print(f"Database seeded successfully (batch {batch_id}).")
     except Exception as e:
-        logger.error("Failed to seed the database: {e}")
+        failed = True
+        logger.error(f"Failed to seed the database: {e}")
         print(f"Failed to seed the database: {e}")
+    finally:
+        if conn is not None:
+            if not failed:
+                # the advisory lock belongs to the session, which stays open in the pool
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(hashtext('ingest_manifest'));")
+            release_connection(conn, failed)
 
 def wait_for_table():
-    """Wait until the target table is created by SQLAlchemy."""
+    """Wait until the target tables are created by SQLAlchemy."""
     while True:
+        conn = None
         try:
             logger.info("Checking if the table exists...")
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD
-            )
-            cursor = conn.cursor()
-            cursor.execute("SELECT to_regclass('public.bronze_car_data');")
-            result = cursor.fetchone()
-            if result and result[0] is not None:
+            conn = get_connection_pool().getconn()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT to_regclass('public.bronze_car_data'), to_regclass('public.ingest_manifest'), "
+                    "to_regclass(%s);",
+                    (f"public.{PRICE_STATS_VIEW}",)
+                )
+                result = cursor.fetchone()
+            release_connection(conn)
+            if result and None not in result:
                 logger.info("Table exists. Proceeding with seeding.")
                 print("Table exists. Proceeding with seeding.")
-                cursor.close()
-                conn.close()
                 break
             else:
                 logger.info("Waiting for the table to be created...")
                 print("Waiting for the table to be created...")
         except Exception as e:
-            logger.error("Database not ready: {e}")
+            logger.error(f"Database not ready: {e}")
             print(f"Database not ready: {e}")
+            if conn is not None:
+                release_connection(conn, failed=True)
         time.sleep(5)
 
 if __name__ == "__main__":
     wait_for_table()
-    run_generate_sql_script()
-    execute_sql_file()
+    seed_bronze_table()
@@ -0,0 +1,24 @@
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from database.database import DATABASE_URL, DB_STATEMENT_TIMEOUT_MS, POOL_OPTIONS
+from database.pool import TimedAsyncAdaptedQueuePool
+
+# Same database as the sync engine, through the asyncpg driver
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+# Creating the async engine and session
+connect_args = {}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, poolclass=TimedAsyncAdaptedQueuePool, connect_args=connect_args, **POOL_OPTIONS
+)
+# objects stay readable after commit, refreshing them would need another await
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# funcion to get async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,63 @@
+# This file contains the postgres advisory locks of the ELT and training runs
+# The locks are held by a session of the database, so they exclude the runs of every
+# uvicorn worker, background job and command line script, not only the threads of one
+# process, and postgres releases them if the process holding them dies. Each lock is
+# held on its own autocommit connection, which keeps no transaction open meanwhile.
+
+from contextlib import contextmanager
+from database.database import engine
+
+# gold table and the preprocessing state fitted with it (label encoders, scaler...)
+GOLD_LOCK = "gold_car_data"
+# model.pkl, model_info.json and best_params.json
+MODEL_LOCK = "model_training"
+
+
+class LockNotAvailable(Exception):
+    """Raised when a lock is held by another session and the caller does not wait for it"""
+
+
+@contextmanager
+def advisory_locks(locks: list[tuple[str, bool]], wait: bool = True):
+    """Holds postgres session advisory locks while the block runs
+
+    The locks are taken in the given order and released in the reverse one. Like in
+    seeder.py, the lock key is the hashtext of the name.
+
+    Args:
+        locks (list[tuple[str, bool]]): Name of each lock and whether it is taken shared
+        wait (bool, optional): Wait for the locks instead of raising. Defaults to True.
+
+    Raises:
+        LockNotAvailable: If wait is False and another session holds one of the locks
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = []
+        try:
+            if wait:
+                # a training can wait longer than the statement timeout of the pool
+                conn.exec_driver_sql("SET statement_timeout = 0")
+            for name, shared in locks:
+                suffix = "_shared" if shared else ""
+                if wait:
+                    conn.exec_driver_sql(f"SELECT pg_advisory_lock{suffix}(hashtext(%(name)s))", {"name": name})
+                elif not conn.exec_driver_sql(
+                    f"SELECT pg_try_advisory_lock{suffix}(hashtext(%(name)s))", {"name": name}
+                ).scalar():
+                    raise LockNotAvailable(f"{name} is in use by another run, try again when it is finished")
+                acquired.append((name, suffix))
+            yield
+        finally:
+            for name, suffix in reversed(acquired):
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock{suffix}(hashtext(%(name)s))", {"name": name})
+            conn.exec_driver_sql("RESET statement_timeout")
+
+
+def gold_write_lock(wait: bool = True):
+    """Lock of the runs writing the gold table: full loads and incremental updates"""
+    return advisory_locks([(GOLD_LOCK, False)], wait)
+
+
+def training_lock(wait: bool = True):
+    """Lock of the runs writing the model: one at a time, and gold is not written while they read it"""
+    return advisory_locks([(MODEL_LOCK, False), (GOLD_LOCK, True)], wait)
@@ -0,0 +1,78 @@
+# This file contains the connection pools used by the engines and their statistics
+# The pools are the SQLAlchemy queue pools, timing how long each checkout waits for
+# a connection, so the pool size can be checked against the number of workers.
+
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class TimedPoolMixin:
+    """Counts the checkouts of a queue pool and the time spent waiting on them
+
+    The wait includes opening a new connection when the pool is empty
+    but still below its overflow limit.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    """QueuePool of the sync engine with checkout wait statistics"""
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    """Queue pool of the async engine with checkout wait statistics"""
+
+
+def pool_stats(engine)-> dict:
+    """Returns the usage counters of the pool of an engine
+
+    Args:
+        engine (Engine): Sync engine or the sync_engine of an async engine
+
+    Returns:
+        pool_stats: Pool size, connections in use, overflow and checkout wait times
+    """
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # negative while the pool has not opened all of its connections yet
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    if isinstance(pool, TimedPoolMixin):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "wait_seconds_total": round(pool.wait_seconds, 6),
+            "wait_ms_avg": round(1000 * pool.wait_seconds / pool.checkouts, 3) if pool.checkouts else 0.0,
+            "wait_ms_max": round(1000 * pool.max_wait_seconds, 3),
+        })
+    return stats
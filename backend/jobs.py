@@ -0,0 +1,235 @@
+# This file contains the background runner of the ELT and training jobs
+# A job is a list of stages (preprocess and load, train...) run one after the other on a
+# bounded thread pool. The API answers with the job id at once, and the status, the
+# stage timings and the result are polled with /jobs/{id} instead of holding a request
+# open for the whole run. Jobs are kept in the memory of the worker process, while the
+# gold and model writes are serialized across processes by postgres advisory locks.
+
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from ELT import (
+    load_model,
+    train_model_and_create_file,
+    retrain_incrementally,
+    run_elt_pipeline,
+    PREPROCESS_CHUNK_SIZE,
+    update_gold_incrementally
+)
+from tuning import tune_hyperparameters
+from database.locks import gold_write_lock, training_lock
+from logging_config import setup_logging
+
+load_dotenv()
+
+logger = setup_logging()
+
+# jobs running at the same time, the others wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# finished jobs kept for polling, the oldest ones are forgotten first
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+## job stages, each one gets the parameters of the job
+## one gold table writer and one training at a time in every process, a second one waits
+## for the lock instead of racing on the gold swap or the model files
+def preprocess_and_load_stage(context: dict)-> dict:
+    with gold_write_lock():
+        return run_elt_pipeline(start=context["start"], end=context["end"], chunksize=context["chunksize"])
+
+def preprocess_and_load_chunked_stage(context: dict)-> dict:
+    with gold_write_lock():
+        return run_elt_pipeline(
+            start=context["start"], end=context["end"], chunksize=context["chunksize"] or PREPROCESS_CHUNK_SIZE
+        )
+
+def update_gold_incremental_stage(context: dict)-> dict:
+    with gold_write_lock():
+        return update_gold_incrementally()
+
+def train_stage(context: dict)-> dict:
+    with training_lock():
+        mse, importance_df = train_model_and_create_file()
+    return {"mse": mse, "feature_importance": importance_df.to_dict(orient='records')}
+
+def warm_start_stage(context: dict)-> dict:
+    with training_lock():
+        return retrain_incrementally()
+
+def tune_stage(context: dict)-> dict:
+    with training_lock():
+        summary = tune_hyperparameters()
+    return {"best_params": summary["params"], "cv_rmse": summary["rmse"], "trials_completed": summary["trials_completed"]}
+
+def load_model_stage(context: dict)-> dict:
+    load_model()
+    return {}
+
+
+# stages of each kind of job
+JOB_KINDS = {
+    "preprocess_load": [("preprocess_and_load", preprocess_and_load_stage)],
+    "preprocess_load_chunked": [("preprocess_and_load", preprocess_and_load_chunked_stage)],
+    "update_gold_incremental": [("update_gold", update_gold_incremental_stage)],
+    "train": [("train", train_stage), ("load_model", load_model_stage)],
+    "retrain": [
+        ("preprocess_and_load", preprocess_and_load_stage),
+        ("train", train_stage),
+        ("load_model", load_model_stage)
+    ],
+    # loads the bronze changes, then continues training the current model on them
+    "retrain_incremental": [
+        ("update_gold", update_gold_incremental_stage),
+        ("warm_start", warm_start_stage),
+        ("load_model", load_model_stage)
+    ],
+    # searches the parameters, then trains the model with them
+    "tune": [("tune", tune_stage), ("train", train_stage), ("load_model", load_model_stage)],
+}
+# at most one of these runs at a time in the worker, whatever its kind
+TRAINING_KINDS = {"train", "retrain", "retrain_incremental", "tune"}
+
+
+class Job:
+    """A submitted job with the status and timings of its stages
+
+    Args:
+        kind (str): One of JOB_KINDS
+        params (dict): start, end and chunksize of the preprocessing
+    """
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.stages = [{"name": name, "status": QUEUED, "seconds": None} for name, _ in JOB_KINDS[kind]]
+        self.result = {}
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self)-> dict:
+        done = sum(stage["status"] == SUCCEEDED for stage in self.stages)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": dict(self.params),
+            "status": self.status,
+            "progress": done / len(self.stages),
+            "stages": [dict(stage) for stage in self.stages],
+            "result": dict(self.result),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRunner:
+    """Runs the jobs on a bounded thread pool and keeps their state for polling
+
+    A job submitted while the same job (same kind and parameters) is still queued
+    or running is not started again, the running one is returned instead. The same
+    goes for training jobs of any kind, so that a single model is trained at a time.
+
+    Args:
+        max_workers (int): Jobs running at the same time
+        history (int): Finished jobs kept for polling
+    """
+    def __init__(self, max_workers: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: dict)-> tuple[dict, bool]:
+        """Queues a job unless an equivalent one is already queued or running
+
+        Args:
+            kind (str): One of JOB_KINDS
+            params (dict): Parameters of the job
+
+        Raises:
+            ValueError: If the kind of job is unknown
+
+        Returns:
+            job, created: State of the queued job, or of the equivalent active one with created False
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status not in ACTIVE_STATUSES:
+                    continue
+                if (job.kind, job.params) == (kind, params) or (
+                    kind in TRAINING_KINDS and job.kind in TRAINING_KINDS
+                ):
+                    logger.info(f"Job {kind} not submitted, job {job.id} ({job.kind}) is already {job.status}")
+                    return job.to_dict(), False
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        self._executor.submit(self._run, job)
+        logger.info(f"Job {job.id} ({kind}) submitted")
+        return job.to_dict(), True
+
+    def get(self, job_id: str)-> dict:
+        """Returns the state of a job, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def list(self, status: str = None)-> list[dict]:
+        """Returns the state of the jobs, newest first, optionally only those with a status"""
+        with self._lock:
+            jobs = [job.to_dict() for job in self._jobs.values() if status is None or job.status == status]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def _forget_finished_jobs(self):
+        finished = [job for job in self._jobs.values() if job.status not in ACTIVE_STATUSES]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job.id]
+
+    def _run(self, job: Job):
+        context = dict(job.params)
+        with self._lock:
+            job.status = RUNNING
+            job.started_at = datetime.now()
+        logger.info(f"Job {job.id} ({job.kind}) started")
+        for stage, (name, function) in zip(job.stages, JOB_KINDS[job.kind]):
+            with self._lock:
+                stage["status"] = RUNNING
+            start = perf_counter()
+            try:
+                result = function(context)
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Job {job.id} ({job.kind}) failed at stage {name}, error: {detail}")
+                with self._lock:
+                    stage.update(status=FAILED, seconds=perf_counter() - start)
+                    job.status = FAILED
+                    job.error = f"{name}: {detail}"
+                    job.finished_at = datetime.now()
+                return
+            with self._lock:
+                stage.update(status=SUCCEEDED, seconds=perf_counter() - start)
+                job.result.update(result or {})
+        with self._lock:
+            job.status = SUCCEEDED
+            job.finished_at = datetime.now()
+        logger.info(f"Job {job.id} ({job.kind}) finished")
+
+
+job_runner = JobRunner()
@@ -1,9 +1,35 @@
 from fastapi import FastAPI
-from database.database import engine
+from fastapi.middleware.gzip import GZipMiddleware
+from database.database import engine, DB_ASYNC
 from crud import models
-from api.router import router
+from crud.partitions import BRONZE_PARTITIONED, create_partitioned_bronze_table
+from crud.changes import create_bronze_change_log
+from crud.stats import create_price_stats_view
+from crud.trigram import create_trigram_indexes
+from api.router import router, crud_router
 
+if BRONZE_PARTITIONED:
+    # created by hand before create_all, which cannot declare the monthly partitions
+    create_partitioned_bronze_table(engine)
 models.Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist, so indexes added later to the
+# models are created here for existing databases
+for index in models.VehicleModel.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+create_bronze_change_log(engine)
+create_price_stats_view(engine)
+create_trigram_indexes(engine)
 
 app = FastAPI()
+# compresses responses above 1 KB for clients sending Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+if DB_ASYNC:
+    from api.async_router import async_router
+
+    # the async CRUD endpoints take the place of their sync twins of crud_router,
+    # the remaining sync routes (bulk, export, ML) are served as before
+    app.include_router(async_router)
 app.include_router(router)
+if not DB_ASYNC:
+    # after the fixed /vehicles/ paths of router, which /vehicles/{vehicle_id} would match
+    app.include_router(crud_router)
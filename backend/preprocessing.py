@@ -3,6 +3,7 @@
 # The functions in this file are used to preprocess the data 
 # Data pipeline can be saved (currently inactivated)
 
+import os
 import pandas as pd
 import numpy as np
 import joblib
@@ -13,6 +14,21 @@ from sklearn.pipeline import Pipeline
 
 
 
+# Files keeping the state fitted on the full dataset, reused by the incremental pipeline
+OUTLIER_THRESHOLDS_FILE = 'outlier_thresholds.pkl'
+OHE_COLUMNS_FILE = 'ohe_columns.pkl'
+
+# Code given by the incremental pipeline to brands and models unseen by the label encoders
+UNKNOWN_LABEL = -1
+
+# Columns one-hot encoded, label encoded and scaled by the pipelines
+ONE_HOT_COLUMNS = ['gearbox', 'fueltype', 'notrepaired', 'vehicletype']
+LABEL_COLUMNS = ['brand', 'model']
+NUMERIC_COLUMNS = ['registrationyear', 'power', 'mileage_censored', 'registrationmonth',  'numberofpictures', 'postalcode']
+
+# Distinct mileage values kept exactly by the chunked fit before they are merged into bins
+QUANTILE_MAX_BINS = 10000
+
 # Pipeline functions
 def column_name_cleaning(df: pd.DataFrame):
     df.columns = df.columns.str.lower()
@@ -33,27 +49,56 @@ def handling_missing_values(df: pd.DataFrame):
     return df
 
     # handling outliers
-def handling_outliers_mileage(df: pd.DataFrame):
+def fit_outlier_thresholds(df: pd.DataFrame) -> dict:
+    """
+    Compute the outlier thresholds on the full dataset and save them,
+    so the incremental pipeline censors and drops rows the same way.
+
+    Parameters:
+    df (pd.DataFrame): The DataFrame with the mileage, power and registrationyear columns.
+
+    Returns:
+    dict: The mileage lower whisker and the power and registration year thresholds.
+    """
     mileage = df["mileage"].values
-    ## Calculate the quartiles
     mileageQ1 = np.percentile(mileage, 25)
     mileageQ3 = np.percentile(mileage, 75)
-    ## Calculate the IQR
-    mileageIQR = mileageQ3 - mileageQ1
-    ## Calculate the whisker values
-    lower_whisker = mileageQ1 - 1.5 * mileageIQR
+    thresholds = {
+        'mileage_lower_whisker': mileageQ1 - 1.5 * (mileageQ3 - mileageQ1),
+        'power': np.mean(df["power"].values) + 3 * np.std(df["power"].values),
+        'registrationyear': np.mean(df["registrationyear"].values) + 3 * np.std(df["registrationyear"].values),
+    }
+    joblib.dump(thresholds, OUTLIER_THRESHOLDS_FILE)
+    return thresholds
+
+def handling_outliers_mileage(df: pd.DataFrame, thresholds: dict = None):
+    mileage = df["mileage"].values
+    if thresholds is not None:
+        lower_whisker = thresholds['mileage_lower_whisker']
+    else:
+        ## Calculate the quartiles
+        mileageQ1 = np.percentile(mileage, 25)
+        mileageQ3 = np.percentile(mileage, 75)
+        ## Calculate the IQR
+        mileageIQR = mileageQ3 - mileageQ1
+        ## Calculate the whisker values
+        lower_whisker = mileageQ1 - 1.5 * mileageIQR
     mileage_censored = np.where(mileage < lower_whisker, lower_whisker, mileage)
     df["mileage_censored"] = mileage_censored
     return df
 
-def handling_outliers_power_registrationyear(df: pd.DataFrame):
+def handling_outliers_power_registrationyear(df: pd.DataFrame, thresholds: dict = None):
     # power and registration year
     power = df["power"].values
     regyear = df["registrationyear"].values
     
-    # calculating thresholds
-    threshold1 = np.mean(power) + 3 * np.std(power)
-    threshold2 = np.mean(regyear) + 3 * np.std(regyear)
+    # calculating thresholds, or reusing the ones fitted on the full dataset
+    if thresholds is not None:
+        threshold1 = thresholds['power']
+        threshold2 = thresholds['registrationyear']
+    else:
+        threshold1 = np.mean(power) + 3 * np.std(power)
+        threshold2 = np.mean(regyear) + 3 * np.std(regyear)
 
     # Getting indexes for outliers in each column
     outlier_indices1 = np.where(power > threshold1)[0]
@@ -65,11 +110,20 @@ def handling_outliers_power_registrationyear(df: pd.DataFrame):
     df = df.drop(df.index[outlier_indices])
     return df
 
-def handling_categoricals_ohe(df: pd.DataFrame):
-    df = pd.get_dummies(df, columns=['gearbox', 'fueltype', 'notrepaired', 'vehicletype'],dtype=int)
+def handling_categoricals_ohe(df: pd.DataFrame, dummy_columns: list = None):
+    """
+    One-hot encode the categorical columns. With dummy_columns the result has
+    exactly those dummy columns, missing ones filled with 0 and unseen ones dropped.
+    """
+    categorical_cols = ONE_HOT_COLUMNS
+    df = pd.get_dummies(df, columns=categorical_cols, dtype=int)
+    if dummy_columns is not None:
+        other_columns = [col for col in df.columns if not col.startswith(tuple(f"{c}_" for c in categorical_cols))]
+        df = df.reindex(columns=other_columns + list(dummy_columns), fill_value=0)
     return df
 
-def handling_categoricals_label(df: pd.DataFrame, fit: bool = False) -> pd.DataFrame:
+def handling_categoricals_label(df: pd.DataFrame, fit: bool = False, unknown_value: int = None,
+                                encoders: dict = None) -> pd.DataFrame:
     """
     Fit the label encoder on the categorical columns if fit is True,
     otherwise transform the DataFrame using the fitted label encoder.
@@ -77,11 +131,13 @@ def handling_categoricals_label(df: pd.DataFrame, fit: bool = False) -> pd.DataF
     Parameters:
     df (pd.DataFrame): The DataFrame containing the categorical columns to encode.
     fit (bool): If True, fit the label encoder; if False, transform the DataFrame.
+    unknown_value (int): Code for values unseen by the encoder. If None, unseen values raise an error.
+    encoders (dict): Fitted label encoder of each column, used instead of the saved files when fit is False.
     
     Returns:
     pd.DataFrame: The DataFrame with encoded columns and original columns dropped.
     """
-    categorical_cols = ['brand', 'model']
+    categorical_cols = LABEL_COLUMNS
     
     if fit:
         # Fit the label encoder and save it
@@ -93,24 +149,31 @@ def handling_categoricals_label(df: pd.DataFrame, fit: bool = False) -> pd.DataF
         # Apply label encoding to the categorical columns
         for col in categorical_cols:
             # Load the fitted label encoder
-            le = joblib.load(f'label_encoder_{col}.pkl')
+            le = encoders[col] if encoders is not None else joblib.load(f'label_encoder_{col}.pkl')
             if col in df.columns:
-                df[f"{col}_encoded"] = le.transform(df[col])
+                if unknown_value is None:
+                    df[f"{col}_encoded"] = le.transform(df[col])
+                else:
+                    known = df[col].isin(le.classes_)
+                    encoded = np.full(len(df), unknown_value)
+                    encoded[known.values] = le.transform(df.loc[known, col])
+                    df[f"{col}_encoded"] = encoded
     
     # Drop the original categorical columns
     df.drop(columns=categorical_cols, inplace=True, errors='ignore')
     
     return df  
 
-def scaling_numericals(df: pd.DataFrame, fit: bool = False):
-    numeric = ['registrationyear', 'power', 'mileage_censored', 'registrationmonth',  'numberofpictures', 'postalcode']
+def scaling_numericals(df: pd.DataFrame, fit: bool = False, scaler: MaxAbsScaler = None):
+    numeric = NUMERIC_COLUMNS
     if fit:
         scaler = MaxAbsScaler()
         scaler.fit(df[numeric])
         joblib.dump(scaler, 'scaler.pkl')
         df[numeric] = scaler.transform(df[numeric])
     else:
-        scaler = joblib.load('scaler.pkl')
+        if scaler is None:
+            scaler = joblib.load('scaler.pkl')
         df[numeric] = scaler.transform(df[numeric])
     return df
 
@@ -118,6 +181,87 @@ def dropping_unnecessary_columns(df: pd.DataFrame):
     df.drop(columns=['datecrawled', 'mileage', 'datecreated', 'lastseen'], inplace=True)
     return df
 
+# streaming statistics used by the chunked execution of the dataset pipeline
+class StreamingQuantiles:
+    """
+    Quantiles of a column read in chunks, matching np.percentile.
+
+    Values are kept as distinct values with their counts, which is exact for
+    discrete columns like mileage. Above max_bins distinct values, neighbouring
+    values are merged into weighted bins and the quantiles become approximate.
+    Like np.percentile, any missing value makes every quantile NaN.
+    """
+    def __init__(self, max_bins: int = QUANTILE_MAX_BINS):
+        self.max_bins = max_bins
+        self.values = np.array([], dtype=float)
+        self.counts = np.array([], dtype=np.int64)
+        self.has_nan = False
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        missing = np.isnan(values)
+        self.has_nan = self.has_nan or bool(missing.any())
+        values, counts = np.unique(values[~missing], return_counts=True)
+        merged = np.concatenate([self.values, values])
+        self.values, inverse = np.unique(merged, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts])).astype(np.int64)
+        while len(self.values) > self.max_bins:
+            self._merge_neighbours()
+
+    def _merge_neighbours(self):
+        # pairs of neighbouring values become one bin at their weighted mean
+        size = len(self.values) // 2 * 2
+        pair_counts = self.counts[:size:2] + self.counts[1:size:2]
+        pair_values = (self.values[:size:2] * self.counts[:size:2]
+                       + self.values[1:size:2] * self.counts[1:size:2]) / pair_counts
+        self.values = np.concatenate([pair_values, self.values[size:]])
+        self.counts = np.concatenate([pair_counts, self.counts[size:]])
+
+    def percentile(self, q: float) -> float:
+        if self.has_nan:
+            return np.nan
+        # same linear interpolation between closest ranks as np.percentile
+        position = (self.counts.sum() - 1) * q / 100
+        below = int(np.floor(position))
+        cumulative = np.cumsum(self.counts)
+        lower = self.values[np.searchsorted(cumulative, below, side='right')]
+        upper = self.values[min(np.searchsorted(cumulative, below + 1, side='right'), len(self.values) - 1)]
+        return lower + (position - below) * (upper - lower)
+
+class StreamingMoments:
+    """
+    Count, mean and population standard deviation of a column read in chunks,
+    merging the moments of each chunk (Chan et al.), like np.mean and np.std.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        count, mean = len(values), values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def std(self) -> float:
+        return np.sqrt(self.m2 / self.count)
+
+def prepare_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply the steps run before the outlier handling to one chunk.
+    """
+    df = column_name_cleaning(df)
+    df = handling_date_formats(df)
+    df = handling_missing_values(df)
+    return df
+
 # transformer class for the entire dataset
 class CustomTransformerDataset(BaseEstimator, TransformerMixin):
     def __init__(self):
@@ -126,13 +270,87 @@ class CustomTransformerDataset(BaseEstimator, TransformerMixin):
     def fit(self, X, y=None):
         return self
 
+    def fit_chunks(self, read_chunks):
+        """
+        Fit the dataset pipeline on data read in chunks, with memory bounded by the chunk size.
+
+        The first pass computes the outlier thresholds (mileage quartiles and the mean
+        and std of power and registration year). The second pass collects the one-hot
+        categories and label encoder classes and fits the scaler on the rows kept by
+        those thresholds. The fitted state is saved to the same files as transform().
+
+        Parameters:
+        read_chunks (callable): Returns a new iterator over the raw DataFrame chunks on each call.
+
+        Returns:
+        CustomTransformerDataset: self, transform_chunks can be called next.
+        """
+        mileage = StreamingQuantiles()
+        power = StreamingMoments()
+        regyear = StreamingMoments()
+        for chunk in read_chunks():
+            chunk = prepare_chunk(chunk)
+            mileage.update(chunk["mileage"].values)
+            power.update(chunk["power"].values)
+            regyear.update(chunk["registrationyear"].values)
+        if power.count == 0:
+            raise ValueError("No rows to fit the pipeline on")
+        mileageQ1 = mileage.percentile(25)
+        mileageQ3 = mileage.percentile(75)
+        thresholds = {
+            'mileage_lower_whisker': mileageQ1 - 1.5 * (mileageQ3 - mileageQ1),
+            'power': power.mean + 3 * power.std(),
+            'registrationyear': regyear.mean + 3 * regyear.std(),
+        }
+        joblib.dump(thresholds, OUTLIER_THRESHOLDS_FILE)
+
+        categories = {col: set() for col in ONE_HOT_COLUMNS + LABEL_COLUMNS}
+        scaler = MaxAbsScaler()
+        for chunk in read_chunks():
+            chunk = prepare_chunk(chunk)
+            chunk = handling_outliers_mileage(chunk, thresholds)
+            chunk = handling_outliers_power_registrationyear(chunk, thresholds)
+            if chunk.empty:
+                continue
+            for col, values in categories.items():
+                values.update(chunk[col].unique())
+            scaler.partial_fit(chunk[NUMERIC_COLUMNS])
+        # same column names and order as pd.get_dummies on the whole dataset
+        joblib.dump(
+            [f"{col}_{value}" for col in ONE_HOT_COLUMNS for value in sorted(categories[col])],
+            OHE_COLUMNS_FILE
+        )
+        for col in LABEL_COLUMNS:
+            joblib.dump(LabelEncoder().fit(sorted(categories[col])), f'label_encoder_{col}.pkl')
+        joblib.dump(scaler, 'scaler.pkl')
+        return self
+
+    def transform_chunks(self, read_chunks):
+        """
+        Transform data read in chunks with the state saved by fit_chunks.
+
+        Parameters:
+        read_chunks (callable): Returns a new iterator over the raw DataFrame chunks.
+
+        Yields:
+        pd.DataFrame: Each chunk transformed like transform() would have on the whole dataset.
+        """
+        transformer = CustomTransformerIncremental()
+        for chunk in read_chunks():
+            chunk = transformer.transform(chunk)
+            if not chunk.empty:
+                yield chunk
+
     def transform(self, X):
         X = column_name_cleaning(X)
         X = handling_date_formats(X)
         X = handling_missing_values(X)
-        X = handling_outliers_mileage(X)
-        X = handling_outliers_power_registrationyear(X)
+        thresholds = fit_outlier_thresholds(X)
+        X = handling_outliers_mileage(X, thresholds)
+        X = handling_outliers_power_registrationyear(X, thresholds)
+        columns = set(X.columns)
         X = handling_categoricals_ohe(X)
+        joblib.dump([col for col in X.columns if col not in columns], OHE_COLUMNS_FILE)
         X = handling_categoricals_label(X, True)
         X = scaling_numericals(X, True)
         X = dropping_unnecessary_columns(X)
@@ -160,10 +378,147 @@ class CustomTransformerSingle(BaseEstimator, TransformerMixin):
         X = dropping_unnecessary_columns(X)
         return X
 
+# transformer class for new or changed records, reusing the state fitted on the entire dataset
+class CustomTransformerIncremental(BaseEstimator, TransformerMixin):
+    def __init__(self):
+        pass
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        thresholds = joblib.load(OUTLIER_THRESHOLDS_FILE)
+        X = column_name_cleaning(X)
+        X = handling_date_formats(X)
+        X = handling_missing_values(X)
+        X = handling_outliers_mileage(X, thresholds)
+        X = handling_outliers_power_registrationyear(X, thresholds)
+        X = handling_categoricals_ohe(X, joblib.load(OHE_COLUMNS_FILE))
+        X = handling_categoricals_label(X, False, UNKNOWN_LABEL)
+        X = scaling_numericals(X, False)
+        X = dropping_unnecessary_columns(X)
+        return X
+
+# preprocessing state of the prediction path, loaded once with the model
+class FittedPreprocessor:
+    """
+    Label encoders, scaler, outlier thresholds and one-hot columns saved by the
+    dataset pipeline, held in memory so a prediction does no disk reads.
+
+    Unlike the dataset pipeline, rows are never dropped as outliers: every
+    submitted vehicle gets a prediction. Mileage is censored with the fitted whisker.
+    """
+    def __init__(self, encoders: dict, scaler: MaxAbsScaler, thresholds: dict = None, dummy_columns: list = None):
+        self.encoders = encoders
+        self.scaler = scaler
+        self.thresholds = thresholds
+        self.dummy_columns = dummy_columns
+
+    @classmethod
+    def load(cls) -> "FittedPreprocessor":
+        """
+        Load the state saved by the last fit of the dataset pipeline.
+
+        Thresholds and one-hot columns saved before they were introduced may be missing:
+        the mileage whisker is then computed on the submitted rows like before, and the
+        one-hot columns are aligned to the model features by the caller.
+        """
+        encoders = {col: joblib.load(f'label_encoder_{col}.pkl') for col in LABEL_COLUMNS}
+        scaler = joblib.load('scaler.pkl')
+        thresholds = joblib.load(OUTLIER_THRESHOLDS_FILE) if os.path.exists(OUTLIER_THRESHOLDS_FILE) else None
+        dummy_columns = joblib.load(OHE_COLUMNS_FILE) if os.path.exists(OHE_COLUMNS_FILE) else None
+        return cls(encoders, scaler, thresholds, dummy_columns)
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        X = column_name_cleaning(X)
+        X = handling_date_formats(X)
+        X = handling_missing_values(X)
+        X = handling_outliers_mileage(X, self.thresholds)
+        X = handling_categoricals_ohe(X, self.dummy_columns)
+        X = handling_categoricals_label(X, False, encoders=self.encoders)
+        X = scaling_numericals(X, False, self.scaler)
+        X = dropping_unnecessary_columns(X)
+        return X
+
+# feature rows of the prediction path, built without pandas
+class FeatureVectorBuilder:
+    """
+    Maps prediction records straight into a NumPy matrix in the order of the model
+    features, with the values FittedPreprocessor.transform followed by a reindex on
+    the model features would give.
+
+    The position of every one-hot column, label code and scaled numeric column is
+    computed once, so a record costs a few dict lookups and one division per numeric column.
+    """
+    def __init__(self, preprocessor: FittedPreprocessor, feature_names: list):
+        position = {name: i for i, name in enumerate(feature_names)}
+        self.n_features = len(feature_names)
+        self.thresholds = preprocessor.thresholds
+        # (column, value) -> position of its dummy, dummies outside the fitted vocabulary are dropped
+        self.one_hot = {}
+        for col in ONE_HOT_COLUMNS:
+            for name, i in position.items():
+                if name.startswith(f"{col}_") and (preprocessor.dummy_columns is None
+                                                   or name in preprocessor.dummy_columns):
+                    self.one_hot[(col, name[len(col) + 1:])] = i
+        # column -> (position of the code, code of each class)
+        self.labels = {
+            col: (position[f"{col}_encoded"], {label: code for code, label in enumerate(preprocessor.encoders[col].classes_)})
+            for col in LABEL_COLUMNS if f"{col}_encoded" in position
+        }
+        # (column, position, scale) of the numeric features used by the model
+        scale = dict(zip(NUMERIC_COLUMNS, preprocessor.scaler.scale_))
+        self.numeric = [(col, position[col], scale[col]) for col in NUMERIC_COLUMNS if col in position]
+
+    def transform(self, records: list) -> np.ndarray:
+        """
+        Build the feature matrix of the records.
+
+        Parameters:
+        records (list): Objects with the raw columns as attributes, like InputData.
+
+        Returns:
+        np.ndarray: One float64 row per record, in the order of the model features.
+        """
+        X = np.zeros((len(records), self.n_features))
+        for row, record in enumerate(records):
+            for col in ONE_HOT_COLUMNS:
+                value = getattr(record, col)
+                i = self.one_hot.get((col, 'unknown' if value is None else str(value)))
+                if i is not None:
+                    X[row, i] = 1
+            for col, (i, codes) in self.labels.items():
+                value = getattr(record, col)
+                if value is None and col == 'model':
+                    value = 'unknown'
+                if value not in codes:
+                    raise ValueError(f"y contains previously unseen labels: {value!r}")
+                X[row, i] = codes[value]
+        for col, i, scale in self.numeric:
+            if col == 'mileage_censored':
+                values = self._censor_mileage(np.array([record.mileage for record in records], dtype=float))
+            else:
+                # missing values become NaN, like in the scaler
+                values = np.array([getattr(record, col) for record in records], dtype=float)
+            X[:, i] = values / scale
+        return X
+
+    def _censor_mileage(self, mileage: np.ndarray) -> np.ndarray:
+        # same whisker as handling_outliers_mileage
+        if self.thresholds is not None:
+            lower_whisker = self.thresholds['mileage_lower_whisker']
+        else:
+            mileageQ1 = np.percentile(mileage, 25)
+            mileageQ3 = np.percentile(mileage, 75)
+            lower_whisker = mileageQ1 - 1.5 * (mileageQ3 - mileageQ1)
+        return np.where(mileage < lower_whisker, lower_whisker, mileage)
+
 pipeline_dataset = Pipeline(steps=[('custom_transformer', CustomTransformerDataset())])
 
 pipeline_single = Pipeline(steps=[('custom_transformer', CustomTransformerSingle())])
 
+pipeline_incremental = Pipeline(steps=[('custom_transformer', CustomTransformerIncremental())])
+
 
 
 # Save the pipeline
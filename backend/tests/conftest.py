@@ -0,0 +1,12 @@
+# This file contains the fixtures shared by the tests
+# The pipelines save their fitted state (label encoders, scaler, thresholds...) in the
+# working directory, so every test runs in its own temporary directory.
+
+import pytest
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in a temporary directory receiving the fitted pipeline files"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,85 @@
+# This file contains the tests of the vehicle read-through cache
+# A backend raising on every call stands in for a redis server that is down, the
+# lookups and invalidations must then behave as if there were no cache.
+
+import threading
+import pytest
+from crud.cache import InMemoryCacheBackend, ReadThroughCache
+
+
+class FailingBackend:
+    """Backend whose every call fails like a redis server that cannot be reached"""
+    blocking = True
+
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+
+    def _fail(self, operation: str):
+        self.calls.append(operation)
+        self.threads.add(threading.current_thread())
+        raise ConnectionError("Error 111 connecting to redis:6379. Connection refused.")
+
+    def get(self, key):
+        self._fail("get")
+
+    def set(self, key, value):
+        self._fail("set")
+
+    def delete(self, key):
+        self._fail("delete")
+
+    def stats(self):
+        self._fail("stats")
+
+
+def test_cache_hits_after_a_miss():
+    cache = ReadThroughCache(InMemoryCacheBackend(maxsize=10, ttl=60))
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"id": 1}
+
+    assert cache.get_or_load(1, loader) == {"id": 1}
+    assert cache.get_or_load(1, loader) == {"id": 1}
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_failing_backend_falls_back_to_the_loader():
+    backend = FailingBackend()
+    cache = ReadThroughCache(backend)
+
+    assert cache.get_or_load(1, lambda: {"id": 1}) == {"id": 1}
+    cache.invalidate(1, 2)
+    stats = cache.stats()
+
+    # the failing backend is not written to after the failed read
+    assert backend.calls == ["get", "delete", "delete", "stats"]
+    assert stats["errors"] == 4
+    assert stats["hits"] == 0 and stats["misses"] == 0
+    assert stats["evictions"] is None
+
+
+@pytest.fixture
+def anyio_backend():
+    """Runs the async tests on asyncio, the event loop of uvicorn"""
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_failing_backend_falls_back_to_the_async_loader():
+    backend = FailingBackend()
+    cache = ReadThroughCache(backend)
+
+    async def loader():
+        return {"id": 1}
+
+    assert await cache.get_or_load_async(1, loader) == {"id": 1}
+    await cache.invalidate_async(1)
+
+    # the blocking calls ran in the thread pool, not on the event loop
+    assert backend.calls == ["get", "delete"]
+    assert threading.current_thread() not in backend.threads
+    assert cache.stats()["errors"] == 3
@@ -0,0 +1,155 @@
+# This file contains the tests of the preprocessing pipelines
+# The dataset pipeline is fitted on a small synthetic bronze table in a temporary directory,
+# then the chunked execution and the feature rows of the predictions are compared with
+# the in-memory pandas path they replace.
+
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostRegressor
+from crud.schemas import InputData
+from preprocessing import FittedPreprocessor, FeatureVectorBuilder, ONE_HOT_COLUMNS, pipeline_dataset
+
+BRAND_MODELS = {
+    "volkswagen": ["golf", "passat", "polo"],
+    "bmw": ["3er", "5er", "x_reihe"],
+    "audi": ["a4", "a3", None],
+    "opel": ["corsa", "astra"],
+}
+
+
+def raw_vehicles(count: int, seed: int = 0)-> pd.DataFrame:
+    """Builds random rows shaped like the bronze table, with missing values and outliers
+
+    Args:
+        count (int): Number of rows
+        seed (int, optional): Seed of the random values. Defaults to 0.
+
+    Returns:
+        vehicles: Raw vehicles like pd.read_sql returns them from bronze_car_data
+    """
+    rng = np.random.default_rng(seed)
+    brands = rng.choice(list(BRAND_MODELS), count)
+    crawled = [datetime(2016, 3, 1) + timedelta(minutes=int(minutes)) for minutes in rng.integers(0, 60 * 24 * 60, count)]
+    power = rng.integers(0, 300, count)
+    power[rng.random(count) < 0.01] = 20000
+    registrationyear = rng.integers(1980, 2018, count)
+    registrationyear[rng.random(count) < 0.01] = 9999
+    return pd.DataFrame({
+        "id": np.arange(1, count + 1),
+        "datecrawled": crawled,
+        "price": rng.integers(0, 20000, count),
+        "vehicletype": rng.choice(["sedan", "small", "wagon", "suv", "bus", None], count),
+        "registrationyear": registrationyear,
+        "gearbox": rng.choice(["manual", "auto", None], count),
+        "power": power,
+        "model": [BRAND_MODELS[brand][rng.integers(len(BRAND_MODELS[brand]))] for brand in brands],
+        # mostly high mileages like the real data, the low ones are censored by the whisker
+        "mileage": rng.choice([5000, 20000, 90000, 125000, 150000], count, p=[0.05, 0.05, 0.1, 0.3, 0.5]),
+        "registrationmonth": rng.integers(0, 13, count),
+        "fueltype": rng.choice(["petrol", "gasoline", "diesel", "lpg", None], count),
+        "brand": brands,
+        "notrepaired": rng.choice(["yes", "no", None], count),
+        "datecreated": [date - timedelta(days=1) for date in crawled],
+        "numberofpictures": np.zeros(count, dtype=int),
+        "postalcode": rng.integers(10000, 99999, count),
+        "lastseen": [date + timedelta(days=3) for date in crawled],
+    })
+
+
+# values never seen by the pipeline, their dummies must be dropped
+UNSEEN_CATEGORY = "unseen"
+
+
+def random_records(preprocessor: FittedPreprocessor, count: int, seed: int = 42)-> list:
+    """Builds random prediction records with known brands and models
+
+    One-hot columns get fitted values, missing values and unseen values; numeric
+    columns get values around the real ones, missing values included except for
+    mileage, which the pandas path cannot censor when missing.
+    """
+    rng = np.random.default_rng(seed)
+    categories = {col: [None, UNSEEN_CATEGORY] for col in ONE_HOT_COLUMNS}
+    for name in preprocessor.dummy_columns:
+        col, value = name.split("_", 1)
+        categories[col].append(value)
+    brands = list(preprocessor.encoders["brand"].classes_)
+    models = list(preprocessor.encoders["model"].classes_) + [None]
+
+    def number(low, high, missing=0.02):
+        return None if rng.random() < missing else int(rng.integers(low, high))
+
+    date = datetime(2016, 3, 24, 11, 52)
+    return [
+        InputData(
+            datecrawled=date, datecreated=date, lastseen=date,
+            vehicletype=rng.choice(categories["vehicletype"]),
+            gearbox=rng.choice(categories["gearbox"]),
+            fueltype=rng.choice(categories["fueltype"]),
+            notrepaired=rng.choice(categories["notrepaired"]),
+            brand=rng.choice(brands),
+            model=rng.choice(models),
+            power=number(0, 400),
+            mileage=number(5000, 150001, missing=0),
+            registrationmonth=number(0, 13),
+            registrationyear=number(1950, 2020),
+            numberofpictures=number(0, 2),
+            postalcode=number(1000, 99999),
+        )
+        for _ in range(count)
+    ]
+
+
+def pandas_features(preprocessor: FittedPreprocessor, feature_names: list, records: list)-> np.ndarray:
+    """Returns the feature matrix of the records given by the pandas path"""
+    df = pd.DataFrame([record.model_dump() for record in records])
+    df = preprocessor.transform(df).reindex(columns=feature_names, fill_value=0)
+    return df.to_numpy(dtype=float)
+
+
+@pytest.fixture
+def fitted_model(workdir):
+    """Fits the dataset pipeline and a small CatBoost model on it, like a training run"""
+    gold = pipeline_dataset.fit_transform(raw_vehicles(2000))
+    model = CatBoostRegressor(iterations=20, depth=4, random_seed=0, verbose=False, allow_writing_files=False)
+    model.fit(gold.drop(columns=["price"]), gold["price"])
+    return model, FittedPreprocessor.load()
+
+
+@pytest.mark.parametrize("batch_size", [1, 500])
+def test_feature_vector_builder_matches_pandas_path(fitted_model, batch_size):
+    model, preprocessor = fitted_model
+    builder = FeatureVectorBuilder(preprocessor, model.feature_names_)
+    records = random_records(preprocessor, 500)
+
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        expected = pandas_features(preprocessor, model.feature_names_, batch)
+        features = builder.transform(batch)
+        assert np.array_equal(features, expected, equal_nan=True), batch[0]
+        assert np.array_equal(model.predict(features), model.predict(expected)), batch[0]
+
+
+def test_feature_vector_builder_rejects_unseen_brand(fitted_model):
+    model, preprocessor = fitted_model
+    builder = FeatureVectorBuilder(preprocessor, model.feature_names_)
+    record = random_records(preprocessor, 1)[0].model_copy(update={"brand": UNSEEN_CATEGORY})
+
+    with pytest.raises(ValueError, match="unseen labels"):
+        builder.transform([record])
+
+
+@pytest.mark.parametrize("chunksize", [1000, 333, 50])
+def test_chunked_pipeline_matches_in_memory(workdir, chunksize):
+    raw = raw_vehicles(3000, seed=1)
+    expected = pipeline_dataset.fit_transform(raw.copy()).reset_index(drop=True)
+
+    def read_chunks():
+        for start in range(0, len(raw), chunksize):
+            yield raw.iloc[start:start + chunksize].copy()
+
+    transformer = pipeline_dataset.named_steps['custom_transformer'].fit_chunks(read_chunks)
+    chunked = pd.concat(transformer.transform_chunks(read_chunks), ignore_index=True)
+
+    pd.testing.assert_frame_equal(chunked, expected, check_exact=True)
@@ -0,0 +1,93 @@
+# This file contains the tests of the vehicle search queries
+# The typical searches of data/benchmark_search.py are compiled and their filters and sort
+# columns compared with the composite indexes of the bronze table. With a reachable postgres
+# database, the benchmark table is also filled and every search must use an index and run
+# within the budget; without one, those tests are skipped.
+
+import os
+import re
+import pytest
+from sqlalchemy import MetaData, Table, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+from crud.controller import vehicle_search_query
+from crud.models import VehicleModel
+from data.benchmark_search import BENCHMARK_TABLE, SEARCHES, create_benchmark_table, explain_search
+from database.database import engine
+
+BRONZE_TABLE = VehicleModel.__tablename__
+# smaller than the benchmark default, enough for the planner to prefer the indexes
+SEARCH_TEST_ROWS = int(os.getenv("SEARCH_TEST_ROWS", "200000"))
+SEARCH_TEST_MAX_MS = float(os.getenv("SEARCH_TEST_MAX_MS", "10"))
+
+
+def compiled_search(search: dict)-> tuple[list[str], list[str], list[str]]:
+    """Compiles a search for postgres and reads the columns of its clauses
+
+    Args:
+        search (dict): Arguments of vehicle_search_query
+
+    Returns:
+        equality_columns: Columns filtered by an exact match
+        range_columns: Columns filtered by a range
+        sort_columns: Columns of the ORDER BY clause, in order
+    """
+    sql = str(vehicle_search_query(**search).compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    ))
+    where = re.search(r"WHERE (.*?) ORDER BY", sql, re.S).group(1)
+    order_by = re.search(r"ORDER BY (.*?) LIMIT", sql, re.S).group(1)
+    filters = re.findall(rf"{BRONZE_TABLE}\.(\w+) (=|>=|<=) ", where)
+    equality_columns = [column for column, operator in filters if operator == "="]
+    range_columns = list(dict.fromkeys(column for column, operator in filters if operator != "="))
+    sort_columns = re.findall(rf"{BRONZE_TABLE}\.(\w+)", order_by)
+    return equality_columns, range_columns, sort_columns
+
+
+@pytest.mark.parametrize("name", SEARCHES)
+def test_search_matches_a_composite_index(name):
+    equality_columns, range_columns, sort_columns = compiled_search(SEARCHES[name])
+    # ties are broken by id, the other sort column is the one requested
+    assert sort_columns[-1] == "id"
+    sort_column = [column for column in sort_columns if column != "id"]
+    assert sort_column == ([SEARCHES[name]["sort_by"]] if SEARCHES[name].get("sort_by", "id") != "id" else [])
+
+    # an index leads with the exact matches and covers the ranges and the sort column
+    searched = set(equality_columns) | set(range_columns) | set(sort_column)
+    matching = [
+        index.name for index in VehicleModel.__table__.indexes
+        if set(index.columns.keys()[:len(equality_columns)]) == set(equality_columns)
+        and searched <= set(index.columns.keys())
+    ]
+    assert matching, f"no index of {BRONZE_TABLE} serves {name}: filters {searched}"
+
+
+def test_search_rejects_unknown_sort_column():
+    with pytest.raises(ValueError):
+        vehicle_search_query(sort_by="price; DROP TABLE bronze_car_data")
+
+
+@pytest.fixture(scope="module")
+def benchmark_table():
+    """Fills the benchmark table, skipping the test when no database is available"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except OperationalError:
+        pytest.skip("no postgres database available")
+    if not inspect(engine).has_table(BRONZE_TABLE):
+        pytest.skip(f"{BRONZE_TABLE} does not exist in the database")
+    create_benchmark_table(SEARCH_TEST_ROWS)
+    try:
+        yield Table(BENCHMARK_TABLE, MetaData(), autoload_with=engine)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE}"))
+
+
+@pytest.mark.parametrize("name", SEARCHES)
+def test_search_uses_an_index_within_budget(benchmark_table, name):
+    with engine.connect() as conn:
+        execution_ms, nodes = explain_search(conn, benchmark_table, SEARCHES[name])
+    assert not any(node.startswith("Seq Scan") for node in nodes), " > ".join(nodes)
+    assert execution_ms <= SEARCH_TEST_MAX_MS, f"{name} took {execution_ms:.2f} ms: {' > '.join(nodes)}"
@@ -0,0 +1,282 @@
+# This file contains the hyperparameter search of the CatBoost price model
+# Candidate configurations (a grid or a random sample of SEARCH_SPACE) are scored
+# with k-fold cross validation on the gold table. Trials run in a process pool, each
+# one with a capped number of CatBoost threads, and every fit stops early on a
+# validation split. No new trial starts after the time budget and running trials stop
+# between folds. The best configuration, with the number of iterations found by early
+# stopping, is saved to BEST_PARAMS_FILE and used by the next training.
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor
+from dotenv import load_dotenv
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import KFold, train_test_split
+from database.database import engine
+from database.locks import training_lock
+from data.pool_cache import gold_pool, load_pool, pool_labels
+from logging_config import setup_logging
+
+load_dotenv()
+
+logger = setup_logging()
+
+# configuration found by the last search, read by the training, and its trial table
+BEST_PARAMS_FILE = 'best_params.json'
+TRIALS_FILE = 'tuning_trials.csv'
+
+# parameters of the model when no search has been run
+DEFAULT_PARAMS = {"depth": 7, "iterations": 50, "l2_leaf_reg": 0.1, "learning_rate": 0.5}
+
+SEARCH_SPACE = {
+    "depth": [4, 6, 7, 8, 10],
+    "learning_rate": [0.03, 0.1, 0.3, 0.5],
+    "l2_leaf_reg": [0.1, 1, 3, 10],
+}
+
+TUNING_TRIALS = int(os.getenv("TUNING_TRIALS", "20"))
+TUNING_FOLDS = int(os.getenv("TUNING_FOLDS", "3"))
+# seconds after which no trial or fold is started
+TUNING_TIME_BUDGET = float(os.getenv("TUNING_TIME_BUDGET", "600"))
+# CatBoost threads of each trial, the pool runs cpu_count // threads trials at a time
+TUNING_THREADS = int(os.getenv("TUNING_THREADS", "2"))
+# iterations cap of a fit, early stopping usually ends it before
+TUNING_MAX_ITERATIONS = int(os.getenv("TUNING_MAX_ITERATIONS", "1000"))
+EARLY_STOPPING_ROUNDS = 30
+# share of the training folds held out for early stopping
+VALIDATION_SIZE = 0.1
+
+# training pool of the worker process, loaded once by init_worker instead of sent with every trial
+worker_data = {}
+
+# columns of the trial table
+TRIAL_COLUMNS = ["rmse", "rmse_std", "iterations", "folds_done", "seconds", "status", "error"]
+
+
+class DeadlineCallback:
+    """CatBoost callback stopping a fit once the deadline of the search is passed
+
+    Args:
+        deadline (float): time.time() after which no more trees are built
+    """
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.stopped = False
+
+    def after_iteration(self, info)-> bool:
+        self.stopped = time.time() > self.deadline
+        return not self.stopped
+
+
+def training_params()-> dict:
+    """Returns the parameters of the model, those of the last search if any
+
+    Returns:
+        params: CatBoostRegressor depth, iterations, l2_leaf_reg and learning_rate
+    """
+    params = dict(DEFAULT_PARAMS)
+    if os.path.exists(BEST_PARAMS_FILE):
+        with open(BEST_PARAMS_FILE) as file:
+            params.update(json.load(file)["params"])
+    return params
+
+
+def candidate_params(space: dict, mode: str = "random", trials: int = TUNING_TRIALS, seed: int = 42)-> list[dict]:
+    """Lists the configurations to be tried
+
+    Args:
+        space (dict): Values of each parameter
+        mode (str, optional): "grid" for every combination, "random" for a sample of them. Defaults to "random".
+        trials (int, optional): Number of configurations of the random sample. Defaults to TUNING_TRIALS.
+        seed (int, optional): Seed of the random sample. Defaults to 42.
+
+    Raises:
+        ValueError: If the mode is unknown
+
+    Returns:
+        candidates: Parameters of each trial
+    """
+    names = list(space)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if mode == "random":
+        return random.Random(seed).sample(combinations, min(trials, len(combinations)))
+    if mode == "grid":
+        # the whole grid, the time budget of the search limits it instead
+        return combinations
+    raise ValueError(f"Unknown search mode: {mode}")
+
+
+def init_worker(path: str):
+    """Loads the quantized training pool saved by the pool cache in the worker process"""
+    worker_data["pool"] = load_pool(path)
+    worker_data["labels"] = pool_labels(worker_data["pool"])
+
+
+def run_trial(params: dict, folds: int, threads: int, deadline: float, seed: int = 42)-> dict:
+    """Scores a configuration with k-fold cross validation, in a worker process
+
+    In each fold the model is fitted with early stopping on a validation split of the
+    training folds and scored on the held out fold. Folds are not started after the deadline,
+    and a fit still running at the deadline is stopped and its fold left unscored.
+
+    Args:
+        params (dict): depth, learning_rate and l2_leaf_reg of the model
+        folds (int): Number of folds
+        threads (int): CatBoost thread count
+        deadline (float): time.time() after which the trial stops
+        seed (int, optional): Seed of the splits and of the model. Defaults to 42.
+
+    Returns:
+        trial: Parameters, mean and std of the RMSE, iterations kept, folds done, duration and status
+    """
+    pool, labels = worker_data["pool"], worker_data["labels"]
+    started = time.time()
+    scores, iterations = [], []
+    for train_index, test_index in KFold(n_splits=folds, shuffle=True, random_state=seed).split(labels):
+        if time.time() > deadline:
+            break
+        fit_index, validation_index = train_test_split(train_index, test_size=VALIDATION_SIZE, random_state=seed)
+        model = CatBoostRegressor(
+            **params, iterations=TUNING_MAX_ITERATIONS, thread_count=threads,
+            random_seed=seed, verbose=False, allow_writing_files=False
+        )
+        deadline_callback = DeadlineCallback(deadline)
+        model.fit(pool.slice(fit_index), eval_set=pool.slice(validation_index),
+                  early_stopping_rounds=EARLY_STOPPING_ROUNDS, callbacks=[deadline_callback])
+        if deadline_callback.stopped:
+            break
+        prediction = model.predict(pool.slice(test_index))
+        scores.append(np.sqrt(mean_squared_error(labels[test_index], prediction)))
+        iterations.append(model.get_best_iteration() + 1)
+    return {
+        **params,
+        "rmse": float(np.mean(scores)) if scores else None,
+        "rmse_std": float(np.std(scores)) if scores else None,
+        "iterations": int(np.mean(iterations)) if iterations else None,
+        "folds_done": len(scores),
+        "seconds": time.time() - started,
+        "status": "completed" if len(scores) == folds else "timeout",
+        "error": None,
+    }
+
+
+def tune_hyperparameters(mode: str = "random", trials: int = TUNING_TRIALS, folds: int = TUNING_FOLDS,
+                         time_budget: float = TUNING_TIME_BUDGET, threads: int = TUNING_THREADS,
+                         workers: int = None, space: dict = SEARCH_SPACE)-> dict:
+    """Searches the parameters of the model on the gold table and saves the best ones
+
+    A trial raising an error is recorded as failed and the search goes on with the others.
+
+    Args:
+        mode (str, optional): "grid" or "random". Defaults to "random".
+        trials (int, optional): Configurations of the random search, the grid search tries them all. Defaults to TUNING_TRIALS.
+        folds (int, optional): Number of cross validation folds. Defaults to TUNING_FOLDS.
+        time_budget (float, optional): Seconds after which no trial or fold starts. Defaults to TUNING_TIME_BUDGET.
+        threads (int, optional): CatBoost threads per trial. Defaults to TUNING_THREADS.
+        workers (int, optional): Trials run at the same time. Defaults to None (cpu count // threads).
+        space (dict, optional): Values of each parameter. Defaults to SEARCH_SPACE.
+
+    Raises:
+        ValueError: If the gold table is empty or no trial completed within the budget
+
+    Returns:
+        summary: Best parameters and RMSE, trials completed and duration
+    """
+    started = time.time()
+    deadline = started + time_budget
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    # same quantized features as train_model_and_create_file, saved once and loaded by each worker
+    pool, path, _ = gold_pool(engine)
+    candidates = candidate_params(space, mode, trials)
+    logger.info(f"Tuning {len(candidates)} configurations with {folds} folds on {pool.num_row()} rows, "
+                f"{workers} trials at a time of {threads} threads, budget {time_budget:.0f} s")
+
+    results = []
+    # spawned workers, forking the threads of a running API process is unsafe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(path,)) as executor:
+        # parameters of each running trial
+        pending = {}
+        queue = iter(candidates)
+        broken = False
+        while True:
+            # keep every worker busy until the budget is spent
+            while not broken and len(pending) < workers and time.time() < deadline:
+                params = next(queue, None)
+                if params is None:
+                    break
+                try:
+                    pending[executor.submit(run_trial, params, folds, threads, deadline)] = params
+                except BrokenProcessPool as e:
+                    logger.error(f"Tuning workers stopped, no more trials are started, error: {e}")
+                    broken = True
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                params = pending.pop(future)
+                try:
+                    trial = future.result()
+                except Exception as e:
+                    # a worker dying breaks the pool, its other trials fail with it
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    trial = {**params, "folds_done": 0, "status": "failed", "error": repr(e)}
+                    logger.error(f"Trial {len(results) + 1} failed with {params}, error: {e}")
+                results.append(trial)
+                logger.info(f"Trial {len(results)}: {trial}")
+    if len(results) < len(candidates):
+        logger.warning(f"Time budget of {time_budget:.0f} s spent, {len(candidates) - len(results)} of the "
+                       f"{len(candidates)} {mode} configurations were not tried")
+
+    trials_df = pd.DataFrame(results, columns=list(space) + TRIAL_COLUMNS)
+    trials_df = trials_df.sort_values("rmse", na_position="last")
+    trials_df.to_csv(TRIALS_FILE, index=False)
+    completed = trials_df[trials_df["status"] == "completed"]
+    failed = int((trials_df["status"] == "failed").sum())
+    if completed.empty:
+        raise ValueError(f"No trial completed within the time budget of {time_budget:.0f} s, {failed} failed")
+    best = completed.iloc[0]
+    params = {name: best[name].item() for name in space}
+    params["iterations"] = int(best["iterations"])
+    summary = {
+        "params": params,
+        "rmse": float(best["rmse"]),
+        "rmse_std": float(best["rmse_std"]),
+        "folds": folds,
+        "trials_completed": len(completed),
+        "trials_run": len(trials_df),
+        "trials_failed": failed,
+        "seconds": time.time() - started,
+        "tuned_at": datetime.now().isoformat(),
+    }
+    with open(BEST_PARAMS_FILE, "w") as file:
+        json.dump(summary, file, indent=2)
+    logger.info(f"Best configuration {params} with RMSE {summary['rmse']:.2f} saved to {BEST_PARAMS_FILE}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the hyperparameters of the price model")
+    parser.add_argument("--mode", choices=["random", "grid"], default="random", help="search mode")
+    parser.add_argument("--trials", type=int, default=TUNING_TRIALS, help="configurations of the random search")
+    parser.add_argument("--folds", type=int, default=TUNING_FOLDS, help="cross validation folds")
+    parser.add_argument("--time-budget", type=float, default=TUNING_TIME_BUDGET, help="seconds")
+    parser.add_argument("--threads", type=int, default=TUNING_THREADS, help="CatBoost threads per trial")
+    parser.add_argument("--workers", type=int, default=None, help="trials at a time, cpu count // threads by default")
+    args = parser.parse_args()
+
+    # waits for the trainings of the API workers and jobs, best_params.json is read by them
+    with training_lock():
+        summary = tune_hyperparameters(args.mode, args.trials, args.folds, args.time_budget, args.threads, args.workers)
+    print(f"best {summary['params']} RMSE {summary['rmse']:.2f} +- {summary['rmse_std']:.2f}, "
+          f"{summary['trials_completed']}/{summary['trials_run']} trials in {summary['seconds']:.0f} s")
@@ -5,6 +5,7 @@ import pandas as pd
 from crud.schemas import FueltypeBase, VehicleTypeBase, GearboxBase
 from st_aggrid import AgGrid, GridOptionsBuilder
 from datetime import datetime
+import time
 
 
 # variables to access Enum values from schemas
@@ -12,6 +13,9 @@ vehicle_types = [vehicle.value for vehicle in VehicleTypeBase]
 fuel_types = [fuel.value for fuel in FueltypeBase]
 gearbox_types = [gearbox.value for gearbox in GearboxBase]
 
+# seconds between two polls of a background job
+JOB_POLL_INTERVAL = 2
+
 st.set_page_config(layout="wide")
 
 st.image("frontend/logo2.jpg", width=600)
@@ -46,6 +50,19 @@ def parse_date(date_str):
     except ValueError:
         return None
 
+# Auxiliary function to fetch a page of vehicles, run by the paging buttons before the rerun
+# so that the "Next page" button is drawn with the cursor of the page just fetched
+def load_vehicles_page(next_page=False):
+    after_id = st.session_state.vehicles_next_after_id if next_page else 0
+    response = requests.get(
+        "http://backend:8000/vehicles/",
+        params={"after_id": after_id, "limit": st.session_state.vehicles_page_size},
+    )
+    st.session_state.vehicles_after_id = after_id
+    st.session_state.vehicles_response = response
+    if response.status_code == 200:
+        st.session_state.vehicles_next_after_id = response.json()["next_after_id"]
+
 # Tab 1 - Vehicle database
 with tabs[0]:
     # Add vehicle
@@ -97,12 +114,26 @@ with tabs[0]:
 
     # View vehicles
     with st.expander("View Vehicles"):
-
-        if st.button("Show all Vehicles"):
-            response = requests.get("http://backend:8000/vehicles/")
-            if response.status_code == 200:
-                vehicle = response.json()
-                df = pd.DataFrame(vehicle)
+        st.number_input("Vehicles per page", min_value=1, max_value=1000, value=100, key="vehicles_page_size")
+
+        # cursor of the current page, of the next one and the last response, kept between reruns
+        if "vehicles_after_id" not in st.session_state:
+            st.session_state.vehicles_after_id = 0
+            st.session_state.vehicles_next_after_id = None
+            st.session_state.vehicles_response = None
+
+        st.button("Show Vehicles", on_click=load_vehicles_page)
+        st.button("Next page", on_click=load_vehicles_page, kwargs={"next_page": True},
+                  disabled=st.session_state.vehicles_next_after_id is None)
+
+        response = st.session_state.vehicles_response
+        if response is not None:
+            page = response.json() if response.status_code == 200 else None
+            if page is not None and not page["items"]:
+                # only this view is skipped, the expanders and tabs below are still drawn
+                st.info("No more vehicles to show.")
+            elif page is not None:
+                df = pd.DataFrame(page["items"])
 
                 df = df[
                     [
@@ -125,24 +156,24 @@ with tabs[0]:
                     ]
                 ]
 
-            else:
-                show_response_message(response)
+                # Configure the AgGrid table
+                gb = GridOptionsBuilder.from_dataframe(df)
+                gb.configure_default_column(editable=True, filter=True, sortable=True, resizable=True)
+                gb.configure_pagination(enabled=True, paginationAutoPageSize=False, paginationPageSize=20)
+                gb.configure_side_bar()  # Enable a sidebar for filtering
+                grid_options = gb.build()
 
-            # Configure the AgGrid table
-            gb = GridOptionsBuilder.from_dataframe(df)
-            gb.configure_default_column(editable=True, filter=True, sortable=True, resizable=True)
-            gb.configure_pagination(enabled=True, paginationAutoPageSize=False, paginationPageSize=20)
-            gb.configure_side_bar()  # Enable a sidebar for filtering
-            grid_options = gb.build()
+                # Display the AgGrid table
+                response = AgGrid(
+                    df,
+                    gridOptions=grid_options,
+                    height=600,
+                    fit_columns_on_grid_load=True,
+                    enable_enterprise_modules=False
+                )
 
-            # Display the AgGrid table
-            response = AgGrid(
-                df,
-                gridOptions=grid_options,
-                height=600,
-                fit_columns_on_grid_load=True,
-                enable_enterprise_modules=False
-            )
+            else:
+                show_response_message(response)
 
 
     # Get details from one vehicle
@@ -346,53 +377,60 @@ with tabs[1]:
    # Add model training / retraining functionality
     with st.expander("Train/Re-train Model"):
         if st.button("Start (re)training model"):
-            with st.spinner("Processing Data and Training the model..."):
-                try:
-
-                    # request 1 - preprocess raw data
-                    response = requests.get("http://backend:8000/preprocessdata")
+            try:
+                # the whole retraining runs as one background job, polled until it finishes
+                response = requests.post("http://backend:8000/jobs", json={"kind": "retrain"})
+                if response.status_code in (200, 202):
+                    job = response.json()
                     if response.status_code == 200:
-                        data = response.json()
-                        st.success(f"Status: {data['Message']}")
-                        
-                        # request 2 - load preprocessed data into gold table
-                        response = requests.get("http://backend:8000/load_preprocessed_dataset")
-                        if response.status_code == 200:
-                            data = response.json()
-                            st.success(f"Status: {data['Message']}")
-
-                            # request 3 - train the model
-                            response = requests.get("http://backend:8000/train_model")
-                            if response.status_code == 200:
-                                # model performance stuff
-                                data = response.json()
-                                #display MSE
-                                st.subheader("Model Performance")
-                                st.write(f"Mean Squared Error (MSE): {data['mse']:.2f}")
-
-                                #display feature importance
-                                st.subheader("Feature Importance")
-                                importance_df = pd.DataFrame(data['feature_importance'])
-                                st.write(importance_df)
-                                st.bar_chart(importance_df.set_index('feature').sort_values(by='importance', ascending=False))
-                                st.success(data['message'])
-
-                                # request 4 - load the model
-                                response = requests.get("http://backend:8000/load_model")
-                                if response.status_code == 200:
-                                    data = response.json()
-                                    st.success(f"Status: {data['Message']}")
-                                else:
-                                    st.error(f"Failed to load the model. Error: {response.text}")        
-                            else:
-                                st.error(f"Failed to train the model. Error: {response.text}")        
+                        st.info(f"A {job['kind']} job is already running, following it instead.")
+                    progress = st.progress(0.0, text="Processing Data and Training the model...")
+                    while job["status"] in ("queued", "running"):
+                        time.sleep(JOB_POLL_INTERVAL)
+                        response = requests.get(f"http://backend:8000/jobs/{job['id']}")
+                        response.raise_for_status()
+                        job = response.json()
+                        running = [stage["name"] for stage in job["stages"] if stage["status"] == "running"]
+                        progress.progress(job["progress"], text=f"Stage: {running[0] if running else job['status']}")
+
+                    # stage timings
+                    for stage in job["stages"]:
+                        if stage["seconds"] is not None:
+                            st.write(f"{stage['name']}: {stage['status']} in {stage['seconds']:.1f} s")
+
+                    if job["status"] == "succeeded" and job["kind"] == "retrain_incremental":
+                        # a followed warm start job has scores but no feature importance
+                        data = job["result"]
+                        st.subheader("Model Performance")
+                        if data["mode"] == "unchanged":
+                            st.info(f"Only {data['rows_new']} new rows, the model was left unchanged")
                         else:
-                            st.error(f"Failed to load model data. Error: {response.text}")        
+                            if data["mode"] == "full":
+                                st.write(f"Fully retrained: {data['reason']}")
+                            st.write(f"Root Mean Squared Error (RMSE): {data['rmse']:.2f}")
+                            st.success("Model retrained successfully and loaded")
+                    elif job["status"] == "succeeded":
+                        data = job["result"]
+                        if job["kind"] == "tune":
+                            st.subheader("Best Parameters")
+                            st.write(data['best_params'])
+                        # model performance stuff
+                        #display MSE
+                        st.subheader("Model Performance")
+                        st.write(f"Mean Squared Error (MSE): {data['mse']:.2f}")
+
+                        #display feature importance
+                        st.subheader("Feature Importance")
+                        importance_df = pd.DataFrame(data['feature_importance'])
+                        st.write(importance_df)
+                        st.bar_chart(importance_df.set_index('feature').sort_values(by='importance', ascending=False))
+                        st.success("Model trained successfully and loaded")
                     else:
-                            st.error(f"Failed to preprocess model data. Error: {response.text}")    
-                except requests.exceptions.RequestException as e:
+                        st.error(f"Failed to train the model. Error: {job['error']}")
+                else:
                     show_response_message(response)
-                    st.error(f"Error training the model: {e}")
+            except requests.exceptions.RequestException as e:
+                st.error(f"Error training the model: {e}")
 
     # Add inputs for vehicle price prediction
     with st.expander("Predict Vehicle Price"):